@@ -27,20 +27,33 @@ class AuthService:
         user.save()
 
     @staticmethod
-    def get_user_token(user_id: int, ttl: int) -> str:
+    def get_user_token(user_id: int, ttl: int, role: str | None = None) -> str:
         """
         Take user id as a component of payload and time-to-live component to specify created token
         :param user_id: integer value, represents id of user
         :param ttl: time-to-live integer value, represents token that will be created (access or refresh)
+        :param role: user's role, lets the microservice authorize the user without asking innotter
         :return: valid token.
         """
         payload = {"user_id": user_id,
                    "iss": "innotter",
                    "exp": datetime.now(tz=timezone.utc) + timedelta(seconds=ttl)}
+        if role:
+            payload["role"] = role
         token = jwt.encode(payload, JWT_SECRET_KEY, algorithm=JWT_SIGNING_METHOD)
 
         return token
 
+    @staticmethod
+    def get_token_expiration(token: str) -> float:
+        """
+        Take expiration time from the token which has been already verified
+        :param token: verified token
+        :return: expiration time as a timestamp.
+        """
+        payload = jwt.decode(token, options={'verify_signature': False})
+        return payload['exp']
+
     @staticmethod
     def verify_user_token(token: str) -> tuple[dict[str], int, User | None]:
         """
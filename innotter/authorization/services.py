@@ -13,14 +13,15 @@ routing_key_pages = settings.RABBITMQ_STATS_ROUTING_KEY
 
 def refresh_user_token(refresh_token: str, user_id: int) -> tuple[dict[str, str], int]:
     """
-    Take refresh token from serialized data, verify it and return access token
+    Take refresh token from serialized data, verify it and return access token.
+    The role is read from the user, so a changed role gets into the new access token
     :param refresh_token: refresh token sent from client
     :param user_id: id of user, which make request
     :return: generated valid access token.
     """
-    _, status_code, _ = AuthService.verify_user_token(refresh_token)
+    _, status_code, user = AuthService.verify_user_token(refresh_token)
     if status_code == status.HTTP_200_OK:
-        access_token = AuthService.get_user_token(user_id, ACCESS_TOKEN_LIFE_TIME)
+        access_token = AuthService.get_user_token(user_id, ACCESS_TOKEN_LIFE_TIME, user.role)
         data = {'msg': '', 'access_token': access_token, 'refresh_token': refresh_token}
         status_code = status.HTTP_200_OK
     else:
@@ -30,14 +31,15 @@ def refresh_user_token(refresh_token: str, user_id: int) -> tuple[dict[str, str]
     return data, status_code
 
 
-def obtain_tokens(user_id: int) -> dict[str, str]:
+def obtain_tokens(user_id: int, role: str | None = None) -> dict[str, str]:
     """
     Validate serialized data.
     If successfully generate both access and refresh tokens and update user's 'refresh_token' field as well
     :param user_id: id of user that sent request
+    :param role: user's role, it's put into the short-lived access token only
     :return: dictionary with both access and refresh tokens.
     """
-    access_token = AuthService.get_user_token(user_id, ACCESS_TOKEN_LIFE_TIME)
+    access_token = AuthService.get_user_token(user_id, ACCESS_TOKEN_LIFE_TIME, role)
     refresh_token = AuthService.get_user_token(user_id, REFRESH_TOKEN_LIFE_TIME)
 
     User.objects.filter(pk=user_id).update(refresh_token=refresh_token)
@@ -0,0 +1,14 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from authorization.token_cache import token_cache
+from user.models import User
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_tokens(sender, instance: User, **kwargs) -> None:
+    """
+    Drop cached tokens of the user once the user is updated (e.g. blocked) or deleted.
+    """
+    token_cache.invalidate_user(instance.pk)
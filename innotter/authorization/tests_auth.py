@@ -1,6 +1,13 @@
+from time import time
+
+from django.test import RequestFactory
+import jwt
 from rest_framework import status
 
-from authorization.services import refresh_user_token
+from authorization.auth_service import AuthService
+from authorization.services import obtain_tokens, refresh_user_token
+from authorization.token_cache import TokenCache, token_cache
+from innotter.middleware import CustomJWTAuthenticationMiddleware
 from user.models import User
 
 
@@ -20,3 +27,44 @@ class TestAuthentication:
         refresh_token = tokens_factory(user.id)['refresh_token']
         result, status_code = refresh_user_token(refresh_token, user.id)
         assert result['access_token'] and result['refresh_token'] and status_code == status.HTTP_200_OK
+        assert jwt.decode(result['access_token'], options={'verify_signature': False})['role'] == user.role
+
+    def test_role_only_in_access_token(self, signup_user):
+        user = User.objects.all()[0]
+        tokens = obtain_tokens(user.id, user.role)
+        claims = {kind: jwt.decode(token, options={'verify_signature': False}) for kind, token in tokens.items()}
+        assert claims['access_token']['role'] == user.role and 'role' not in claims['refresh_token']
+
+
+class TestTokenCache:
+    def test_cached_authentication(self, tokens_factory, signup_user, mocker, django_assert_num_queries):
+        mocker.patch('innotter.middleware.skip_session_auth', True)
+        token_cache.clear()
+        user = User.objects.all()[0]
+        access_token = tokens_factory(user.id)['access_token']
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=access_token)
+
+        assert CustomJWTAuthenticationMiddleware.get_user_jwt(request) == user
+        with django_assert_num_queries(0):
+            assert CustomJWTAuthenticationMiddleware.get_user_jwt(request) == user
+
+    def test_blocking_invalidates_cache(self, tokens_factory, signup_user):
+        token_cache.clear()
+        user = User.objects.all()[0]
+        access_token = tokens_factory(user.id)['access_token']
+        token_cache.set(access_token, user, AuthService.get_token_expiration(access_token))
+        assert token_cache.get(access_token) == user
+
+        user.is_blocked = True
+        user.save()
+        assert token_cache.get(access_token) is None
+
+    def test_expired_entries(self, tokens_factory, signup_user):
+        cache = TokenCache(maxsize=1, ttl=60)
+        user = User.objects.all()[0]
+        cache.set('expired', user, time() - 1)
+        assert cache.get('expired') is None
+
+        cache.set('first', user, time() + 60)
+        cache.set('second', user, time() + 60)
+        assert cache.get('first') is None and cache.get('second') == user
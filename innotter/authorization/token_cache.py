@@ -0,0 +1,97 @@
+from collections import OrderedDict
+from copy import copy
+from hashlib import sha256
+from threading import Lock
+from time import time
+
+from django.conf import settings
+
+from user.models import User
+
+
+class TokenCache:
+    """
+    Bounded in-process LRU cache of users authenticated by verified JWTs.
+    Entries are keyed by the token's hash and expire at the token's 'exp' or after the TTL, whichever comes first.
+    """
+    def __init__(self, maxsize: int, ttl: int):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, User]] = OrderedDict()
+        self._users_keys: dict[int, set[str]] = {}
+        self._lock = Lock()
+
+    def get(self, token: str) -> User | None:
+        """
+        Return the user the token was issued for if the token is cached and hasn't expired yet
+        :param token: token sent from client
+        :return: either copy of the cached user or None.
+        """
+        key = self.get_key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expires_at, user = entry
+            if expires_at <= time():
+                self._pop(key)
+                return None
+
+            self._entries.move_to_end(key)
+        # Every request gets its own copy, so changes made while handling the request don't leak into the cache.
+        return copy(user)
+
+    def set(self, token: str, user: User, exp: float) -> None:
+        """
+        Cache the user the verified token was issued for
+        :param token: verified token
+        :param user: user the token was issued for
+        :param exp: token's expiration time as a timestamp.
+        :return: None.
+        """
+        if not self.maxsize:
+            return
+
+        key = self.get_key(token)
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = (min(exp, time() + self.ttl), copy(user))
+            self._users_keys.setdefault(user.pk, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._pop(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id: int) -> None:
+        """
+        Drop all the cached tokens of the user, e.g. after the user was blocked or updated
+        :param user_id: id of the user
+        :return: None.
+        """
+        with self._lock:
+            for key in self._users_keys.pop(user_id, set()):
+                self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._users_keys.clear()
+
+    def _pop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+
+        _, user = entry
+        keys = self._users_keys.get(user.pk)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._users_keys[user.pk]
+
+    @staticmethod
+    def get_key(token: str) -> str:
+        return sha256(token.encode()).hexdigest()
+
+
+token_cache = TokenCache(maxsize=getattr(settings, 'JWT_CACHE_SIZE', 4096),
+                         ttl=getattr(settings, 'JWT_CACHE_TTL', 60))
@@ -36,7 +36,7 @@ class ObtainTokensView(APIView):
         serializer.is_valid(raise_exception=True)
         user = serializer.validated_data['user']
 
-        data = obtain_tokens(user.id)
+        data = obtain_tokens(user.id, user.role)
         return Response(data, status=status.HTTP_202_ACCEPTED)
 
 
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.contrib.auth.middleware import get_user
 from django.contrib.auth.models import AnonymousUser
 from django.core.handlers.wsgi import WSGIRequest
@@ -5,9 +6,13 @@ from django.utils.deprecation import MiddlewareMixin
 from django.utils.functional import SimpleLazyObject
 
 from authorization.auth_service import AuthService
+from authorization.token_cache import token_cache
 from user.models import User
 
 
+skip_session_auth = getattr(settings, 'JWT_SKIP_SESSION_AUTH', False)
+
+
 class CustomJWTAuthenticationMiddleware(MiddlewareMixin):
     def process_request(self, request: WSGIRequest) -> None:
         """
@@ -21,16 +26,24 @@ class CustomJWTAuthenticationMiddleware(MiddlewareMixin):
     def get_user_jwt(request: WSGIRequest) -> AnonymousUser | User:
         """
         Try to get user from request, if succeeded process further to the server.
-        Otherwise, get jwt and process further to the server as well
+        Otherwise, get jwt and process further to the server as well.
+        Requests carrying jwt skip the session lookup if 'JWT_SKIP_SESSION_AUTH' is set
         :param request: sent request from client.
         :return: either authenticated or anonymous user.
         """
-        user_jwt = get_user(request)
-        if user_jwt.is_authenticated:
-            return user_jwt
-
         token = request.META.get('HTTP_AUTHORIZATION', None)
+        if token and skip_session_auth:
+            user_jwt = AnonymousUser()
+        else:
+            user_jwt = get_user(request)
+            if user_jwt.is_authenticated:
+                return user_jwt
+
         if token:
-            _, _, user_jwt = AuthService.verify_user_token(token)
+            user_jwt = token_cache.get(token)
+            if user_jwt is None:
+                _, _, user_jwt = AuthService.verify_user_token(token)
+                if user_jwt:
+                    token_cache.set(token, user_jwt, AuthService.get_token_expiration(token))
 
         return user_jwt
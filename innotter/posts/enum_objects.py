@@ -11,6 +11,14 @@ class Mode(Enum):
     ACCEPT = 1
 
 
+class FeedStrategy(Enum):
+    """
+    Represent the enumerated ways of querying the feed.
+    """
+    JOIN = 'join'
+    UNION = 'union'
+
+
 class Directory(Enum):
     """
     Represent the enumerated directories at AWS S3 to save in.
@@ -44,3 +52,4 @@ class UserMethods(Enum):
     """
     CREATE = 'create_users'
     UPDATE = 'update_users'
+    DELETE = 'delete_users'
@@ -0,0 +1,130 @@
+import random
+from datetime import date, timedelta
+from statistics import mean, quantiles
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from posts.models import Page, Post
+from user.models import User
+
+
+class Command(BaseCommand):
+    """
+    Can be called from console through 'manage.py'. Generate a dataset in a separate test database,
+    measure the feed query latency for both 'join' and 'union' strategies and check that they return the same posts.
+    """
+    help = "Compare latency and results of the 'join' and 'union' feed queries on a generated dataset"
+
+    batch_size = 10000
+    strategies = {
+        'join': Post.posts_objects.get_join_feed_posts,
+        'union': Post.posts_objects.get_union_feed_posts,
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100000, help='Number of users to generate')
+        parser.add_argument('--pages', type=int, default=100000, help='Number of pages to generate')
+        parser.add_argument('--posts', type=int, default=1000000, help='Number of posts to generate')
+        parser.add_argument('--follows', type=int, default=10000000, help='Number of follow edges to generate')
+        parser.add_argument('--samples', type=int, default=200, help='Number of users whose feed is measured')
+        parser.add_argument('--page-size', type=int, default=20, help='Number of posts fetched per feed request')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the random generator')
+        parser.add_argument('--keepdb', action='store_true', help='Keep the test database after the benchmark')
+
+    def handle(self, *args, **options):
+        if options['samples'] < 2:
+            raise CommandError('At least two samples are needed to compute percentiles')
+        if options['follows'] > options['users'] * options['pages']:
+            raise CommandError('There are more follow edges than pairs of users and pages')
+
+        random.seed(options['seed'])
+        test_database = connection.creation.create_test_db(verbosity=0, keepdb=options['keepdb'])
+        self.stdout.write(f'Using test database {test_database}')
+        try:
+            if not User.objects.exists():
+                self.generate_dataset(options['users'], options['pages'], options['posts'], options['follows'])
+            self.run_benchmark(options['samples'], options['page_size'])
+        finally:
+            if not options['keepdb']:
+                connection.creation.destroy_test_db(test_database, verbosity=0)
+
+    def generate_dataset(self, users: int, pages: int, posts: int, follows: int) -> None:
+        """
+        Fill the test database with users, pages, posts and follow edges. One percent of pages is blocked
+        :param users: number of users
+        :param pages: number of pages
+        :param posts: number of posts
+        :param follows: number of follow edges.
+        :return: None.
+        """
+        self.stdout.write(f'Generating {users} users, {pages} pages, {posts} posts and {follows} follow edges...')
+        self.bulk_create(User, (User(username=f'bench_{i}', email=f'bench_{i}@innotter.com', password='!')
+                                for i in range(users)), users)
+        users_id = list(User.objects.values_list('id', flat=True))
+
+        unblock_date = date.today() + timedelta(days=30)
+        self.bulk_create(Page, (Page(name=f'Page {i}', uuid=f'bench_{i}', description='Benchmark page',
+                                     owner_id=random.choice(users_id),
+                                     unblock_date=unblock_date if random.random() < 0.01 else None)
+                                for i in range(pages)), pages)
+        pages_id = list(Page.objects.values_list('id', flat=True))
+
+        self.bulk_create(Post, (Post(page_id=random.choice(pages_id), title=f'Post {i}')
+                                for i in range(posts)), posts)
+
+        follows_per_user, remainder = divmod(follows, len(users_id))
+        followers_model = Page.followers.through
+        self.bulk_create(followers_model, (followers_model(user_id=user_id, page_id=page_id)
+                                           for i, user_id in enumerate(users_id)
+                                           for page_id in random.sample(pages_id, follows_per_user + (i < remainder))),
+                         follows)
+
+    def bulk_create(self, model, objects, total: int) -> None:
+        """
+        Insert generated objects in batches
+        :param model: model of the objects
+        :param objects: iterable of unsaved objects
+        :param total: number of the objects, used to report the progress.
+        :return: None.
+        """
+        batch, created = [], 0
+        for obj in objects:
+            batch.append(obj)
+            if len(batch) == self.batch_size:
+                model.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+                self.stdout.write(f'{model._meta.model_name}: {created}/{total}', ending='\r')
+        model.objects.bulk_create(batch)
+        self.stdout.write(f'{model._meta.model_name}: {total}/{total}')
+
+    def run_benchmark(self, samples: int, page_size: int) -> None:
+        """
+        Measure the first page of the feed of randomly chosen users with every strategy
+        and compare the complete feeds returned by them
+        :param samples: number of users to measure
+        :param page_size: number of posts at the first page of the feed.
+        :return: None.
+        """
+        users = list(User.objects.order_by('?')[:samples])
+        latencies = {strategy: [] for strategy in self.strategies}
+
+        for user in users:
+            feeds = []
+            for strategy, get_feed_posts in self.strategies.items():
+                start = perf_counter()
+                list(get_feed_posts(user)[:page_size])
+                latencies[strategy].append((perf_counter() - start) * 1000)
+
+                feeds.append(list(get_feed_posts(user).values_list('id', flat=True)))
+
+            if any(feed != feeds[0] for feed in feeds):
+                raise CommandError(f'The strategies returned different feeds for user {user.id}')
+
+        self.stdout.write(f'Feeds of {len(users)} users are identical for all the strategies')
+        self.stdout.write(f'{"strategy":<10}{"mean, ms":>12}{"p50, ms":>12}{"p99, ms":>12}')
+        for strategy, values in latencies.items():
+            percentiles = quantiles(values, n=100, method='inclusive')
+            self.stdout.write(f'{strategy:<10}{mean(values):>12.2f}{percentiles[49]:>12.2f}{percentiles[98]:>12.2f}')
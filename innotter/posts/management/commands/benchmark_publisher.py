@@ -0,0 +1,68 @@
+import shlex
+import subprocess
+from collections import Counter
+from threading import Event, Lock, Thread
+from time import monotonic
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from pika.exceptions import AMQPError
+
+from posts.pika.base_client import Message, Publisher
+
+
+class Command(BaseCommand):
+    """
+    Can be called from console through 'manage.py'. Load the RabbitMQ exchange with messages from several threads
+    sharing one publisher and report the throughput of every second. The broker may be restarted meanwhile
+    by '--restart-command' (e.g. 'docker compose restart rabbitmq') to check that throughput recovers.
+    """
+    help = 'Measure publishing throughput of the shared publisher, optionally across broker restarts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Number of publishing threads')
+        parser.add_argument('--duration', type=int, default=60, help='Seconds to publish for')
+        parser.add_argument('--batch-size', type=int, default=100, help='Messages confirmed at once')
+        parser.add_argument('--routing-key', default='benchmark', help='Routing key of the published messages')
+        parser.add_argument('--restart-command', help='Shell command restarting the broker')
+        parser.add_argument('--restart-every', type=int, default=20, help='Seconds between broker restarts')
+
+    def handle(self, *args, **options):
+        publisher = Publisher(settings.RABBITMQ_EXCHANGE_NAME)
+        batch = [Message(options['routing_key'], b'{"id": 0}')] * options['batch_size']
+        published, failures = Counter(), Counter()
+        lock, stop = Lock(), Event()
+        start = monotonic()
+
+        def publish() -> None:
+            while not stop.is_set():
+                try:
+                    publisher.publish_batch(batch)
+                    counter = published
+                except AMQPError:
+                    counter = failures
+                with lock:
+                    counter[int(monotonic() - start)] += len(batch)
+
+        threads = [Thread(target=publish, daemon=True) for _ in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+
+        restarts = 0
+        while (elapsed := monotonic() - start) < options['duration']:
+            stop.wait(min(options['restart_every'], options['duration'] - elapsed))
+            if options['restart_command'] and monotonic() - start < options['duration']:
+                subprocess.run(shlex.split(options['restart_command']), check=False)
+                restarts += 1
+        stop.set()
+        for thread in threads:
+            thread.join()
+        publisher.close()
+
+        self.stdout.write(f'{"second":<8}{"published":>12}{"failed":>12}')
+        for second in range(options['duration']):
+            self.stdout.write(f'{second:<8}{published[second]:>12}{failures[second]:>12}')
+        total = sum(published.values())
+        self.stdout.write(f'{total} message(s) published in {options["duration"]}s '
+                          f'({total / options["duration"]:.0f} msg/s) with {restarts} broker restart(s), '
+                          f'{sum(failures.values())} message(s) failed')
@@ -0,0 +1,62 @@
+import json
+from statistics import mean
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+
+from posts.enum_objects import PageMethods, PostMethods
+from posts.pika import codec
+
+
+class Command(BaseCommand):
+    """
+    Can be called from console through 'manage.py'. Compare size of the stats messages and
+    encoding/decoding throughput of JSON and the compact binary format.
+    """
+    help = 'Compare size and encoding/decoding throughput of JSON and binary stats messages'
+
+    events = (
+        (PageMethods.UPDATE.value, {'id': 1520, 'owner_id': 873, 'owner_username': 'innotter_user',
+                                    'owner_is_blocked': False, 'name': 'Daily news', 'uuid': 'daily_news',
+                                    'followers': 15873, 'posts': 412, 'unblock_date': None}),
+        (PostMethods.CREATE.value, {'id': 98241, 'page': 1520, 'title': 'Breaking news',
+                                    'content': 'Something has happened today, have a look!',
+                                    'reply_to': None, 'liked_by': 0, 'owner_id': 873}),
+        (PostMethods.LIKE.value, {'id': 98241, 'liked_by': 327, 'owner_id': 873}),
+        (PostMethods.DELETE.value, {'id': 98241, 'owner_id': 873}),
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=100000, help='Number of times every event is coded')
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        self.stdout.write(f'{"event":<14}{"format":<8}{"bytes":>8}{"encode, msg/s":>16}{"decode, msg/s":>16}')
+
+        sizes = {codec.JSON_FORMAT: [], codec.BINARY_FORMAT: []}
+        for method, data in self.events:
+            formats = {
+                codec.JSON_FORMAT: (lambda: json.dumps(data, cls=DjangoJSONEncoder).encode(), json.loads),
+                codec.BINARY_FORMAT: (lambda: codec.encode(method, data), lambda body: codec.decode(method, body)),
+            }
+            for body_format, (encode, decode) in formats.items():
+                body = encode()
+                assert decode(body) == data, f'{body_format} changes the payload of {method}'
+
+                start = perf_counter()
+                for _ in range(iterations):
+                    encode()
+                encoding = iterations / (perf_counter() - start)
+
+                start = perf_counter()
+                for _ in range(iterations):
+                    decode(body)
+                decoding = iterations / (perf_counter() - start)
+
+                sizes[body_format].append(len(body))
+                self.stdout.write(f'{method:<14}{body_format:<8}{len(body):>8}{encoding:>16.0f}{decoding:>16.0f}')
+
+        json_size, binary_size = mean(sizes[codec.JSON_FORMAT]), mean(sizes[codec.BINARY_FORMAT])
+        self.stdout.write(f'Mean message size: {json_size:.1f} bytes in JSON, {binary_size:.1f} bytes in binary '
+                          f'({binary_size / json_size:.0%})')
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Page
+from posts.services import get_fan_out_users, push_to_timelines, timeline_backfill_size
+
+
+class Command(BaseCommand):
+    """
+    Can be called from console through 'manage.py'. Fill the users' timelines with the latest posts of
+    their own and followed pages. Should be run once before enabling 'FEED_TIMELINES_ENABLED'.
+    """
+    help = "Fill the users' timelines with the latest posts of their own and followed pages"
+
+    def handle(self, *args, **options):
+        pages = Page.objects.only('id', 'owner_id').iterator()
+        for page in pages:
+            posts_id = list(page.posts.order_by('-id').values_list('id', flat=True)[:timeline_backfill_size])
+            if not posts_id:
+                continue
+
+            users_id = get_fan_out_users(page)
+            push_to_timelines(users_id, posts_id)
+            self.stdout.write(f'Page {page.id}: {len(posts_id)} post(s) pushed to {len(users_id)} timeline(s)')
+
+        self.stdout.write('Timelines were successfully built')
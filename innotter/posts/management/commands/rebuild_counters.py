@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.queries import rebuild_counters
+
+
+class Command(BaseCommand):
+    """
+    Can be called from console through 'manage.py'. Recount followers and posts of pages and likes of posts,
+    so the denormalized counters match the relations again.
+    """
+    help = 'Recount followers and posts of pages and likes of posts'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            pages, posts = rebuild_counters()
+        self.stdout.write(f'Counters of {pages} page(s) and {posts} post(s) were successfully rebuilt')
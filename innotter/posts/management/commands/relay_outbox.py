@@ -0,0 +1,39 @@
+from time import sleep
+
+from django.core.management.base import BaseCommand
+from pika.exceptions import AMQPError
+
+from posts.services import coalesce_window, outbox_batch_size, relay_outbox_events
+
+
+class Command(BaseCommand):
+    """
+    Can be called from console through 'manage.py'. Drain the outbox to the RabbitMQ exchange in batches
+    using publisher confirms. Should be running as long as 'RABBITMQ_OUTBOX_ENABLED' is on.
+    """
+    help = 'Publish the events of the outbox to the RabbitMQ exchange'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=outbox_batch_size,
+                            help='Max number of events published per transaction')
+        parser.add_argument('--interval', type=float, default=coalesce_window.total_seconds(),
+                            help='Seconds to wait when the outbox is empty or the broker is unavailable')
+        parser.add_argument('--once', action='store_true', help='Drain the outbox and exit')
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                taken, published = relay_outbox_events(options['batch_size'])
+            except AMQPError:
+                # The publisher has run out of reconnection attempts, the batch stays in the outbox.
+                self.stderr.write('The message broker is unavailable, retrying...')
+                if options['once']:
+                    raise
+                taken = 0
+
+            if taken:
+                self.stdout.write(f'{published} of {taken} event(s) were published after coalescing')
+            elif options['once']:
+                break
+            else:
+                sleep(options['interval'])
@@ -1,10 +1,19 @@
 from datetime import date
 
+from django.apps import apps
+from django.conf import settings
 from django.db import models
+from django.db.models import Q
 
+from posts.enum_objects import FeedStrategy
 from user.models import User
 
 
+feed_strategy = FeedStrategy(getattr(settings, 'FEED_QUERY_STRATEGY', FeedStrategy.JOIN.value))
+timelines_enabled = getattr(settings, 'FEED_TIMELINES_ENABLED', False)
+fanout_followers_limit = getattr(settings, 'FEED_FANOUT_FOLLOWERS_LIMIT', 10000)
+
+
 class PageManager(models.Manager):
     """
     Custom Page model Manager.
@@ -58,6 +67,17 @@ class PostManager(models.Manager):
         """
         Filter posts based on both user's posts and followed pages.
         Each post belongs to a certain page. Following page means following post as well.
+        The query is chosen by 'FEED_TIMELINES_ENABLED' and 'FEED_QUERY_STRATEGY' settings.
+        """
+        if timelines_enabled:
+            return self.get_timeline_posts(user)
+        if feed_strategy == FeedStrategy.UNION:
+            return self.get_union_feed_posts(user)
+        return self.get_join_feed_posts(user)
+
+    def get_join_feed_posts(self, user: User):
+        """
+        Build the feed as an OR of two joins.
 
         'user': user who made a request.
         'my_posts': Queryset object which is made of user's posts.
@@ -71,3 +91,44 @@ class PostManager(models.Manager):
 
         queryset = (my_posts | followed_posts).distinct().order_by('-created_at', '-id')
         return queryset
+
+    def get_union_feed_posts(self, user: User):
+        """
+        Build the feed from the UNION of the user's and followed pages, so the posts are looked up by page
+        without joining the followers and without deduplicating the posts afterwards.
+
+        'my_pages': ids of the user's pages.
+        'followed_pages': ids of the followed pages that aren't blocked.
+        'queryset': Queryset object which is made of posts of both 'my_pages' & 'followed_pages'
+                    firstly ordered by created date and secondly by id (both descending).
+        """
+        page_model = apps.get_model('posts', 'Page')
+
+        my_pages = page_model.objects.filter(owner=user).values('id')
+        followed_pages = page_model.followers.through.objects.filter(user=user)\
+                                                             .exclude(page__unblock_date__gt=date.today())\
+                                                             .values('page')
+
+        queryset = super().get_queryset().filter(page__in=my_pages.union(followed_pages))\
+                                         .order_by('-created_at', '-id')
+        return queryset
+
+    def get_timeline_posts(self, user: User):
+        """
+        Read the feed from the user's materialized timeline.
+        Posts of the followed pages which are too popular to be fanned out on write are merged in at read time.
+
+        'timeline': ids of posts that were pushed into the user's timeline.
+        'skipped_pages': followed pages with more followers than 'FEED_FANOUT_FOLLOWERS_LIMIT'.
+        """
+        timeline_entry_model = apps.get_model('posts', 'TimelineEntry')
+        page_model = apps.get_model('posts', 'Page')
+
+        timeline = timeline_entry_model.objects.filter(user=user).values('post')
+        skipped_pages = page_model.objects.filter(followers=user, followers_count__gt=fanout_followers_limit)\
+                                          .values('id')
+
+        queryset = super().get_queryset().filter(Q(id__in=timeline) | Q(page__in=skipped_pages))\
+                                         .exclude(~Q(page__owner=user), page__unblock_date__gt=date.today())\
+                                         .order_by('-created_at', '-id')
+        return queryset
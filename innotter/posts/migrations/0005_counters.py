@@ -0,0 +1,47 @@
+# Generated by Django 4.1.13 on 2026-10-17 22:13
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_related(through, field):
+    rows = through.objects.filter(**{field: OuterRef('pk')}).order_by().values(field)
+    return Coalesce(Subquery(rows.annotate(count=Count('*')).values('count'), output_field=IntegerField()), Value(0))
+
+
+def fill_counters(apps, schema_editor):
+    page_model = apps.get_model('posts', 'Page')
+    post_model = apps.get_model('posts', 'Post')
+    user_model = apps.get_model('user', 'User')
+
+    page_model.objects.update(followers_count=count_related(page_model.followers.through, 'page'),
+                              posts_count=count_related(post_model, 'page'))
+    post_model.objects.update(likes_count=count_related(user_model.liked.through, 'post'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0004_timelineentry'),
+        ('user', '0002_alter_user_image_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='page',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='page',
+            name='posts_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+from functools import cache
+
+from django.db.models import QuerySet
+from rest_framework.relations import ManyRelatedField
+from rest_framework.serializers import Serializer
+
+
+class PrefetchRelatedMixin:
+    """
+    Prefetch every many-to-many and reverse relation rendered by the action's serializer,
+    so listing objects runs a constant number of queries whatever the number of rows.
+    """
+    def prefetch_related(self, queryset: QuerySet) -> QuerySet:
+        """
+        Add to the queryset prefetching of the relations the current serializer needs
+        :param queryset: queryset of the current action
+        :return: queryset with prefetched relations.
+        """
+        serializer_class = self.get_serializer_class()
+        if not serializer_class:
+            return queryset
+
+        relations = self.get_serializer_relations(serializer_class)
+        return queryset.prefetch_related(*relations) if relations else queryset
+
+    @staticmethod
+    @cache
+    def get_serializer_relations(serializer_class: type[Serializer]) -> tuple[str, ...]:
+        """
+        Collect sources of the serializer's readable fields that represent several related objects
+        :param serializer_class: serializer class to inspect
+        :return: tuple of relations' names.
+        """
+        fields = serializer_class().fields.values()
+        return tuple(field.source for field in fields if isinstance(field, ManyRelatedField) and not field.write_only)
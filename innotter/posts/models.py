@@ -1,3 +1,4 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 
 from posts.managers import PageManager, PostManager
@@ -12,6 +13,19 @@ class BaseModel(models.Model):
         abstract = True
 
 
+class CountersMixin:
+    """
+    Keep 'save' from overwriting the counters, as they are changed only by atomic updates.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in self.counter_fields]
+        super().save(*args, **kwargs)
+
+
 class Tag(models.Model):
     name = models.CharField(max_length=30, unique=True)
 
@@ -19,7 +33,7 @@ class Tag(models.Model):
         return self.name
 
 
-class Page(models.Model):
+class Page(CountersMixin, models.Model):
     name = models.CharField(max_length=80)
     uuid = models.CharField(max_length=32, unique=True)
     description = models.TextField()
@@ -32,25 +46,69 @@ class Page(models.Model):
 
     is_private = models.BooleanField(default=False)
 
+    # Denormalized counters, kept in sync with the relations by services. See 'rebuild_counters' command.
+    followers_count = models.PositiveIntegerField(default=0, editable=False)
+    posts_count = models.PositiveIntegerField(default=0, editable=False)
+
     unblock_date = models.DateField(null=True, blank=True)
 
     objects = models.Manager()
     pages_objects = PageManager()
 
+    counter_fields = ('followers_count', 'posts_count')
+
     def __str__(self):
         return self.name
 
 
-class Post(BaseModel):
+class Post(CountersMixin, BaseModel):
     page = models.ForeignKey(Page, on_delete=models.CASCADE, null=False, blank=False, related_name='posts')
     title = models.CharField(max_length=50, default='Default Title')
     content = models.CharField(max_length=200, blank=True)
     reply_to = models.ForeignKey('posts.Post', on_delete=models.SET_NULL,
                                  null=True, blank=True, related_name='replies')
+    likes_count = models.PositiveIntegerField(default=0, editable=False)
 
     objects = models.Manager()
     posts_objects = PostManager()
 
+    counter_fields = ('likes_count',)
+
+    class Meta:
+        indexes = (
+            # Backs keyset pagination of the feed.
+            models.Index(fields=('-created_at', '-id'), name='post_created_at_id_idx'),
+        )
+
     def __str__(self):
         return self.title
 
+
+class TimelineEntry(models.Model):
+    """
+    Post materialized in the user's feed at the moment it was created (fan-out on write).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(fields=('user', 'post'), name='timeline_entry_user_post_unique'),
+        )
+
+    def __str__(self):
+        return f'{self.user_id}: {self.post_id}'
+
+
+class OutboxEvent(models.Model):
+    """
+    Event to be published to the RabbitMQ exchange. It's written in the same transaction as the change
+    it describes and published afterwards by 'relay_outbox' command (transactional outbox).
+    """
+    method = models.CharField(max_length=32)
+    routing_key = models.CharField(max_length=255)
+    body = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.method}: {self.body}'
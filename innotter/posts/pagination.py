@@ -0,0 +1,110 @@
+from base64 import b64decode, b64encode
+from binascii import Error as BinasciiError
+from datetime import date
+
+from django.conf import settings
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class FeedCursorPagination(BasePagination):
+    """
+    Keyset pagination of posts ordered by ('-created_at', '-id').
+    The cursor is an opaque token that encodes the position of the last post of the previous page,
+    so the database seeks straight to it through the composite index instead of skipping rows.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = getattr(settings, 'FEED_PAGE_SIZE', 20)
+    max_page_size = getattr(settings, 'FEED_MAX_PAGE_SIZE', 100)
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset: QuerySet, request: Request, view=None) -> list:
+        """
+        Return one page of the given queryset, starting right after the position stored in the cursor
+        :param queryset: queryset ordered by ('-created_at', '-id')
+        :param request: request sent from client
+        :param view: view which is being paginated
+        :return: list of objects of the page.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        position = self.decode_cursor(request)
+        if position:
+            created_at, pk = position
+            # 'created_at <= x' bounds the index range, the OR picks up the rest of the same day.
+            queryset = queryset.filter(Q(created_at__lte=created_at),
+                                       Q(created_at__lt=created_at) | Q(id__lt=pk))
+
+        # Fetch one extra object to find out whether the next page exists.
+        results = list(queryset[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data: list) -> Response:
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema: dict) -> dict:
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request: Request) -> int:
+        """
+        Take page size from query params if it's valid, otherwise use the default one
+        :param request: request sent from client
+        :return: page size.
+        """
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_next_link(self) -> str | None:
+        if not self.has_next:
+            return None
+
+        last = self.page[-1]
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(last.created_at, last.id))
+
+    @staticmethod
+    def encode_cursor(created_at: date, pk: int) -> str:
+        """
+        Pack the position into an opaque url-safe token
+        :param created_at: creation date of the last post at the page
+        :param pk: id of the last post at the page
+        :return: cursor token.
+        """
+        position = f'{created_at.isoformat()}|{pk}'
+        return b64encode(position.encode('ascii'), altchars=b'-_').decode('ascii')
+
+    def decode_cursor(self, request: Request) -> tuple[date, int] | None:
+        """
+        Unpack the position from the cursor token sent by client
+        :param request: request sent from client
+        :return: either tuple of creation date and id or None if there is no cursor.
+        """
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+
+        try:
+            created_at, pk = b64decode(token.encode('ascii'), altchars=b'-_').decode('ascii').split('|')
+            return date.fromisoformat(created_at), int(pk)
+        except (BinasciiError, UnicodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
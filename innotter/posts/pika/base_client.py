@@ -1,37 +1,216 @@
+import logging
+import os
+from dataclasses import dataclass
+from queue import Empty, LifoQueue
+from threading import Lock
+from time import sleep
+
 from django.conf import settings
 import pika
-from pika.adapters.blocking_connection import BlockingConnection
-from pika.exceptions import AMQPConnectionError
+from pika.adapters.blocking_connection import BlockingChannel, BlockingConnection
+from pika.exceptions import AMQPConnectionError, AMQPChannelError, ConnectionClosed, ChannelClosed, StreamLostError
+
 
+logger = logging.getLogger(__name__)
 
 username = settings.RABBITMQ_DEFAULT_USER
 password = settings.RABBITMQ_DEFAULT_PASS
 host = settings.RABBITMQ_HOST
 port = settings.RABBITMQ_PORT
 heartbeat, timeout = settings.RABBITMQ_HEARTBEAT, settings.RABBITMQ_TIMEOUT
+channel_pool_size = getattr(settings, 'RABBITMQ_CHANNEL_POOL_SIZE', 4)
+publish_retries = getattr(settings, 'RABBITMQ_PUBLISH_RETRIES', 5)
+reconnect_backoff = getattr(settings, 'RABBITMQ_RECONNECT_BACKOFF', 0.5)
+reconnect_max_backoff = getattr(settings, 'RABBITMQ_RECONNECT_MAX_BACKOFF', 10.0)
+
+# Errors after which the connection can't be used anymore and has to be opened again.
+connection_errors = (AMQPConnectionError, ConnectionClosed, StreamLostError, ChannelClosed, AMQPChannelError)
+
+
+@dataclass(frozen=True)
+class Message:
+    """
+    Message to be published to the exchange.
+    """
+    routing_key: str
+    body: bytes | str
+    properties: pika.BasicProperties | None = None
+
+
+class Publisher:
+    """
+    Thread-safe publisher that keeps one connection per process and a pool of channels opened on it.
+    Every channel is in transactional mode, so a batch of messages is confirmed by the broker with a single commit.
+    'BlockingConnection' isn't thread-safe, that's why every call to it is made under the lock, while batches
+    of different threads go through different channels and don't mix. The connection is opened again
+    with exponential backoff once it's lost (e.g. heartbeat timeout or broker restart).
+    """
+    def __init__(self,
+                 exchange: str,
+                 pool_size: int = channel_pool_size,
+                 retries: int = publish_retries,
+                 backoff: float = reconnect_backoff,
+                 max_backoff: float = reconnect_max_backoff):
+        self.exchange = exchange
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._lock = Lock()
+        self._connection: BlockingConnection | None = None
+        self._channels: LifoQueue[BlockingChannel] = LifoQueue()
+        self._opened_channels = 0
+        self._pid = None
+
+    def publish(self, routing_key: str, body: bytes | str, properties: pika.BasicProperties | None = None) -> None:
+        """
+        Publish a single message and wait for the broker to take it
+        :param routing_key: routing key of the message
+        :param body: payload of the message
+        :param properties: properties of the message
+        :return: None.
+        """
+        self.publish_batch([Message(routing_key, body, properties)])
+
+    def publish_batch(self, messages: list[Message]) -> None:
+        """
+        Publish the messages in a single transaction. If the connection is lost, open it again and publish
+        the whole batch once more, so some messages may be delivered twice
+        :param messages: messages to be published
+        :return: None.
+        """
+        if not messages:
+            return
+
+        for attempt in range(self.retries + 1):
+            try:
+                channel = self.acquire_channel()
+                try:
+                    for message in messages:
+                        with self._lock:
+                            channel.basic_publish(self.exchange, message.routing_key, message.body, message.properties)
+                    with self._lock:
+                        channel.tx_commit()
+                except BaseException:
+                    self.discard_channel(channel)
+                    raise
+                self.release_channel(channel)
+                return
+            except connection_errors as error:
+                if attempt == self.retries:
+                    raise
+                delay = min(self.backoff * 2 ** attempt, self.max_backoff)
+                logger.warning(f'Publishing has failed ({error!r}), reconnecting in {delay:.1f}s')
+                self.reset()
+                sleep(delay)
+
+    def acquire_channel(self) -> BlockingChannel:
+        """
+        Take an idle channel from the pool or open a new one if the pool isn't full yet,
+        otherwise wait for a channel to be released
+        :return: channel in transactional mode.
+        """
+        self.check_process()
+        while True:
+            try:
+                channel = self._channels.get_nowait()
+            except Empty:
+                with self._lock:
+                    if self._opened_channels < self.pool_size:
+                        channel = self.connection.channel()
+                        channel.tx_select()
+                        self._opened_channels += 1
+                        return channel
+                try:
+                    # The pool may be replaced after reconnecting, so don't wait for the old one forever.
+                    channel = self._channels.get(timeout=0.1)
+                except Empty:
+                    continue
+
+            if channel.is_open and self.is_current(channel):
+                return channel
+            self.discard_channel(channel)
+
+    def release_channel(self, channel: BlockingChannel) -> None:
+        if self.is_current(channel):
+            self._channels.put(channel)
+
+    def discard_channel(self, channel: BlockingChannel) -> None:
+        """
+        Close the channel which may have an unfinished transaction and free its place in the pool
+        :param channel: channel to be discarded
+        :return: None.
+        """
+        with self._lock:
+            if self.is_current(channel):
+                self._opened_channels -= 1
+            if channel.is_open:
+                try:
+                    channel.close()
+                except connection_errors:
+                    pass
+
+    def is_current(self, channel: BlockingChannel) -> bool:
+        """
+        Check whether the channel was opened on the current connection, not on the one lost before
+        """
+        return channel.connection is self._connection
+
+    @property
+    def connection(self) -> BlockingConnection:
+        """
+        Return the opened connection, open a new one if there is none. Must be called under the lock.
+        """
+        if self._connection is None or not self._connection.is_open:
+            self._channels, self._opened_channels = LifoQueue(), 0
+            creds = pika.PlainCredentials(username=username, password=password)
+            self._connection = pika.BlockingConnection(pika.ConnectionParameters(
+                host=host,
+                port=port,
+                credentials=creds,
+                heartbeat=heartbeat,
+                blocked_connection_timeout=timeout)
+            )
+        return self._connection
+
+    def check_process(self) -> None:
+        """
+        Forget the connection inherited from the parent process, the child process opens its own one.
+        """
+        if self._pid != os.getpid():
+            with self._lock:
+                self._connection, self._channels, self._opened_channels = None, LifoQueue(), 0
+                self._pid = os.getpid()
+
+    def reset(self) -> None:
+        """
+        Close the connection and drop all the channels, they are opened again on the next publishing
+        """
+        with self._lock:
+            connection, self._connection = self._connection, None
+            self._channels, self._opened_channels = LifoQueue(), 0
+            if connection is not None and connection.is_open:
+                try:
+                    connection.close()
+                except connection_errors:
+                    pass
+
+    def close(self) -> None:
+        self.reset()
 
 
 class ClientMeta(type):
     """
     Metaclass for pika client
     """
+    _publisher_lock = Lock()
+
     @property
-    def channel(cls) -> BlockingConnection | None:
+    def publisher(cls) -> Publisher:
         """
-        Return either connection object or NoneType. Depend on whether the channel is opened or not.
+        Return the publisher of the process, create it on the first call.
         """
-        if not getattr(cls, '_channel', None):
-            try:
-                creds = pika.PlainCredentials(username=username, password=password)
-                connection = pika.BlockingConnection(pika.ConnectionParameters(
-                    host=host,
-                    port=port,
-                    credentials=creds,
-                    heartbeat=heartbeat,
-                    blocked_connection_timeout=timeout)
-                )
-                new_channel = connection.channel()
-                setattr(cls, '_channel', new_channel)
-            except AMQPConnectionError:
-                pass
-        return getattr(cls, '_channel')
+        with cls._publisher_lock:
+            if not getattr(cls, '_publisher', None):
+                setattr(cls, '_publisher', Publisher(getattr(cls, '_exchange')))
+        return getattr(cls, '_publisher')
@@ -1,21 +1,25 @@
 import json
 
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 import pika
 
 from posts.enum_objects import PostMethods, PageMethods
-from posts.pika.base_client import ClientMeta
+from posts.pika.base_client import ClientMeta, Message
+from posts.pika.codec import BINARY_FORMAT, FORMAT_HEADER, JSON_FORMAT, SHARD_HEADER, EncodingError, encode
 
 
 exchange = settings.RABBITMQ_EXCHANGE_NAME
+wire_format = getattr(settings, 'RABBITMQ_WIRE_FORMAT', JSON_FORMAT)
 
 
 class PikaClient(metaclass=ClientMeta):
     """
     pika package wrapper
-    '_channel' is a variable that stores connection object if the latter exists
+    '_publisher' is a variable that stores the process-wide publisher once it's created
     """
-    _channel = None
+    _publisher = None
+    _exchange = exchange
     _routing_key = None
 
     @classmethod
@@ -23,17 +27,60 @@ class PikaClient(metaclass=ClientMeta):
         cls._routing_key = value
 
     @classmethod
-    def publish(cls, method: PostMethods | PageMethods, body: dict) -> None:
+    def publish(cls, method: PostMethods | PageMethods | str, body: dict, routing_key: str | None = None) -> None:
         """
-        Publish given data to the RabbitMQ exchange. Add properties based on method type
-        :param method: method type
+        Publish given data to the RabbitMQ exchange and wait for the broker to take it.
+        Add properties based on method type
+        :param method: method type or its value
         :param body: payload of the message
+        :param routing_key: routing key of the message, the one set by 'routing_key' is used by default
         :return: None
         """
-        properties = pika.BasicProperties(method.value)
-        cls.channel.basic_publish(
-            exchange=exchange,
-            routing_key=cls._routing_key,
-            body=json.dumps(body),
-            properties=properties
-        )
+        cls.publish_batch([(method, body, routing_key)])
+
+    @classmethod
+    def publish_batch(cls, events: list[tuple[PostMethods | PageMethods | str, dict, str | None]]) -> None:
+        """
+        Publish several messages, the broker confirms all of them at once
+        :param events: tuples of method type, payload and routing key of every message
+        :return: None
+        """
+        messages = []
+        for method, body, routing_key in events:
+            method = getattr(method, 'value', method)
+            encoded_body, body_format = cls.encode(method, body)
+            headers = {FORMAT_HEADER: body_format, SHARD_HEADER: cls.shard_key(method, body)}
+            properties = pika.BasicProperties(content_type=method, headers=headers)
+            messages.append(Message(routing_key or cls._routing_key, encoded_body, properties))
+        cls.publisher.publish_batch(messages)
+
+    @staticmethod
+    def shard_key(method: str, body: dict) -> str:
+        """
+        Return the key the consumer's shards are picked by. It's the same for all the events of the user's pages
+        and posts, so they stay ordered relative to each other. Events without the owner are keyed by the object
+        :param method: method type value (e.g. 'update_pages')
+        :param body: payload of the message
+        :return: key of the owner (e.g. 'users:1') or of the object (e.g. 'pages:1').
+        """
+        entity = method.split('_')[-1]
+        owner_id = body.get('id') if entity == 'users' else body.get('owner_id')
+        if owner_id is None:
+            return f"{entity}:{body.get('id')}"
+        return f"users:{owner_id}"
+
+    @staticmethod
+    def encode(method: str, body: dict) -> tuple[bytes | str, str]:
+        """
+        Encode the payload in the format set by 'RABBITMQ_WIRE_FORMAT'.
+        Payloads which don't match the binary schemas are sent as JSON
+        :param method: method type value
+        :param body: payload of the message
+        :return: encoded payload and its format.
+        """
+        if wire_format == BINARY_FORMAT:
+            try:
+                return encode(method, body), BINARY_FORMAT
+            except EncodingError:
+                pass
+        return json.dumps(body, cls=DjangoJSONEncoder), JSON_FORMAT
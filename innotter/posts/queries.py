@@ -0,0 +1,119 @@
+from django.db import connection
+from django.db.models import Count, F, IntegerField, Model, OuterRef, QuerySet, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.manager import BaseManager
+
+from posts.models import Page, Post
+
+
+def add_related(manager: BaseManager, objs_id: list[int] | QuerySet) -> list[int]:
+    """
+    Add objects to the many-to-many relation in a single 'INSERT ... ON CONFLICT DO NOTHING' statement
+    :param manager: related manager of the relation (e.g. 'page.followers')
+    :param objs_id: either ids of objects or queryset of the single 'id' column inserted by 'INSERT ... SELECT'
+    :return: ids of objects which weren't in the relation before.
+    """
+    table, source_column, target_column = get_through_columns(manager)
+    if isinstance(objs_id, QuerySet):
+        subquery, subquery_params = objs_id.query.sql_with_params()
+        # 'WHERE true' keeps SQLite from parsing 'ON CONFLICT' as a join constraint.
+        rows = f'SELECT %s, "objs".* FROM ({subquery}) "objs" WHERE true'
+        params = [manager.instance.pk, *subquery_params]
+    elif objs_id:
+        rows = 'VALUES ' + ', '.join(['(%s, %s)'] * len(objs_id))
+        params = [param for obj_id in objs_id for param in (manager.instance.pk, obj_id)]
+    else:
+        return []
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO {table} ({source_column}, {target_column}) {rows} '
+                       f'ON CONFLICT DO NOTHING RETURNING {target_column}', params)
+        added = [obj_id for obj_id, in cursor.fetchall()]
+
+    manager._remove_prefetched_objects()
+    return added
+
+
+def remove_related(manager: BaseManager, objs_id: list[int] | QuerySet) -> list[int]:
+    """
+    Remove objects from the many-to-many relation in a single 'DELETE' statement
+    :param manager: related manager of the relation (e.g. 'page.followers')
+    :param objs_id: either ids of objects or queryset of the single 'id' column
+    :return: ids of objects which were in the relation.
+    """
+    table, source_column, target_column = get_through_columns(manager)
+    if isinstance(objs_id, QuerySet):
+        condition, params = objs_id.query.sql_with_params()
+    elif objs_id:
+        condition, params = ', '.join(['%s'] * len(objs_id)), list(objs_id)
+    else:
+        return []
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE {source_column} = %s AND {target_column} IN ({condition}) '
+                       f'RETURNING {target_column}', [manager.instance.pk, *params])
+        removed = [obj_id for obj_id, in cursor.fetchall()]
+
+    manager._remove_prefetched_objects()
+    return removed
+
+
+def get_through_columns(manager: BaseManager) -> tuple[str, str, str]:
+    """
+    Return quoted names of the relation's table and its columns referring to both sides of the relation
+    :param manager: related manager of the relation (e.g. 'page.followers')
+    :return: table name, column of the manager's instance and column of the related objects.
+    """
+    opts = manager.through._meta
+    quote_name = connection.ops.quote_name
+    return (quote_name(opts.db_table),
+            quote_name(opts.get_field(manager.source_field_name).column),
+            quote_name(opts.get_field(manager.target_field_name).column))
+
+
+def update_counter(instance: Model, field: str, delta: int) -> None:
+    """
+    Atomically add delta to the counter in the database and reload its actual value
+    :param instance: object the counter belongs to
+    :param field: counter field name (e.g. 'followers_count')
+    :param delta: number to be added, negative to subtract
+    :return: None.
+    """
+    if not delta:
+        return
+
+    type(instance).objects.filter(pk=instance.pk).update(**{field: shift_counter(field, delta)})
+    instance.refresh_from_db(fields=(field,))
+
+
+def shift_counter(field: str, delta: int) -> Greatest:
+    """
+    Build an expression adding delta to the counter. The counter never goes below zero,
+    even if it has drifted from the relation
+    :param field: counter field name (e.g. 'likes_count')
+    :param delta: number to be added, negative to subtract
+    :return: expression to be used in 'update'.
+    """
+    return Greatest(F(field) + delta, Value(0))
+
+
+def count_related(through: type[Model], field: str) -> Coalesce:
+    """
+    Build a subquery counting rows of the table which refer to the outer object
+    :param through: model of the table to be counted
+    :param field: name of the foreign key to the outer object
+    :return: expression to be used in 'update' or 'annotate'.
+    """
+    rows = through.objects.filter(**{field: OuterRef('pk')}).order_by().values(field)
+    return Coalesce(Subquery(rows.annotate(count=Count('*')).values('count'), output_field=IntegerField()), Value(0))
+
+
+def rebuild_counters() -> tuple[int, int]:
+    """
+    Recount followers and posts of every page and likes of every post
+    :return: numbers of updated pages and posts.
+    """
+    pages = Page.objects.update(followers_count=count_related(Page.followers.through, 'page'),
+                                posts_count=count_related(Post, 'page'))
+    posts = Post.objects.update(likes_count=count_related(Post.liked_by.through, 'post'))
+    return pages, posts
@@ -42,6 +42,8 @@ class ListUpdateMyPagesSerializer(serializers.ModelSerializer):
                   'image',
                   'unblock_date',
                   'posts',
+                  'followers_count',
+                  'posts_count',
                   'id',
                   'owner',)
         read_only_fields = ('followers', 'follow_requests', 'unblock_date', 'posts', 'id')
@@ -65,6 +67,26 @@ class UpdatePageFollowRequestsSerializer(serializers.ModelSerializer):
                             'follow_requests')
 
 
+class FollowRequestsUsersField(serializers.ListField):
+    """
+    Accept either ids of users or 'all' string meaning every user who sent a follow request.
+    'all' is represented as None.
+    """
+    all_users = 'all'
+
+    def to_internal_value(self, data):
+        if data == self.all_users:
+            return None
+        return super().to_internal_value(data)
+
+
+class ResponseFollowRequestsSerializer(serializers.Serializer):
+    """
+    Deserialize users whose follow requests are accepted or denied at once.
+    """
+    users = FollowRequestsUsersField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=1000)
+
+
 class DeletePageTagsSerializer(serializers.ModelSerializer):
     """
     Serializer for destroying page's tags.
@@ -80,7 +102,7 @@ class UpdatePageFollowersSerializer(serializers.ModelSerializer):
     """
     class Meta:
         model = Page
-        fields = ('name', 'uuid', 'followers', 'is_private')
+        fields = ('name', 'uuid', 'followers', 'followers_count', 'is_private')
         read_only_fields = ('name', 'uuid', 'is_private', 'followers')
 
 
@@ -90,17 +112,24 @@ class ListRetrievePostSerializer(serializers.ModelSerializer):
     """
     class Meta:
         model = Post
-        fields = ('title', 'content', 'reply_to', 'page', 'liked_by', 'id')
+        fields = ('title', 'content', 'reply_to', 'page', 'liked_by', 'likes_count', 'id')
         read_only_fields = ('title', 'content', 'reply_to', 'page', 'liked_by', 'id')
 
 
+class LikePostsSerializer(serializers.Serializer):
+    """
+    Deserialize ids of posts to be liked or unliked at once.
+    """
+    posts = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=1000)
+
+
 class UpdatePostSerializer(serializers.ModelSerializer):
     """
     Allow user to edit Post object.
     """
     class Meta:
         model = Post
-        fields = ('title', 'content', 'reply_to', 'page', 'liked_by', 'id')
+        fields = ('title', 'content', 'reply_to', 'page', 'liked_by', 'likes_count', 'id')
         read_only_fields = ('liked_by', 'id')
 
 
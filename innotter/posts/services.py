@@ -1,10 +1,13 @@
 from collections import OrderedDict
+from datetime import timedelta
 from typing import Any
 
 from botocore.exceptions import ClientError
 from django.conf import settings
 from django.core.files.uploadedfile import InMemoryUploadedFile
-from django.db.models import Model
+from django.db import transaction
+from django.db.models import Model, QuerySet
+from django.utils import timezone
 from rest_framework.request import Request
 from rest_framework.serializers import ModelSerializer
 
@@ -13,16 +16,26 @@ from posts.enum_objects import (
     Mode,
     Directory,
     PostMethods,
-    PageMethods
+    PageMethods,
+    UserMethods
 )
+from posts.managers import timelines_enabled, fanout_followers_limit
 from posts.pika.producer import PikaClient
-from posts.models import Page, Post
+from posts.models import OutboxEvent, Page, Post, TimelineEntry
+from posts.queries import add_related, remove_related, shift_counter, update_counter
 from posts.tasks import send_new_post_notification_email
 from user.models import User
 
 
 bucket_name = settings.AWS_STORAGE_BUCKET_NAME
 routing_key_stats = settings.RABBITMQ_STATS_ROUTING_KEY
+timeline_backfill_size = getattr(settings, 'FEED_TIMELINE_BACKFILL_SIZE', 100)
+outbox_enabled = getattr(settings, 'RABBITMQ_OUTBOX_ENABLED', True)
+outbox_batch_size = getattr(settings, 'RABBITMQ_OUTBOX_BATCH_SIZE', 500)
+coalesce_window = timedelta(seconds=getattr(settings, 'RABBITMQ_COALESCE_WINDOW', 0.5))
+# Events carrying a snapshot of the object, only the latest one of them is worth publishing.
+coalesced_methods = (PageMethods.UPDATE.value, PostMethods.UPDATE.value, PostMethods.LIKE.value)
+deleting_methods = (PageMethods.DELETE.value, PostMethods.DELETE.value)
 pika = PikaClient
 s3 = S3Client
 
@@ -54,7 +67,7 @@ def publish_page(page: Page, method: PageMethods, pk: int | None = None) -> None
     data = {}
     # If method DELETE no need for extra data processing
     if method == PageMethods.DELETE:
-        data['id'] = page.id if page.id else pk
+        data.update({'id': page.id if page.id else pk, 'owner_id': page.owner_id})
     else:
         data.update({
             'id': page.id,
@@ -63,13 +76,12 @@ def publish_page(page: Page, method: PageMethods, pk: int | None = None) -> None
             'owner_is_blocked': page.owner.is_blocked,
             'name': page.name,
             'uuid': page.uuid,
-            'followers': page.followers.all().count(),
-            'posts': page.posts.all().count(),
+            'followers': page.followers_count,
+            'posts': page.posts_count,
             'unblock_date': page.unblock_date,
             }
         )
-    pika.routing_key(routing_key_stats)
-    pika.publish(method, data)
+    publish_event(method, routing_key_stats, data)
 
 
 def publish_post(post: OrderedDict | Post, method: PostMethods,
@@ -91,22 +103,84 @@ def publish_post(post: OrderedDict | Post, method: PostMethods,
                 data = {
                     'id': getattr(post, 'id'),
                     'page': getattr(post, 'page_id').id,
+                    'owner_id': getattr(post, 'page_id').owner_id,
                     'title': getattr(post, 'title'),
                     'content': getattr(post, 'content'),
                     'reply_to': reply.id if (reply := getattr(post, 'reply_to')) else reply,
-                    'liked_by': getattr(post, 'liked_by').count()
+                    'liked_by': getattr(post, 'likes_count')
                 }
             except AttributeError:
                 data = {
                     'id': pk,
                     'page': post.get('page').id,
+                    'owner_id': post.get('page').owner_id,
                     'title': post.get('title', ' '),
                     'content': post.get('content', ' '),
                     'reply_to': reply.id if (reply := post.get('reply_to', None)) else reply,
                     'liked_by': liked_by
                 }
-    pika.routing_key(routing_key_stats)
-    pika.publish(method, data)
+    publish_event(method, routing_key_stats, data)
+
+
+def publish_event(method: PostMethods | PageMethods | UserMethods, routing_key: str, data: dict) -> None:
+    """
+    Write the event to the outbox, so it's committed or rolled back together with the change it describes.
+    The outbox is drained to the RabbitMQ exchange by 'relay_outbox' command.
+    If 'RABBITMQ_OUTBOX_ENABLED' is off, publish the event right away
+    :param method: method type
+    :param routing_key: routing key of the message
+    :param data: payload of the message
+    :return: None.
+    """
+    if outbox_enabled:
+        OutboxEvent.objects.create(method=method.value, routing_key=routing_key, body=data)
+    else:
+        pika.routing_key(routing_key)
+        pika.publish(method, data)
+
+
+def relay_outbox_events(batch_size: int = outbox_batch_size) -> tuple[int, int]:
+    """
+    Publish the oldest events of the outbox waiting for the broker's confirms and delete them.
+    Only events older than 'RABBITMQ_COALESCE_WINDOW' are taken, so the snapshots of the same object
+    written within the window are coalesced before publishing.
+    Rows are locked with 'SKIP LOCKED', so several relays can drain the outbox at the same time,
+    though events of the same object are published in order only if there is a single relay.
+    If publishing fails, the whole batch stays in the outbox and is published again (at-least-once delivery)
+    :param batch_size: max number of events to take from the outbox
+    :return: numbers of events taken from the outbox and published to the exchange.
+    """
+    with transaction.atomic():
+        events = list(OutboxEvent.objects.select_for_update(skip_locked=True)
+                      .filter(created_at__lte=timezone.now() - coalesce_window).order_by('id')[:batch_size])
+        published = coalesce_events(events)
+        pika.publish_batch([(event.method, event.body, event.routing_key) for event in published])
+        OutboxEvent.objects.filter(id__in=[event.id for event in events]).delete()
+    return len(events), len(published)
+
+
+def coalesce_events(events: list[OutboxEvent]) -> list[OutboxEvent]:
+    """
+    Keep only the latest snapshot of every method per object, drop the snapshots followed by deleting
+    of the object. The rest of events keep their relative order
+    :param events: events ordered by the time they were written
+    :return: events to be published.
+    """
+    kept = [True] * len(events)
+    snapshots = {}  # (entity, id) -> {method: position of the latest snapshot}
+    for position, event in enumerate(events):
+        entity = event.method.split('_')[-1]  # 'update_pages' -> 'pages'
+        object_snapshots = snapshots.setdefault((entity, event.body.get('id')), {})
+        if event.method in coalesced_methods:
+            if (previous := object_snapshots.get(event.method)) is not None:
+                kept[previous] = False
+            object_snapshots[event.method] = position
+        elif event.method in deleting_methods:
+            for previous in object_snapshots.values():
+                kept[previous] = False
+            object_snapshots.clear()
+
+    return [event for event, keep in zip(events, kept) if keep]
 
 
 def create_page(data: OrderedDict, tags: list, file_url: str | None = None) -> int:
@@ -118,11 +192,12 @@ def create_page(data: OrderedDict, tags: list, file_url: str | None = None) -> i
     :return: id of created page.
     """
     data['image'] = file_url
-    new_page = Page.objects.create(**data)
-    new_page.tags.set(tags)
+    with transaction.atomic():
+        new_page = Page.objects.create(**data)
+        new_page.tags.set(tags)
 
-    perform_save(new_page)
-    publish_page(new_page, PageMethods.CREATE)
+        perform_save(new_page)
+        publish_page(new_page, PageMethods.CREATE)
     return new_page.id
 
 
@@ -145,11 +220,12 @@ def update_page(tags_list: list,
         file_url = save_image(file_obj, upload_dir)
         if file_url:
             instance.image = file_url
-    if tags_list:
-        [instance.tags.add(tag) for tag in tags_list]
-    if serializer:
-        perform_save(serializer)
-    publish_page(instance, PageMethods.UPDATE)
+    with transaction.atomic():
+        if tags_list:
+            [instance.tags.add(tag) for tag in tags_list]
+        if serializer:
+            perform_save(serializer)
+        publish_page(instance, PageMethods.UPDATE)
 
 
 def delete_object(instance: Model,
@@ -163,12 +239,17 @@ def delete_object(instance: Model,
     :param is_post: pass
     :return: None.
     """
-    instance.delete()
-    if serializer:
-        perform_save(serializer)
+    with transaction.atomic():
+        instance.delete()
+        if is_post:
+            update_counter(instance.page, 'posts_count', -1)
+        if serializer:
+            perform_save(serializer)
 
-    data = {'id': pk}
-    publish_post(data, PostMethods.DELETE) if is_post else publish_page(instance, PageMethods.DELETE, pk=pk)
+        if is_post:
+            publish_post({'id': pk, 'owner_id': instance.page.owner_id}, PostMethods.DELETE)
+        else:
+            publish_page(instance, PageMethods.DELETE, pk=pk)
 
 
 def follow_page(request: Request, instance: Page) -> dict[str]:
@@ -179,12 +260,17 @@ def follow_page(request: Request, instance: Page) -> dict[str]:
     :return: dictionary with the one value, that represents result of the following action.
     """
     # If page is private and user doesn't follow it yet.
-    if instance.is_private and (request.user not in instance.followers.all()):
+    if instance.is_private and not instance.followers.filter(pk=request.user.id).exists():
         instance.follow_requests.add(request.user)
         msg = 'Follow request sent!'
     else:
-        instance.followers.add(request.user)
-        publish_page(instance, PageMethods.UPDATE)
+        with transaction.atomic():
+            followed = add_related(instance.followers, [request.user.id])
+            update_counter(instance, 'followers_count', len(followed))
+            if followed:
+                publish_page(instance, PageMethods.UPDATE)
+        if followed and timelines_enabled:
+            backfill_timelines(instance, [request.user.id])
         msg = 'You are following the page now!'
     perform_save(instance)
 
@@ -193,25 +279,44 @@ def follow_page(request: Request, instance: Page) -> dict[str]:
 
 def response_page_follow_request(instance: Page, mode: Mode) -> Page:
     """
-    Provide page's owner to accept or deny follow request
+    Provide page's owner to accept or deny the last follow request
     :param instance: page request was sent to
     :param mode: represents two actions: 'accept' and 'deny'.
     :return: None.
     """
     user_to_response = instance.follow_requests.last()
     if user_to_response:
-        match mode:
-            case Mode.ACCEPT:
-                # Take user from 'follow_requests' and put it into 'followers'.
-                instance.follow_requests.remove(user_to_response)
-                instance.followers.add(user_to_response)
-                publish_page(instance, PageMethods.UPDATE)
-            case Mode.DENY:
-                # Otherwise remove from 'follow_requests'.
-                instance.follow_requests.remove(user_to_response)
+        return response_page_follow_requests(instance, mode, [user_to_response.id])
 
-        perform_save(instance)
-        return instance
+
+def response_page_follow_requests(instance: Page, mode: Mode, users_id: list[int] | None = None) -> Page:
+    """
+    Provide page's owner to accept or deny follow requests of several users at once.
+    The requests are deleted by 'DELETE ... RETURNING' and exactly the returned users are added to 'followers',
+    both in a single transaction
+    :param instance: page requests were sent to
+    :param mode: represents two actions: 'accept' and 'deny'
+    :param users_id: ids of users to response, None means all the requests.
+    :return: page with updated followers and follow requests.
+    """
+    requests = instance.follow_requests.through.objects.filter(page=instance)
+    if users_id is not None:
+        requests = requests.filter(user__in=users_id)
+    requests = requests.values('user')
+
+    followed = []
+    with transaction.atomic():
+        # Only the requests actually deleted are accepted, so a request sent meanwhile is neither lost nor accepted.
+        responded = remove_related(instance.follow_requests, requests)
+        if mode == Mode.ACCEPT:
+            followed = add_related(instance.followers, responded)
+            update_counter(instance, 'followers_count', len(followed))
+        if followed:
+            publish_page(instance, PageMethods.UPDATE)
+
+    if followed and timelines_enabled:
+        backfill_timelines(instance, followed)
+    return instance
 
 
 def destroy_page_tag(instance: Page) -> Page:
@@ -227,18 +332,37 @@ def destroy_page_tag(instance: Page) -> Page:
     return instance
 
 
-def like_post(request: Request, instance: Post) -> None:
+def like_post(request: Request, instance: Post, liked: bool = True) -> bool:
     """
-    Get user from request and add post to his 'liked'
+    Like or unlike the post on behalf of the user who sent the request
     :param request: request sent from client
-    :param instance: post to be liked.
-    :return: None.
+    :param instance: post to be liked or unliked
+    :param liked: whether to like or to unlike the post.
+    :return: whether the post's state has changed.
     """
-    user = User.objects.get(pk=request.user.id)
-    user.liked.add(instance)
-    perform_save(user)
-    data = {'id': instance.id, 'liked_by': user.id}
-    publish_post(data, PostMethods.LIKE)
+    return bool(like_posts(request.user, [instance.id], liked))
+
+
+def like_posts(user: User, posts_id: list[int] | QuerySet, liked: bool = True) -> list[int]:
+    """
+    Add posts to the user's 'liked' or remove them from it by a single statement,
+    update counters of likes and publish only the posts whose state has changed
+    :param user: user who likes the posts
+    :param posts_id: either ids of posts or queryset of the single 'id' column
+    :param liked: whether to like or to unlike the posts.
+    :return: ids of posts whose state has changed.
+    """
+    change_related, delta = (add_related, 1) if liked else (remove_related, -1)
+    with transaction.atomic():
+        changed_posts_id = change_related(user.liked, posts_id)
+        if not changed_posts_id:
+            return changed_posts_id
+
+        changed_posts = Post.objects.filter(pk__in=changed_posts_id)
+        changed_posts.update(likes_count=shift_counter('likes_count', delta))
+        for post_id, likes_count, owner_id in changed_posts.values_list('id', 'likes_count', 'page__owner_id'):
+            publish_post({'id': post_id, 'liked_by': likes_count, 'owner_id': owner_id}, PostMethods.LIKE)
+    return changed_posts_id
 
 
 def send_email(request: Request, serializer: ModelSerializer) -> str:
@@ -248,13 +372,17 @@ def send_email(request: Request, serializer: ModelSerializer) -> str:
     :param serializer: object of a Post model
     :return: result information of sending email.
     """
-    perform_save(serializer)
-    post = serializer.validated_data
-    post_title = post.get('title', ' ')
     page_id = request.data['page']
     page = Page.objects.get(pk=page_id)
+    with transaction.atomic():
+        perform_save(serializer)
+        update_counter(page, 'posts_count', 1)
+
+        post = serializer.validated_data
+        post_id = page.posts.order_by('-id')[0].id
+        publish_post(post, PostMethods.CREATE, pk=post_id, liked_by=0)
 
-    post_id = page.posts.order_by('-id')[0].id
+    post_title = post.get('title', ' ')
     user = request.user
     recipient_list = [email for email in page.followers.values_list('email', flat=True)]
 
@@ -262,10 +390,61 @@ def send_email(request: Request, serializer: ModelSerializer) -> str:
     body = f"{user} just have created '{post_title}' post at {page} page! Let's check in!"
 
     result = send_new_post_notification_email(subject, body, recipient_list)
-    publish_post(post, PostMethods.CREATE, pk=post_id, liked_by=0)
+    if timelines_enabled:
+        fan_out_post(post_id, page)
     return result
 
 
+def fan_out_post(post_id: int, page: Page) -> None:
+    """
+    Push the new post into the timelines of the page's owner and followers.
+    Followers of the pages with more than 'FEED_FANOUT_FOLLOWERS_LIMIT' followers get the post at read time
+    :param post_id: id of the created post
+    :param page: page the post belongs to.
+    :return: None.
+    """
+    push_to_timelines(get_fan_out_users(page), [post_id])
+
+
+def get_fan_out_users(page: Page) -> list[int]:
+    """
+    Return ids of users whose timelines get the page's posts on write: the owner and,
+    unless the page has more than 'FEED_FANOUT_FOLLOWERS_LIMIT' followers, the followers as well
+    :param page: page the posts belong to.
+    :return: list of users' ids.
+    """
+    users_id = [page.owner_id]
+    if page.followers_count <= fanout_followers_limit:
+        users_id.extend(page.followers.values_list('id', flat=True))
+    return users_id
+
+
+def backfill_timelines(page: Page, users_id: list[int]) -> None:
+    """
+    Push the latest posts of the page into the timelines of its new followers
+    :param page: followed page
+    :param users_id: ids of the new followers.
+    :return: None.
+    """
+    # Posts of the popular pages are merged in at read time, so there is nothing to backfill.
+    if page.followers_count > fanout_followers_limit:
+        return
+
+    posts_id = page.posts.order_by('-id').values_list('id', flat=True)[:timeline_backfill_size]
+    push_to_timelines(users_id, posts_id)
+
+
+def push_to_timelines(users_id: list[int], posts_id: list[int]) -> None:
+    """
+    Add every given post to the timeline of every given user, skip the posts which are already there
+    :param users_id: ids of the timelines' owners
+    :param posts_id: ids of posts to be added.
+    :return: None.
+    """
+    entries = [TimelineEntry(user_id=user_id, post_id=post_id) for user_id in users_id for post_id in posts_id]
+    TimelineEntry.objects.bulk_create(entries, batch_size=1000, ignore_conflicts=True)
+
+
 def perform_save(obj: Any) -> None:
     """
     Take object and call both 'full_clean' and 'save' methods.
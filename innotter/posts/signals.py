@@ -0,0 +1,14 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from posts.enum_objects import UserMethods
+from posts.services import publish_event, routing_key_stats
+from user.models import User
+
+
+@receiver(post_delete, sender=User)
+def publish_user_deletion(sender, instance: User, **kwargs) -> None:
+    """
+    Let the stats microservice drop the user, so its consumers forget the user as well.
+    """
+    publish_event(UserMethods.DELETE, routing_key_stats, {'id': instance.pk})
@@ -1,11 +1,23 @@
+from datetime import date, timedelta
+from threading import Thread
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from pika.exceptions import StreamLostError
+from pytest import mark
 from rest_framework import status
 
 from tests.fixtures import Fixtures
 from tests.test_serializers import TestSerializer
-from posts.enum_objects import Mode, Directory
-from posts.models import Tag, Page
+from posts.enum_objects import Mode, Directory, PageMethods, PostMethods
+from posts.models import OutboxEvent, Tag, Page, Post
+from posts.pika import codec
+from posts.pika.base_client import Message, Publisher
+from posts.pika.producer import PikaClient
+from posts.queries import rebuild_counters
 from posts.services import save_image, update_page, response_page_follow_request, delete_object, like_post,\
-                                send_email
+                                send_email, fan_out_post, response_page_follow_requests, relay_outbox_events,\
+                                coalesce_events
 from user.models import User
 
 
@@ -47,6 +59,71 @@ class TestPage(Fixtures):
         response_page_follow_request(page, Mode.ACCEPT)
         assert page.followers.all()
 
+    def test_response_follow_requests(self, signup_user, create_page_factory, mocker):
+        publish = mocker.patch("posts.services.publish_page", return_value=None)
+
+        page = create_page_factory()
+        users = [User.objects.create(username=f'requester_{i}', email=f'requester_{i}@innotter.com', password='!')
+                 for i in range(4)]
+        page.follow_requests.add(*users)
+        publish.reset_mock()
+
+        response_page_follow_requests(page, Mode.ACCEPT, [users[0].id, users[1].id])
+        assert set(page.followers.all()) == set(users[:2]) and page.followers_count == 2
+        assert set(page.follow_requests.all()) == set(users[2:])
+        publish.assert_called_once()
+
+        response_page_follow_requests(page, Mode.DENY)
+        assert not page.follow_requests.all() and page.followers_count == 2
+        publish.assert_called_once()
+
+    def test_outbox_relay(self, signup_user, create_page_factory, mocker):
+        publish = mocker.patch("posts.services.PikaClient.publish_batch", return_value=None)
+        mocker.patch("posts.services.coalesce_window", timedelta(0))
+
+        page = create_page_factory()
+        assert OutboxEvent.objects.filter(method=PageMethods.CREATE.value, body__id=page.id).exists()
+        publish.assert_not_called()
+
+        update_page([], None, page, None)
+        update_page([], None, page, None)
+        assert relay_outbox_events() == (3, 2)
+        publish.assert_called_once()
+        assert not OutboxEvent.objects.exists()
+
+    def test_coalesce_events(self):
+        events = [OutboxEvent(method=method, body={'id': pk}) for method, pk in (
+            (PageMethods.CREATE.value, 1),
+            (PageMethods.UPDATE.value, 1),
+            (PostMethods.LIKE.value, 1),
+            (PageMethods.UPDATE.value, 2),
+            (PostMethods.UPDATE.value, 1),
+            (PageMethods.UPDATE.value, 1),
+            (PostMethods.LIKE.value, 1),
+            (PageMethods.DELETE.value, 2),
+        )]
+        assert coalesce_events(events) == [events[0], events[4], events[5], events[6], events[7]]
+
+    def test_outbox_rollback(self, signup_user, create_page_factory, mocker):
+        page = create_page_factory()
+        OutboxEvent.objects.all().delete()
+
+        try:
+            with transaction.atomic():
+                update_page([], None, page, None)
+                raise ValueError
+        except ValueError:
+            pass
+        assert not OutboxEvent.objects.exists()
+
+    def test_user_deletion_event(self, signup_user):
+        user = User.objects.all()[0]
+        user_id = user.pk
+        OutboxEvent.objects.all().delete()
+
+        user.delete()
+        assert list(OutboxEvent.objects.values_list('method', 'body')) == [('delete_users', {'id': user_id})]
+
     def test_delete_page(self, signup_user, create_page_factory, mocker):
         mocker.patch("posts.services.publish_page",
                      return_value=None)
@@ -54,6 +131,20 @@ class TestPage(Fixtures):
         delete_object(page)
         assert not Page.objects.all()
 
+    def test_rebuild_counters(self, signup_user, create_page_factory, post_factory, mocker):
+        mocker.patch("posts.services.publish_page", return_value=None)
+
+        user = User.objects.all()[0]
+        page = create_page_factory()
+        page.followers.add(user)
+        post = post_factory(page.id)
+        user.liked.add(post)
+
+        rebuild_counters()
+        page.refresh_from_db()
+        post.refresh_from_db()
+        assert page.followers_count == 1 and page.posts_count == 1 and post.likes_count == 1
+
 
 class TestPost(Fixtures):
     """
@@ -69,6 +160,58 @@ class TestPost(Fixtures):
         request = self.client.put(f'/api/v1/posts/{post.id}/')
         assert request.status_code == status.HTTP_200_OK and post.liked_by.all()
 
+    def test_likes_counter(self, signup_user, create_page_factory, post_factory, tokens_factory, mocker):
+        mocker.patch("posts.services.publish_page", return_value=None)
+        publish_post = mocker.patch("posts.services.publish_post", return_value=None)
+
+        user = User.objects.all()[0]
+        access_token = tokens_factory(user.id)['access_token']
+        self.client.credentials(HTTP_AUTHORIZATION=access_token)
+
+        page = create_page_factory(is_private=False)
+        post = post_factory(page.id)
+        [self.client.put(f'/api/v1/posts/{post.id}/') for _ in range(2)]
+
+        post.refresh_from_db()
+        assert post.likes_count == 1 and publish_post.call_count == 1
+        assert publish_post.call_args.args[0] == {'id': post.id, 'liked_by': 1, 'owner_id': page.owner_id}
+
+    def test_unlike_post(self, signup_user, create_page_factory, post_factory, tokens_factory, mocker):
+        mocker.patch("posts.services.publish_page", return_value=None)
+        mocker.patch("posts.services.publish_post", return_value=None)
+
+        user = User.objects.all()[0]
+        access_token = tokens_factory(user.id)['access_token']
+        self.client.credentials(HTTP_AUTHORIZATION=access_token)
+
+        page = create_page_factory(is_private=False)
+        post = post_factory(page.id)
+        changes = [self.client.put(f'/api/v1/posts/{post.id}/like/').data['changed'],
+                   self.client.delete(f'/api/v1/posts/{post.id}/like/').data['changed'],
+                   self.client.delete(f'/api/v1/posts/{post.id}/like/').data['changed']]
+
+        post.refresh_from_db()
+        assert changes == [True, True, False] and post.likes_count == 0 and not post.liked_by.all()
+
+    def test_batch_like_posts(self, signup_user, create_page_factory, post_factory, tokens_factory, mocker):
+        mocker.patch("posts.services.publish_page", return_value=None)
+        publish_post = mocker.patch("posts.services.publish_post", return_value=None)
+
+        user = User.objects.all()[0]
+        access_token = tokens_factory(user.id)['access_token']
+        self.client.credentials(HTTP_AUTHORIZATION=access_token)
+
+        page = create_page_factory(is_private=False)
+        posts_id = [post_factory(page.id).id for _ in range(3)]
+        user.liked.add(posts_id[0])
+
+        request = self.client.put('/api/v1/posts/my/liked/', {'posts': posts_id}, format='json')
+        assert request.status_code == status.HTTP_200_OK
+        assert sorted(request.data['changed']) == posts_id[1:] and publish_post.call_count == 2
+
+        request = self.client.delete('/api/v1/posts/my/liked/', {'posts': posts_id}, format='json')
+        assert sorted(request.data['changed']) == posts_id and not user.liked.all()
+
     def test_send_email(self, signup_user, create_page_factory, follow_page_factory, post_factory, mocker):
         expected = 'The email(s) were successfully sent.'
         mocker.patch("posts.services.send_new_post_notification_email",
@@ -89,3 +232,186 @@ class TestPost(Fixtures):
         post.validated_data = {'title': 'Test post'}
         result = send_email(request, post)
         assert result == expected
+
+    def test_feed_pagination(self, signup_user, create_page_factory, post_factory, tokens_factory, mocker):
+        mocker.patch("posts.services.publish_page", return_value=None)
+
+        user = User.objects.all()[0]
+        access_token = tokens_factory(user.id)['access_token']
+        self.client.credentials(HTTP_AUTHORIZATION=access_token)
+
+        page = create_page_factory(is_private=False)
+        posts_id = [post_factory(page.id).id for _ in range(5)]
+
+        feed, url = [], '/api/v1/posts/my/feed/?page_size=2'
+        while url:
+            request = self.client.get(url)
+            assert request.status_code == status.HTTP_200_OK and len(request.data['results']) <= 2
+            feed.extend(post['id'] for post in request.data['results'])
+            url = request.data['next']
+
+        assert feed == sorted(posts_id, reverse=True)
+
+    def test_timeline_feed(self, signup_user, create_page_factory, post_factory, mocker):
+        mocker.patch("posts.services.publish_page", return_value=None)
+        mocker.patch("posts.managers.timelines_enabled", True)
+
+        user = User.objects.all()[0]
+        page = create_page_factory(is_private=False)
+        fanned_out_posts = [post_factory(page.id) for _ in range(3)]
+        [fan_out_post(post.id, page) for post in fanned_out_posts]
+        post_factory(page.id)
+
+        feed = Post.posts_objects.get_feed_posts(user)
+        assert list(feed) == sorted(fanned_out_posts, key=lambda post: post.id, reverse=True)
+
+    def test_union_feed_matches_join(self, signup_user, create_page_factory, post_factory, mocker):
+        mocker.patch("posts.services.publish_page", return_value=None)
+
+        user = User.objects.all()[0]
+        page = create_page_factory(is_private=False)
+        page.followers.add(user)
+        [post_factory(page.id) for _ in range(3)]
+
+        union_feed = Post.posts_objects.get_union_feed_posts(user)
+        assert list(union_feed) == list(Post.posts_objects.get_join_feed_posts(user)) and len(union_feed) == 3
+
+
+class TestQueriesBudget(Fixtures):
+    """
+    Testing that list endpoints run a constant number of queries whatever the number of rows
+    """
+    # One query authenticates the user, one fetches the rows and the rest prefetch the rendered relations.
+    budgets = {
+        '/api/v1/posts/my/feed/': 3,
+        '/api/v1/posts/my/liked/': 3,
+        '/api/v1/posts/my/': 3,
+        '/api/v1/pages/my/': 6,
+        '/api/v1/pages/': 4,
+    }
+
+    @staticmethod
+    def add_pages(user: User, tags: list[Tag], number: int) -> None:
+        for _ in range(number):
+            index = Page.objects.count()
+            page = Page.objects.create(name=f'Page {index}', uuid=f'uuid {index}', description='Test description',
+                                       owner=user)
+            page.tags.set(tags)
+            page.followers.add(user)
+            page.follow_requests.add(user)
+            posts = [Post.objects.create(title='Test post', content='Test content', page=page) for _ in range(5)]
+            user.liked.add(*posts)
+
+    def count_queries(self, url: str) -> int:
+        with CaptureQueriesContext(connection) as queries:
+            request = self.client.get(url)
+        assert request.status_code == status.HTTP_200_OK
+        return len(queries)
+
+    @mark.parametrize('url', budgets)
+    def test_list_queries_budget(self, url, signup_user, create_tags, tokens_factory):
+        user = User.objects.all()[0]
+        access_token = tokens_factory(user.id)['access_token']
+        self.client.credentials(HTTP_AUTHORIZATION=access_token)
+
+        # The same request over different numbers of rows runs the same queries, so there is no N+1.
+        # The first request also caches the authenticated user, so it isn't counted.
+        self.add_pages(user, create_tags, 1)
+        self.count_queries(url)
+        few_rows = self.count_queries(url)
+        self.add_pages(user, create_tags, 2)
+        many_rows = self.count_queries(url)
+        assert few_rows == many_rows <= self.budgets[url]
+
+
+class FakeChannel:
+    def __init__(self, connection):
+        self.connection = connection
+        self.is_open = True
+        self.pending = []
+
+    def tx_select(self):
+        pass
+
+    def basic_publish(self, exchange, routing_key, body, properties=None):
+        self.pending.append(body)
+
+    def tx_commit(self):
+        if not self.connection.is_open:
+            raise StreamLostError('Connection lost')
+        self.connection.published.extend(self.pending)
+        self.pending = []
+
+    def close(self):
+        self.is_open = False
+
+
+class FakeConnection:
+    def __init__(self, is_open: bool = True):
+        self.is_open = is_open
+        self.published = []
+        self.channels = []
+
+    def channel(self):
+        self.channels.append(FakeChannel(self))
+        return self.channels[-1]
+
+    def close(self):
+        self.is_open = False
+
+
+class TestPublisher:
+    """
+    Testing the shared publisher against a fake broker connection
+    """
+    def test_binary_wire_format(self, mocker):
+        mocker.patch("posts.pika.producer.wire_format", codec.BINARY_FORMAT)
+        page = {'id': 1, 'owner_id': 2, 'owner_username': 'admin', 'owner_is_blocked': False, 'name': 'Test page',
+                'uuid': 'testuuid', 'followers': 300, 'posts': 5, 'unblock_date': date(2030, 1, 1)}
+
+        body, body_format = PikaClient.encode(PageMethods.UPDATE.value, page)
+        assert body_format == codec.BINARY_FORMAT
+        assert codec.decode(PageMethods.UPDATE.value, body) == {**page, 'unblock_date': '2030-01-01'}
+
+        body, body_format = PikaClient.encode(PageMethods.UPDATE.value, {'id': 1, 'extra': 'field'})
+        assert body_format == codec.JSON_FORMAT
+
+    def test_shard_header(self, mocker):
+        publisher = mocker.patch.object(PikaClient, '_publisher')
+        PikaClient.publish_batch([
+            (PageMethods.UPDATE, {'id': 1, 'owner_id': 2}, 'stats'),
+            ('like_posts', {'id': 3, 'owner_id': 2}, 'stats'),
+            ('delete_users', {'id': 2}, 'stats'),
+            ('like_posts', {'id': 3}, 'stats'),
+        ])
+
+        messages = publisher.publish_batch.call_args.args[0]
+        assert [message.properties.headers[codec.SHARD_HEADER] for message in messages] == [
+            'users:2', 'users:2', 'users:2', 'posts:3'
+        ]
+
+    def test_reconnect(self, mocker):
+        lost, restored = FakeConnection(), FakeConnection()
+        mocker.patch("posts.pika.base_client.pika.BlockingConnection", side_effect=[lost, restored])
+        mocker.patch("posts.pika.base_client.sleep")
+        publisher = Publisher('exchange')
+
+        publisher.publish('key', 'first')
+        lost.is_open = False
+        publisher.publish_batch([Message('key', 'second'), Message('key', 'third')])
+        assert lost.published == ['first'] and restored.published == ['second', 'third']
+
+    def test_concurrent_publishing(self, mocker):
+        connection = FakeConnection()
+        mocker.patch("posts.pika.base_client.pika.BlockingConnection", return_value=connection)
+        publisher = Publisher('exchange', pool_size=2)
+
+        def publish(thread: int):
+            for i in range(50):
+                publisher.publish_batch([Message('key', f'{thread}-{i}-{j}') for j in range(3)])
+
+        threads = [Thread(target=publish, args=(thread,)) for thread in range(8)]
+        [thread.start() for thread in threads]
+        [thread.join() for thread in threads]
+        assert len(connection.published) == len(set(connection.published)) == 8 * 50 * 3
+        assert len(connection.channels) <= 2
@@ -1,4 +1,6 @@
+from django.db import transaction
 from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
 from rest_framework.filters import OrderingFilter, SearchFilter
 from rest_framework.permissions import IsAdminUser, AllowAny, IsAuthenticated
 from rest_framework.response import Response
@@ -6,7 +8,9 @@ from rest_framework.status import HTTP_201_CREATED, HTTP_200_OK, HTTP_204_NO_CON
 from rest_framework import viewsets, mixins
 
 from authorization.permissions import IsModerator
+from posts.mixins import PrefetchRelatedMixin
 from posts.models import Page, Post
+from posts.pagination import FeedCursorPagination
 from posts.enum_objects import Mode, Directory, PostMethods
 from posts.serializers import (
     CreateUpdatePagesSerializer,
@@ -14,7 +18,9 @@ from posts.serializers import (
     DeletePageTagsSerializer,
     UpdatePageFollowersSerializer,
     UpdatePageFollowRequestsSerializer,
+    ResponseFollowRequestsSerializer,
     ListRetrievePostSerializer,
+    LikePostsSerializer,
     UpdatePostSerializer,
     UpdateBlockPageSerializer,
     RetrievePostSerializer
@@ -24,8 +30,10 @@ from posts.services import (
     update_page,
     follow_page,
     response_page_follow_request,
+    response_page_follow_requests,
     destroy_page_tag,
     like_post,
+    like_posts,
     delete_object,
     send_email,
     save_image,
@@ -33,7 +41,8 @@ from posts.services import (
 )
 
 
-class PagesViewSet(mixins.ListModelMixin,
+class PagesViewSet(PrefetchRelatedMixin,
+                   mixins.ListModelMixin,
                    mixins.RetrieveModelMixin,
                    mixins.CreateModelMixin,
                    mixins.UpdateModelMixin,
@@ -71,20 +80,20 @@ class PagesViewSet(mixins.ListModelMixin,
     def get_queryset(self):
         """
         Return a queryset based on the request method.
+        Relations rendered by the serializer are prefetched.
         """
         match self.action:
             case 'manager_pages_view':
-                return Page.objects.all()
+                queryset = Page.objects.all()
             case 'get_my_pages' | 'retrieve_my_page' | 'delete_my_page' \
                  | 'delete_my_page' | 'update_my_page' | 'tags' | 'follow_requests':
                 user_id = self.request.user.id
-                return Page.pages_objects.get_user_pages(user_id)
+                queryset = Page.pages_objects.get_user_pages(user_id)
+            case _:
+                pk = self.kwargs.get('pk')
+                queryset = Page.pages_objects.get_all_valid_pages() if pk else Page.pages_objects.get_valid_pages()
 
-        pk = self.kwargs.get('pk')
-        if not pk:
-            return Page.pages_objects.get_valid_pages()
-
-        return Page.pages_objects.get_all_valid_pages()
+        return self.prefetch_related(queryset)
 
     def get_serializer_class(self):
         """
@@ -182,6 +191,8 @@ class PagesViewSet(mixins.ListModelMixin,
     def follow_requests(self, request, pk=None):
         """
         Implement method for retrieving, accepting and denying follow requests.
+        Without 'users' in the body, PUT and DELETE response the last request only,
+        otherwise the requests of the listed users or 'all' of them are responded at once.
         """
         page = self.get_object()
         serializer = self.get_serializer
@@ -190,15 +201,21 @@ class PagesViewSet(mixins.ListModelMixin,
         match request.method:
             case 'GET':
                 serializer = serializer(page)
-            case 'PUT':
-                serializer = serializer(response_page_follow_request(page, mode=Mode.ACCEPT))
-            case 'DELETE':
-                serializer = serializer(response_page_follow_request(page, mode=Mode.DENY))
+            case 'PUT' | 'DELETE':
+                mode = Mode.ACCEPT if request.method == 'PUT' else Mode.DENY
+                if 'users' in request.data:
+                    users = ResponseFollowRequestsSerializer(data=request.data)
+                    users.is_valid(raise_exception=True)
+                    page = response_page_follow_requests(page, mode=mode, users_id=users.validated_data['users'])
+                else:
+                    page = response_page_follow_request(page, mode=mode)
+                serializer = serializer(page)
 
         return Response(serializer.data, status=status_code)
 
 
-class PostsViewSet(mixins.ListModelMixin,
+class PostsViewSet(PrefetchRelatedMixin,
+                   mixins.ListModelMixin,
                    mixins.RetrieveModelMixin,
                    mixins.CreateModelMixin,
                    mixins.UpdateModelMixin,
@@ -213,6 +230,8 @@ class PostsViewSet(mixins.ListModelMixin,
         'delete_post': RetrievePostSerializer,
         'update_my_post': UpdatePostSerializer,
         'create': UpdatePostSerializer,
+        'batch_like': LikePostsSerializer,
+        'batch_unlike': LikePostsSerializer,
     }
     default_serializer = ListRetrievePostSerializer
 
@@ -226,19 +245,22 @@ class PostsViewSet(mixins.ListModelMixin,
     def get_queryset(self):
         """
         Return a queryset based on the request method.
+        Relations rendered by the serializer are prefetched.
         """
         user = self.request.user
         match self.action:
             case 'manager_posts_view':
-                return Post.objects.all()
+                queryset = Post.objects.all()
             case 'get_my_posts' | 'update_my_post' | 'delete_my_post' | 'retrieve_my_post':
-                return Post.posts_objects.get_user_posts(user.id)
+                queryset = Post.posts_objects.get_user_posts(user.id)
             case 'liked_posts':
-                return Post.posts_objects.get_liked_posts(user)
+                queryset = Post.posts_objects.get_liked_posts(user)
             case 'feed':
-                return Post.posts_objects.get_feed_posts(user)
+                queryset = Post.posts_objects.get_feed_posts(user)
+            case _:
+                queryset = Post.posts_objects.get_valid_posts()
 
-        return Post.posts_objects.get_valid_posts()
+        return self.prefetch_related(queryset)
 
     def get_serializer_class(self, *args, **kwargs):
         """
@@ -299,11 +321,29 @@ class PostsViewSet(mixins.ListModelMixin,
         serializer.is_valid(raise_exception=True)
         post = serializer.validated_data
 
-        serializer.save()
-        liked_by = len(serializer.data['liked_by'])
-        publish_post(post, PostMethods.UPDATE, pk=pk, liked_by=liked_by)
+        with transaction.atomic():
+            serializer.save()
+            publish_post(post, PostMethods.UPDATE, pk=pk, liked_by=instance.likes_count)
         return Response(serializer.data, status=HTTP_200_OK)
 
+    @action(methods=('put',), detail=True, url_path='like')
+    def like(self, request, pk=None):
+        """
+        Like a post. Report whether it hasn't been liked before.
+        """
+        post = get_object_or_404(Post.posts_objects.get_valid_posts(), pk=pk)
+        changed = like_post(request, post)
+        return Response({'changed': changed}, status=HTTP_200_OK)
+
+    @like.mapping.delete
+    def unlike(self, request, pk=None):
+        """
+        Unlike a post. Report whether it has been liked before.
+        """
+        post = get_object_or_404(Post.objects.all(), pk=pk)
+        changed = like_post(request, post, liked=False)
+        return Response({'changed': changed}, status=HTTP_200_OK)
+
     @action(methods=('get',), detail=False, url_path='my/liked')
     def liked_posts(self, request):
         """
@@ -313,11 +353,36 @@ class PostsViewSet(mixins.ListModelMixin,
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data, status=HTTP_200_OK)
 
-    @action(methods=('get',), detail=False, url_path='my/feed')
+    @liked_posts.mapping.put
+    def batch_like(self, request):
+        """
+        Like several posts at once, e.g. queued by client while offline. Posts that can't be viewed are skipped.
+        Return ids of posts that haven't been liked before.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        posts = Post.posts_objects.get_valid_posts().filter(pk__in=serializer.validated_data['posts']).values('id')
+        changed = like_posts(request.user, posts)
+        return Response({'changed': changed}, status=HTTP_200_OK)
+
+    @liked_posts.mapping.delete
+    def batch_unlike(self, request):
+        """
+        Unlike several posts at once. Return ids of posts that have been liked before.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        changed = like_posts(request.user, serializer.validated_data['posts'], liked=False)
+        return Response({'changed': changed}, status=HTTP_200_OK)
+
+    @action(methods=('get',), detail=False, url_path='my/feed', pagination_class=FeedCursorPagination)
     def feed(self, request):
         """
         Implement feed by filtering followed and owned posts.
+        The feed is split into pages, use the 'next' link of the response to get the following one.
         """
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data, status=HTTP_200_OK)
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
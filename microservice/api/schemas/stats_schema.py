@@ -1,9 +1,7 @@
 from pydantic import BaseModel
 
 
-class Stats(BaseModel):
-    posts: dict
-    pages: dict
+class StatsSummary(BaseModel):
     total_posts: int
     total_pages: int
     total_likes: int
@@ -11,3 +9,17 @@ class Stats(BaseModel):
 
     class Config:
         orm_mode = True
+        allow_mutation = False  # Every request gets its own stats, which aren't changed once built
+
+
+class Stats(StatsSummary):
+    posts: dict
+    pages: dict
+
+
+class PlatformStats(BaseModel):
+    total_users: int
+    total_pages: int
+    total_posts: int
+    total_likes: int
+    total_followers: int
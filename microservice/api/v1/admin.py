@@ -0,0 +1,20 @@
+from fastapi import APIRouter, Depends
+
+from api.schemas.stats_schema import PlatformStats
+from core.auth.jwt_middleware import IsAdmin
+from core.services.services import run_in_executor
+from core.services.stats_service import StatisticsService
+
+
+admin_router = APIRouter(prefix='/admin', tags=['admin'])
+
+
+@admin_router.get("/stats", dependencies=[Depends(IsAdmin())], response_model=PlatformStats)
+async def retrieve_platform_stats() -> PlatformStats:
+    """
+    Return the stats of the whole platform: number of users having pages, pages and posts and both total
+    likes and followers
+    :return: dict with the Stats.
+    """
+    response = await run_in_executor(StatisticsService.processing_platform_stats)
+    return response
@@ -1,21 +1,48 @@
-from typing import Type
-
 from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
 
-from api.schemas.stats_schema import Stats
+from api.schemas.stats_schema import Stats, StatsSummary
 from core.auth.jwt_middleware import IsUserOwner
+from core.services.services import run_in_executor
 from core.services.stats_service import StatisticsService
 
 
 stats_router = APIRouter(tags=['stats'])
 
 
-@stats_router.get("/stats/{user_id}", dependencies=[Depends(IsUserOwner())], response_model=Stats)
-def retrieve_stats_by_user(user_id: int) -> Type[Stats]:
+def projected_fields(fields: str | None = None) -> list[str] | None:
+    """
+    Parse the comma-separated fields of pages and posts to be returned, 'id' is always returned
+    :param fields: the query parameter
+    :return: list of the fields or None if all of them are requested.
+    """
+    if fields is None:
+        return None
+    projection = (field.strip() for field in fields.split(','))
+    return list(dict.fromkeys(field for field in projection if field and field != 'id'))
+
+
+@stats_router.get("/stats/{user_id}", dependencies=[Depends(IsUserOwner())], response_model=Stats | StatsSummary)
+async def retrieve_stats_by_user(user_id: int,
+                                 stream: bool = False,
+                                 summary: bool = False,
+                                 fields: list[str] | None = Depends(projected_fields)
+                                 ) -> Stats | StatsSummary | StreamingResponse:
     """
     Return all the Stats: posts and pages, number of them and both total likes and followers
     :param user_id: user's profile to view
+    :param stream: send the Stats as NDJSON lines while they're being read instead of a single dict
+    :param summary: return only the totals, without posts and pages
+    :param fields: comma-separated fields of posts and pages to be returned, e.g. 'name,followers'
     :return: dict with the Stats.
     """
-    response = StatisticsService.processing_stats(user_id)
+    if summary:
+        response = await run_in_executor(StatisticsService.processing_summary, user_id)
+        return response
+
+    if stream:
+        # The lines are generated in the threadpool, since the generator reads the db.
+        return StreamingResponse(StatisticsService.stream_stats(user_id, fields), media_type='application/x-ndjson')
+
+    response = await StatisticsService.processing_stats_async(user_id, fields)
     return response
@@ -2,6 +2,7 @@ import logging
 
 import jwt
 
+from core.cache.ttl_cache import TTLCache
 from core.settings import settings
 from core.aws.dynamodb_client import DynamoDBClient
 
@@ -11,27 +12,52 @@ db = DynamoDBClient
 
 
 class AuthService:
-    @staticmethod
-    def verify_user_token(token: str) -> bool:
+    # Only existing users are cached, so a just created user is never rejected because of the cache.
+    _users_cache = TTLCache(maxsize=settings.USERS_CACHE_SIZE, ttl=settings.USERS_CACHE_TTL)
+
+    @classmethod
+    def verify_user_token(cls, token: str) -> bool:
         """
         Verify whether the given token is valid or not
         :param token: either access or refresh token
         :return: whether the token is valid or not.
         """
-        valid = False
+        return cls.get_token_claims(token) is not None
+
+    @classmethod
+    def get_token_claims(cls, token: str) -> dict | None:
+        """
+        Decode the given token and verify that the user it was issued for exists
+        :param token: either access or refresh token
+        :return: token's claims if the token is valid, otherwise None.
+        """
         if token:
             try:
-                user_id = jwt.decode(
+                claims = jwt.decode(
                     token,
                     settings.JWT_SECRET_KEY,
                     algorithms=[settings.JWT_SIGNING_METHOD]
-                )['user_id']
+                )
                 # Verify if the user exists
-                if db.get_item(settings.USERS_NAME_TABLE, settings.PK, user_id):
-                    valid = True
-                    return valid
+                if cls.user_exists(claims['user_id']):
+                    return claims
             except jwt.ExpiredSignatureError:
                 logger.warning('The given token is expired')
             except (jwt.DecodeError, jwt.InvalidTokenError):
                 logger.warning('The given token is invalid')
-        return valid
+        return None
+
+    @classmethod
+    def user_exists(cls, user_id: int) -> bool:
+        """
+        Check whether the user exists, look it up in the database only if it isn't cached
+        :param user_id: id of the user
+        :return: whether the user exists or not.
+        """
+        if cls._users_cache.get(user_id):
+            return True
+
+        exists = bool(db.get_item(settings.USERS_NAME_TABLE, settings.PK, user_id))
+        if exists:
+            cls._users_cache.set(user_id, True)
+        return exists
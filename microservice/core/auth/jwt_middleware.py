@@ -1,8 +1,8 @@
 import logging
 
-import jwt
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from fastapi import Request
+from starlette.concurrency import run_in_threadpool
 
 from core.auth.auth_service import AuthService
 from core.exceptions.base_exceptions import (
@@ -11,7 +11,6 @@ from core.exceptions.base_exceptions import (
     InvalidTokenError,
     NoPermissionError
 )
-from core.settings import settings
 
 
 logger = logging.getLogger(__name__)
@@ -28,7 +27,8 @@ class JWTBearer(HTTPBearer):
     async def __call__(self, request: Request) -> str:
         credentials: HTTPAuthorizationCredentials = await super(JWTBearer, self).__call__(request)
         if credentials:
-            return self.verifying_creds(request, credentials.credentials)
+            # Verifying may look the user up in the db, that's why it's done outside the event loop.
+            return await run_in_threadpool(self.verifying_creds, request, credentials.credentials)
         else:
             logger.warning('Access denied (Invalid authentication scheme)')
             raise AuthenticateError()
@@ -41,10 +41,24 @@ class JWTBearer(HTTPBearer):
         :param token: jwt token
         :return: return the given token if valid, otherwise raise HTTPException.
         """
-        if not AuthService.verify_user_token(token):
+        cls.get_claims(request, token)
+        return token
+
+    @staticmethod
+    def get_claims(request: Request, token: str) -> dict:
+        """
+        Decode and verify the token once per request, the claims are kept in 'request.state.claims'
+        :param request: request from client
+        :param token: jwt token
+        :return: token's claims if the token is valid, otherwise raise HTTPException.
+        """
+        claims = AuthService.get_token_claims(token)
+        if claims is None:
             logger.warning('Access denied (The token is invalid)')
             raise InvalidTokenError()
-        return token
+
+        request.state.claims = claims
+        return claims
 
 
 class IsUserOwner(JWTBearer):
@@ -57,9 +71,7 @@ class IsUserOwner(JWTBearer):
         :return: return the given token is valid and the requested user is the page's owner,
                  otherwise throw HTTPException.
         """
-        if not AuthService.verify_user_token(token):
-            logger.warning('Access denied (The token is invalid)')
-            raise InvalidTokenError()
+        claims = cls.get_claims(request, token)
 
         try:
             user_id = int(request.get('path_params')['user_id'])
@@ -67,12 +79,25 @@ class IsUserOwner(JWTBearer):
             logger.warning('Access denied (The given params are invalid')
             raise InvalidParamsError()
         else:
-            user_id_from_token = jwt.decode(
-                token,
-                settings.JWT_SECRET_KEY,
-                algorithms=[settings.JWT_SIGNING_METHOD]
-            )['user_id']
+            user_id_from_token = claims['user_id']
             if user_id_from_token != user_id:
                 logger.warning('Access denied (The user has no permission to view this page)')
                 raise NoPermissionError()
             return token
+
+
+class IsAdmin(JWTBearer):
+    @classmethod
+    def verifying_creds(cls, request: Request, token: str):
+        """
+        Verify the given token and additionally check out whether the user is an admin.
+        The role is taken from the short-lived access token, a changed role takes effect once it's refreshed
+        :param request: request from client
+        :param token: jwt token
+        :return: return the given token if valid and issued for an admin, otherwise throw HTTPException.
+        """
+        claims = cls.get_claims(request, token)
+        if claims.get('role') != 'admin':
+            logger.warning('Access denied (The user is not an admin)')
+            raise NoPermissionError()
+        return token
@@ -4,6 +4,7 @@ sys.path.append('/app/microservice/')
 
 import boto3
 from boto3.resources.base import ServiceResource
+from botocore.config import Config
 
 from core.settings import settings
 
@@ -23,7 +24,8 @@ class ClientMeta(type):
                 service_name,
                 region_name=settings.AWS_REGION_NAME,
                 aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY
+                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+                config=Config(max_pool_connections=settings.AWS_MAX_POOL_CONNECTIONS)
             )
             setattr(cls, '_client', client)
         return getattr(cls, '_client')
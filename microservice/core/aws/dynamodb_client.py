@@ -1,10 +1,20 @@
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from queue import Full, Queue
+from threading import Event
+from time import sleep
+from typing import Any, Callable, Iterator
+
+from botocore.exceptions import ClientError
 
 from .base_client import ClientMeta
-from core.exceptions.base_exceptions import InvalidObjectTypeError
+from core.exceptions.base_exceptions import InvalidObjectTypeError, UnprocessedItemsError
+from core.settings import settings
 
 
 logger = logging.getLogger(__name__)
+# Errors of requests DynamoDB refused to serve at the moment, the same requests succeed later.
+THROTTLING_ERRORS = frozenset({'ProvisionedThroughputExceededException', 'ThrottlingException', 'RequestLimitExceeded'})
 
 
 class DynamoDBClient(metaclass=ClientMeta):
@@ -24,12 +34,145 @@ class DynamoDBClient(metaclass=ClientMeta):
     @classmethod
     def scan(cls, table_name: str) -> list | tuple:
         """
-        Scan the database based on table_name
+        Scan the database based on table_name, follow 'LastEvaluatedKey' until the whole table is read
         :param table_name: target table
         :return: fetched items.
         """
-        response = cls.client.scan(TableName=table_name)
-        return response.get('Items', tuple())
+        params, items = {'TableName': table_name}, []
+        while True:
+            response = cls.client.scan(**params)
+            items.extend(response.get('Items', tuple()))
+            if 'LastEvaluatedKey' not in response:
+                return items
+            params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    @staticmethod
+    def add_projection(params: dict, projection: list[str] | None) -> None:
+        """
+        Make the request read only the given attributes, their names are passed as placeholders,
+        so any name (including reserved words) can be projected
+        :param params: parameters of either scan or query request
+        :param projection: attributes to be read, all of them are read if it's empty
+        :return: None.
+        """
+        if projection:
+            names = {f'#attr{n}': name for n, name in enumerate(projection)}
+            params['ProjectionExpression'] = ', '.join(names)
+            params['ExpressionAttributeNames'] = {**params.get('ExpressionAttributeNames', {}), **names}
+
+    @classmethod
+    def scan_segment(cls,
+                     table_name: str,
+                     segment: int,
+                     total_segments: int,
+                     projection: list[str] | None = None) -> Iterator[list[dict]]:
+        """
+        Scan a single segment of the table page by page, following 'LastEvaluatedKey'
+        :param table_name: target table
+        :param segment: number of the segment, from 0 to 'total_segments' - 1
+        :param total_segments: number of segments the table is split into
+        :param projection: attributes to be read, all of them are read by default
+        :return: iterator over pages of fetched items.
+        """
+        params = {'TableName': table_name, 'Segment': segment, 'TotalSegments': total_segments}
+        cls.add_projection(params, projection)
+
+        while True:
+            response = cls.client.scan(**params)
+            yield response.get('Items', [])
+            if 'LastEvaluatedKey' not in response:
+                return
+            params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    @classmethod
+    def parallel_scan(cls,
+                      table_name: str,
+                      segments: int = settings.DYNAMODB_SCAN_SEGMENTS,
+                      projection: list[str] | None = None) -> Iterator[list[dict]]:
+        """
+        Scan all the segments of the table at the same time, each of them in its own thread.
+        Pages of items are yielded in the caller's thread as soon as any segment reads them,
+        so they can be aggregated without keeping the whole table in memory
+        :param table_name: target table
+        :param segments: number of segments and threads
+        :param projection: attributes to be read, all of them are read by default
+        :return: iterator over pages of fetched items in no particular order.
+        """
+        pages: Queue = Queue(maxsize=segments * 2)  # Segments wait while the caller is behind
+        stop = Event()
+
+        def put(page: object) -> None:
+            while not stop.is_set():
+                try:
+                    pages.put(page, timeout=0.1)
+                    return
+                except Full:
+                    continue
+
+        def scan(segment: int) -> None:
+            try:
+                for page in cls.scan_segment(table_name, segment, segments, projection):
+                    if stop.is_set():
+                        return
+                    put(page)
+            except Exception as error:
+                put(error)
+            finally:
+                put(None)
+
+        with ThreadPoolExecutor(max_workers=segments, thread_name_prefix=f'scan-{table_name}') as executor:
+            for segment in range(segments):
+                executor.submit(scan, segment)
+            try:
+                finished = 0
+                while finished < segments:
+                    page = pages.get()
+                    if page is None:
+                        finished += 1
+                    elif isinstance(page, Exception):
+                        raise page
+                    else:
+                        yield page
+            finally:
+                stop.set()
+
+    @classmethod
+    def query(cls,
+              table_name: str,
+              key: str,
+              value: int | str | bytes,
+              index_name: str | None = None,
+              page_size: int | None = None,
+              projection: list[str] | None = None) -> Iterator[dict]:
+        """
+        Query the items which partition key equals the value, follow 'LastEvaluatedKey' until all of them are read
+        :param table_name: target table
+        :param key: partition key of the table or of the index
+        :param value: value of the partition key
+        :param index_name: secondary index to be queried, the table itself is queried by default
+        :param page_size: max number of items read by a single request
+        :param projection: attributes to be read, all of them are read by default
+        :return: iterator over fetched items.
+        """
+        value_type, converted_value = cls.target_pk_type(value)
+        params = {
+            'TableName': table_name,
+            'KeyConditionExpression': '#key = :value',
+            'ExpressionAttributeNames': {'#key': key},
+            'ExpressionAttributeValues': {':value': {value_type: converted_value}},
+        }
+        if index_name:
+            params['IndexName'] = index_name
+        if page_size:
+            params['Limit'] = page_size
+        cls.add_projection(params, projection)
+
+        while True:
+            response = cls.client.query(**params)
+            yield from response.get('Items', tuple())
+            if 'LastEvaluatedKey' not in response:
+                return
+            params['ExclusiveStartKey'] = response['LastEvaluatedKey']
 
     @classmethod
     def get_item(cls, table_name: str, pk: str, target_pk: int) -> dict:
@@ -73,6 +216,39 @@ class DynamoDBClient(metaclass=ClientMeta):
         )
         return response['ResponseMetadata']['HTTPStatusCode']
 
+    @classmethod
+    def add_to_item(cls, table_name: str, pk: str, target_pk: str | int | bytes, increments: dict[str, int],
+                    assignments: dict[str, int] | None = None) -> int:
+        """
+        Atomically add the numbers to the fields of the given item, the missing item and fields start from zero
+        :param table_name: a target table
+        :param pk: a primary key of the table
+        :param target_pk: a primary key of the target item
+        :param increments: numbers to be added by field names, negative ones are subtracted
+        :param assignments: numbers to be set by field names by the same update
+        :return: request status code (int).
+        """
+        pk_type, converted_pk = cls.target_pk_type(target_pk)
+        fields = list(increments.items())
+        set_fields = list((assignments or {}).items())
+        expression = 'ADD ' + ', '.join(f'#field{n} :value{n}' for n in range(len(fields)))
+        if set_fields:
+            expression += ' SET ' + ', '.join(f'#set{n} = :set{n}' for n in range(len(set_fields)))
+        response = cls.client.update_item(
+            TableName=table_name,
+            Key={pk: {pk_type: converted_pk}},
+            UpdateExpression=expression,
+            ExpressionAttributeNames={
+                **{f'#field{n}': field for n, (field, _) in enumerate(fields)},
+                **{f'#set{n}': field for n, (field, _) in enumerate(set_fields)},
+            },
+            ExpressionAttributeValues={
+                **{f':value{n}': {'N': str(value)} for n, (_, value) in enumerate(fields)},
+                **{f':set{n}': {'N': str(value)} for n, (_, value) in enumerate(set_fields)},
+            }
+        )
+        return response['ResponseMetadata']['HTTPStatusCode']
+
     @classmethod
     def delete_item(cls, table_name: str, pk: int, target_pk: str | int | bytes) -> int:
         """
@@ -89,6 +265,104 @@ class DynamoDBClient(metaclass=ClientMeta):
         )
         return response['ResponseMetadata']['HTTPStatusCode']
 
+    @classmethod
+    def batch_write_item(cls, request_items: dict[str, list[dict]]) -> dict[str, list[dict]]:
+        """
+        Put and delete up to 25 items of several tables in a single request
+        :param request_items: write requests grouped by tables
+        :return: requests which weren't processed, grouped by tables.
+        """
+        response = cls.client.batch_write_item(RequestItems=request_items)
+        return response.get('UnprocessedItems', dict())
+
+    @classmethod
+    def batch_write(cls, request_items: dict[str, list[dict]]) -> None:
+        """
+        Split write requests into groups of 25 and write them, retry unprocessed requests with exponential backoff
+        :param request_items: write requests grouped by tables
+        :return: None.
+        """
+        requests = [(table_name, request) for table_name, table_requests in request_items.items()
+                    for request in table_requests]
+        for start in range(0, len(requests), settings.DYNAMODB_BATCH_WRITE_SIZE):
+            chunk = {}
+            for table_name, request in requests[start:start + settings.DYNAMODB_BATCH_WRITE_SIZE]:
+                chunk.setdefault(table_name, []).append(request)
+
+            for attempt in range(settings.DYNAMODB_BATCH_WRITE_RETRIES + 1):
+                chunk = cls.batch_write_item(chunk)
+                if not chunk:
+                    break
+                if attempt < settings.DYNAMODB_BATCH_WRITE_RETRIES:
+                    sleep(settings.DYNAMODB_BATCH_WRITE_BACKOFF * 2 ** attempt)
+            else:
+                logger.error('Some items are still unprocessed after all the retries')
+                raise UnprocessedItemsError()
+
+    @classmethod
+    def batch_get_item(cls, request_items: dict[str, dict]) -> tuple[dict[str, list[dict]], dict[str, dict]]:
+        """
+        Fetch up to 100 items of several tables in a single request
+        :param request_items: keys grouped by tables
+        :return: fetched items and keys which weren't processed, both grouped by tables.
+        """
+        response = cls.client.batch_get_item(RequestItems=request_items)
+        return response.get('Responses', dict()), response.get('UnprocessedKeys', dict())
+
+    @classmethod
+    def batch_get(cls, table_name: str, keys: list[dict]) -> list[dict]:
+        """
+        Split the keys into groups of 100 and fetch the existing items, retry unprocessed keys with exponential backoff
+        :param table_name: a target table
+        :param keys: primary keys of the items in the db format, duplicates are fetched once
+        :return: fetched items in no particular order.
+        """
+        unique_keys = list({repr(sorted(key.items())): key for key in keys}.values())
+        items = []
+        for start in range(0, len(unique_keys), settings.DYNAMODB_BATCH_GET_SIZE):
+            chunk = {table_name: {'Keys': unique_keys[start:start + settings.DYNAMODB_BATCH_GET_SIZE]}}
+            for attempt in range(settings.DYNAMODB_BATCH_WRITE_RETRIES + 1):
+                responses, chunk = cls.batch_get_item(chunk)
+                items.extend(responses.get(table_name, ()))
+                if not chunk:
+                    break
+                if attempt < settings.DYNAMODB_BATCH_WRITE_RETRIES:
+                    sleep(settings.DYNAMODB_BATCH_WRITE_BACKOFF * 2 ** attempt)
+            else:
+                logger.error('Some keys are still unprocessed after all the retries')
+                raise UnprocessedItemsError()
+        return items
+
+    @staticmethod
+    def is_throttled(error: ClientError) -> bool:
+        return error.response.get('Error', {}).get('Code') in THROTTLING_ERRORS
+
+    @staticmethod
+    def is_invalid(error: ClientError) -> bool:
+        """
+        Check whether DynamoDB rejected the request because of its data, so it never succeeds
+        """
+        return error.response.get('Error', {}).get('Code') == 'ValidationException'
+
+    @classmethod
+    def retry_throttled(cls, function: Callable, *args, **kwargs) -> Any:
+        """
+        Call the function and call it again with capped exponential backoff while DynamoDB throttles its requests
+        or leaves the items of batches unprocessed
+        :param function: function making the requests, it must be safe to call it again after it has failed
+        :return: result of the function.
+        """
+        for attempt in range(settings.DYNAMODB_THROTTLING_RETRIES + 1):
+            try:
+                return function(*args, **kwargs)
+            except (ClientError, UnprocessedItemsError) as error:
+                if isinstance(error, ClientError) and not cls.is_throttled(error):
+                    raise
+                if attempt == settings.DYNAMODB_THROTTLING_RETRIES:
+                    raise
+                logger.warning(f'DynamoDB throttles the requests, retrying (attempt {attempt + 1})')
+            sleep(min(settings.DYNAMODB_BATCH_WRITE_BACKOFF * 2 ** attempt, settings.DYNAMODB_THROTTLING_MAX_BACKOFF))
+
     @staticmethod
     def target_pk_type(target_pk: int | str | bytes) -> tuple[str, str] | str:
         """
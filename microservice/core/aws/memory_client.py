@@ -0,0 +1,351 @@
+import re
+import sys
+import zlib
+from contextlib import contextmanager
+from copy import deepcopy
+from decimal import Decimal
+from random import Random
+from threading import Lock
+from time import sleep
+from types import SimpleNamespace
+from typing import Iterator
+
+from botocore.exceptions import ClientError
+
+
+OK = {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+
+class InMemoryDynamoDB:
+    """
+    Stand-in of the low-level DynamoDB client keeping the tables in memory, so 'DynamoDBClient' and everything
+    built on it run without AWS. Only the calls and the expressions 'DynamoDBClient' makes are supported:
+    equality key conditions of queries, 'ADD' and 'SET' update expressions and plain projections.
+    Every request may be delayed by 'latency' seconds. Throttling is injected with 'throttle_rate' probability:
+    single-item requests fail with 'ProvisionedThroughputExceededException' as they do once the SDK has given up
+    retrying, batch requests leave the throttled items unprocessed.
+    """
+    def __init__(self, latency: float = 0, throttle_rate: float = 0, page_size: int = 1000, seed: int | None = None):
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.page_size = page_size  # Max number of items read by a single scan or query, as if it was 1 MB
+        self.requests = 0
+        self._random = Random(seed)
+        self._tables: dict[str, dict] = {}
+        self._lock = Lock()
+
+    def create_table(self, TableName: str, KeySchema: list[dict], AttributeDefinitions: list[dict],
+                     GlobalSecondaryIndexes: list[dict] = (), **params) -> dict:
+        self._request('CreateTable')
+        with self._lock:
+            if TableName in self._tables:
+                raise self._error('CreateTable', 'ResourceInUseException', f'Table already exists: {TableName}')
+            self._tables[TableName] = {
+                'KeySchema': KeySchema,
+                'AttributeDefinitions': {attr['AttributeName']: attr['AttributeType'] for attr in AttributeDefinitions},
+                'GlobalSecondaryIndexes': {index['IndexName']: index for index in GlobalSecondaryIndexes},
+                'BillingMode': params.get('BillingMode', 'PROVISIONED'),
+                'ProvisionedThroughput': params.get('ProvisionedThroughput', {}),
+                'Items': {},
+            }
+            return {'TableDescription': self._describe(TableName), **OK}
+
+    def list_tables(self, **params) -> dict:
+        self._request('ListTables')
+        with self._lock:
+            return {'TableNames': sorted(self._tables), **OK}
+
+    def describe_table(self, TableName: str) -> dict:
+        self._request('DescribeTable')
+        with self._lock:
+            return {'Table': self._describe(TableName), **OK}
+
+    def get_waiter(self, waiter_name: str) -> SimpleNamespace:
+        return SimpleNamespace(wait=lambda **params: None)  # Tables are active right away
+
+    def describe_time_to_live(self, TableName: str) -> dict:
+        self._request('DescribeTimeToLive')
+        with self._lock:
+            specification = self._table('DescribeTimeToLive', TableName).get('TimeToLive')
+            if not specification:
+                return {'TimeToLiveDescription': {'TimeToLiveStatus': 'DISABLED'}, **OK}
+            return {'TimeToLiveDescription': {'TimeToLiveStatus': 'ENABLED',
+                                              'AttributeName': specification['AttributeName']}, **OK}
+
+    def update_time_to_live(self, TableName: str, TimeToLiveSpecification: dict) -> dict:
+        # Expired items are kept, DynamoDB may take days to delete them as well.
+        self._request('UpdateTimeToLive')
+        with self._lock:
+            self._table('UpdateTimeToLive', TableName)['TimeToLive'] = TimeToLiveSpecification
+            return {'TimeToLiveSpecification': TimeToLiveSpecification, **OK}
+
+    def update_table(self, TableName: str, AttributeDefinitions: list[dict] = (),
+                     GlobalSecondaryIndexUpdates: list[dict] = (), **params) -> dict:
+        self._request('UpdateTable')
+        with self._lock:
+            table = self._table('UpdateTable', TableName)
+            table['AttributeDefinitions'].update({attr['AttributeName']: attr['AttributeType']
+                                                  for attr in AttributeDefinitions})
+            for update in GlobalSecondaryIndexUpdates:
+                if index := update.get('Create'):
+                    table['GlobalSecondaryIndexes'][index['IndexName']] = index
+                elif index := update.get('Delete'):
+                    table['GlobalSecondaryIndexes'].pop(index['IndexName'], None)
+            return {'TableDescription': self._describe(TableName), **OK}
+
+    def get_item(self, TableName: str, Key: dict, ProjectionExpression: str | None = None,
+                 ExpressionAttributeNames: dict | None = None) -> dict:
+        self._request('GetItem', throttled=True)
+        with self._lock:
+            table = self._table('GetItem', TableName)
+            item = table['Items'].get(self._key('GetItem', table, Key))
+            if item is None:
+                return dict(OK)
+            return {'Item': self._project(item, ProjectionExpression, ExpressionAttributeNames), **OK}
+
+    def put_item(self, TableName: str, Item: dict) -> dict:
+        self._request('PutItem', throttled=True)
+        with self._lock:
+            table = self._table('PutItem', TableName)
+            self._put(table, Item)
+            return dict(OK)
+
+    def update_item(self, TableName: str, Key: dict, AttributeUpdates: dict | None = None,
+                    UpdateExpression: str | None = None, ExpressionAttributeNames: dict | None = None,
+                    ExpressionAttributeValues: dict | None = None) -> dict:
+        self._request('UpdateItem', throttled=True)
+        with self._lock:
+            table = self._table('UpdateItem', TableName)
+            item = deepcopy(table['Items'].get(self._key('UpdateItem', table, Key), Key))
+            for field, update in (AttributeUpdates or {}).items():
+                match update.get('Action', 'PUT'):
+                    case 'PUT':
+                        item[field] = update['Value']
+                    case 'DELETE':
+                        item.pop(field, None)
+                    case 'ADD':
+                        item[field] = self._add('UpdateItem', item.get(field), update['Value'])
+            if UpdateExpression:
+                for action, field, value in self._parse_update('UpdateItem', UpdateExpression,
+                                                               ExpressionAttributeNames or {},
+                                                               ExpressionAttributeValues or {}):
+                    item[field] = self._add('UpdateItem', item.get(field), value) if action == 'ADD' else value
+            self._put(table, item)
+            return dict(OK)
+
+    def delete_item(self, TableName: str, Key: dict) -> dict:
+        self._request('DeleteItem', throttled=True)
+        with self._lock:
+            table = self._table('DeleteItem', TableName)
+            table['Items'].pop(self._key('DeleteItem', table, Key), None)
+            return dict(OK)
+
+    def scan(self, TableName: str, Segment: int | None = None, TotalSegments: int | None = None,
+             ExclusiveStartKey: dict | None = None, Limit: int | None = None,
+             ProjectionExpression: str | None = None, ExpressionAttributeNames: dict | None = None) -> dict:
+        self._request('Scan', throttled=True)
+        with self._lock:
+            table = self._table('Scan', TableName)
+            items = table['Items'].items()
+            if TotalSegments:
+                # Items are split into segments by their keys, the way DynamoDB splits them by partitions.
+                items = [(key, item) for key, item in items
+                         if zlib.crc32(repr(key).encode()) % TotalSegments == Segment]
+            return self._page(table, sorted(items), None, ExclusiveStartKey, Limit, ProjectionExpression,
+                              ExpressionAttributeNames)
+
+    def query(self, TableName: str, KeyConditionExpression: str, ExpressionAttributeValues: dict,
+              ExpressionAttributeNames: dict | None = None, IndexName: str | None = None,
+              ExclusiveStartKey: dict | None = None, Limit: int | None = None,
+              ProjectionExpression: str | None = None) -> dict:
+        self._request('Query', throttled=True)
+        with self._lock:
+            table = self._table('Query', TableName)
+            match = re.fullmatch(r'\s*(#?\w+)\s*=\s*(:\w+)\s*', KeyConditionExpression)
+            if not match:
+                raise self._error('Query', 'ValidationException', 'Only equality of the partition key is supported')
+            key = (ExpressionAttributeNames or {}).get(match[1], match[1])
+            value = ExpressionAttributeValues[match[2]]
+            if IndexName:
+                if IndexName not in table['GlobalSecondaryIndexes']:
+                    raise self._error('Query', 'ValidationException', f'The table has no index: {IndexName}')
+                index_key = self._hash_key(table['GlobalSecondaryIndexes'][IndexName]['KeySchema'])
+            else:
+                index_key = self._hash_key(table['KeySchema'])
+            if key != index_key:
+                raise self._error('Query', 'ValidationException', 'Query condition missed key schema element')
+
+            items = sorted((item_key, item) for item_key, item in table['Items'].items() if item.get(key) == value)
+            return self._page(table, items, index_key if IndexName else None, ExclusiveStartKey, Limit,
+                              ProjectionExpression, ExpressionAttributeNames)
+
+    def batch_write_item(self, RequestItems: dict[str, list[dict]]) -> dict:
+        self._request('BatchWriteItem')
+        if sum(map(len, RequestItems.values())) > 25:
+            raise self._error('BatchWriteItem', 'ValidationException', 'Too many items requested')
+        unprocessed = {}
+        with self._lock:
+            for table_name, requests in RequestItems.items():
+                table = self._table('BatchWriteItem', table_name)
+                for request in requests:
+                    if self._throttled():
+                        unprocessed.setdefault(table_name, []).append(request)
+                    elif 'PutRequest' in request:
+                        self._put(table, request['PutRequest']['Item'])
+                    else:
+                        table['Items'].pop(self._key('BatchWriteItem', table, request['DeleteRequest']['Key']), None)
+        return {'UnprocessedItems': unprocessed, **OK}
+
+    def batch_get_item(self, RequestItems: dict[str, dict]) -> dict:
+        self._request('BatchGetItem')
+        if sum(len(request['Keys']) for request in RequestItems.values()) > 100:
+            raise self._error('BatchGetItem', 'ValidationException', 'Too many items requested')
+        responses, unprocessed = {}, {}
+        with self._lock:
+            for table_name, request in RequestItems.items():
+                table = self._table('BatchGetItem', table_name)
+                responses[table_name] = []
+                for key in request['Keys']:
+                    if self._throttled():
+                        unprocessed.setdefault(table_name, {**request, 'Keys': []})['Keys'].append(key)
+                    elif item := table['Items'].get(self._key('BatchGetItem', table, key)):
+                        responses[table_name].append(self._project(item, request.get('ProjectionExpression'),
+                                                                   request.get('ExpressionAttributeNames')))
+        return {'Responses': responses, 'UnprocessedKeys': unprocessed, **OK}
+
+    def _request(self, operation: str, throttled: bool = False) -> None:
+        """
+        Count the request, delay it by the latency and throttle it if it's a single-item request
+        """
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            sleep(self.latency)
+        if throttled and self._throttled():
+            raise self._error(operation, 'ProvisionedThroughputExceededException',
+                              'The level of configured provisioned throughput for the table was exceeded')
+
+    def _throttled(self) -> bool:
+        return bool(self.throttle_rate) and self._random.random() < self.throttle_rate
+
+    @staticmethod
+    def _error(operation: str, code: str, message: str) -> ClientError:
+        return ClientError({'Error': {'Code': code, 'Message': message}}, operation)
+
+    @staticmethod
+    def _hash_key(key_schema: list[dict]) -> str:
+        return next(key['AttributeName'] for key in key_schema if key['KeyType'] == 'HASH')
+
+    def _table(self, operation: str, table_name: str) -> dict:
+        if table_name not in self._tables:
+            raise self._error(operation, 'ResourceNotFoundException', 'Requested resource not found')
+        return self._tables[table_name]
+
+    def _describe(self, table_name: str) -> dict:
+        table = self._table('DescribeTable', table_name)
+        description = {
+            'TableName': table_name,
+            'TableStatus': 'ACTIVE',
+            'KeySchema': table['KeySchema'],
+            'AttributeDefinitions': [{'AttributeName': name, 'AttributeType': attr_type}
+                                     for name, attr_type in table['AttributeDefinitions'].items()],
+            'BillingModeSummary': {'BillingMode': table['BillingMode']},
+            'ProvisionedThroughput': table['ProvisionedThroughput'],
+            'ItemCount': len(table['Items']),
+        }
+        if table['GlobalSecondaryIndexes']:
+            description['GlobalSecondaryIndexes'] = [{**index, 'IndexStatus': 'ACTIVE'}
+                                                     for index in table['GlobalSecondaryIndexes'].values()]
+        return description
+
+    def _key(self, operation: str, table: dict, key: dict) -> tuple[str, str]:
+        """
+        Return the primary key of the item as a hashable pair of its type and value
+        """
+        hash_key = self._hash_key(table['KeySchema'])
+        try:
+            (key_type, key_value), = key[hash_key].items()
+        except (KeyError, ValueError):
+            raise self._error(operation, 'ValidationException', 'The provided key element does not match the schema')
+        if key_type != table['AttributeDefinitions'][hash_key]:
+            raise self._error(operation, 'ValidationException', 'The provided key element does not match the schema')
+        return key_type, key_value
+
+    def _put(self, table: dict, item: dict) -> None:
+        # Like DynamoDB, keys of the indexes must be of the defined types, but items may lack them.
+        for index in table['GlobalSecondaryIndexes'].values():
+            index_key = self._hash_key(index['KeySchema'])
+            if index_key in item and next(iter(item[index_key])) != table['AttributeDefinitions'][index_key]:
+                raise self._error('PutItem', 'ValidationException',
+                                  f"Type mismatch for Index Key {index_key} IndexName: {index['IndexName']}")
+        table['Items'][self._key('PutItem', table, item)] = deepcopy(item)
+
+    def _add(self, operation: str, current: dict | None, value: dict) -> dict:
+        current = current or {'N': '0'}
+        if 'N' not in value or 'N' not in current:
+            raise self._error(operation, 'ValidationException', 'Only numbers can be added')
+        return {'N': str(Decimal(current['N']) + Decimal(value['N']))}
+
+    def _parse_update(self, operation: str, expression: str, names: dict,
+                      values: dict) -> Iterator[tuple[str, str, dict]]:
+        """
+        Parse 'ADD #field :value, ...' and 'SET #field = :value, ...' clauses of the update expression
+        :return: iterator over actions, field names and values.
+        """
+        for action, assignments in re.findall(r'\b(ADD|SET)\s+(.+?)(?=\s+\b(?:ADD|SET)\b|$)', expression.strip()):
+            for assignment in assignments.split(','):
+                match = re.fullmatch(r'\s*(#?\w+)\s*(=)?\s*(:\w+)\s*', assignment)
+                if not match or (action == 'SET') != bool(match[2]):
+                    raise self._error(operation, 'ValidationException', f'Invalid UpdateExpression: {expression}')
+                yield action, names.get(match[1], match[1]), values[match[3]]
+
+    def _page(self, table: dict, items: list[tuple[tuple, dict]], index_key: str | None,
+              start_key: dict | None, limit: int | None, projection: str | None, names: dict | None) -> dict:
+        """
+        Return a single page of the sorted items, which starts after 'start_key'
+        """
+        if start_key:
+            start = self._key('Scan', table, start_key)
+            items = [(key, item) for key, item in items if key > start]
+        page_size = min(limit or self.page_size, self.page_size)
+        page = items[:page_size]
+        response = {
+            'Items': [self._project(item, projection, names) for _, item in page],
+            'Count': len(page),
+            'ScannedCount': len(page),
+            **OK
+        }
+        if len(items) > page_size:
+            last_item = page[-1][1]
+            hash_key = self._hash_key(table['KeySchema'])
+            response['LastEvaluatedKey'] = {hash_key: last_item[hash_key],
+                                            **({index_key: last_item[index_key]} if index_key else {})}
+        return response
+
+    @staticmethod
+    def _project(item: dict, projection: str | None, names: dict | None) -> dict:
+        if not projection:
+            return deepcopy(item)
+        fields = [(names or {}).get(field.strip(), field.strip()) for field in projection.split(',')]
+        return {field: deepcopy(item[field]) for field in fields if field in item}
+
+
+@contextmanager
+def use_in_memory_dynamodb(client: InMemoryDynamoDB | None = None) -> Iterator[InMemoryDynamoDB]:
+    """
+    Make 'DynamoDBClient' send the requests to the in-memory stand-in until the context exits.
+    The consumer imports the client as 'aws.dynamodb_client', which is a separate module, so both are switched
+    :param client: stand-in to be used, an empty one without latency and throttling by default
+    :return: the stand-in.
+    """
+    client = client or InMemoryDynamoDB()
+    classes = [module.DynamoDBClient for name in ('core.aws.dynamodb_client', 'aws.dynamodb_client')
+               if (module := sys.modules.get(name))]
+    previous = [cls._client for cls in classes]
+    for cls in classes:
+        cls._client = client
+    try:
+        yield client
+    finally:
+        for cls, previous_client in zip(classes, previous):
+            cls._client = previous_client
@@ -0,0 +1,119 @@
+import sys
+
+sys.path.append('/app/microservice/')
+
+import logging
+
+from core.aws.dynamodb_client import DynamoDBClient
+from core.cache.stats_cache import EXPIRY_FIELD
+from core.settings import settings
+
+
+logger = logging.getLogger(__name__)
+db = DynamoDBClient
+
+
+def secondary_index(name: str, key: str) -> dict:
+    return {
+        'IndexName': name,
+        'KeySchema': [{'AttributeName': key, 'KeyType': 'HASH'}],
+        'Projection': {'ProjectionType': 'ALL'},
+    }
+
+
+# Pages are queried by their owner and posts by their page, the rest of reads go by the primary key.
+TABLES = {
+    settings.USERS_NAME_TABLE: {
+        'AttributeDefinitions': [{'AttributeName': settings.PK, 'AttributeType': 'N'}],
+        'GlobalSecondaryIndexes': [],
+    },
+    settings.STATS_NAME_TABLE: {
+        'AttributeDefinitions': [{'AttributeName': settings.PK, 'AttributeType': 'N'}],
+        'GlobalSecondaryIndexes': [],
+    },
+    settings.STATS_CACHE_NAME_TABLE: {
+        'AttributeDefinitions': [{'AttributeName': settings.PK, 'AttributeType': 'N'}],
+        'GlobalSecondaryIndexes': [],
+        'TimeToLive': EXPIRY_FIELD,  # Cached responses are deleted by DynamoDB once they expire
+    },
+    settings.PAGES_NAME_TABLE: {
+        'AttributeDefinitions': [
+            {'AttributeName': settings.PK, 'AttributeType': 'N'},
+            {'AttributeName': 'owner_id', 'AttributeType': 'N'},
+        ],
+        'GlobalSecondaryIndexes': [secondary_index(settings.PAGES_OWNER_INDEX, 'owner_id')],
+    },
+    settings.POSTS_NAME_TABLE: {
+        'AttributeDefinitions': [
+            {'AttributeName': settings.PK, 'AttributeType': 'N'},
+            {'AttributeName': 'page', 'AttributeType': 'N'},
+        ],
+        'GlobalSecondaryIndexes': [secondary_index(settings.POSTS_PAGE_INDEX, 'page')],
+    },
+}
+
+
+def create_tables() -> None:
+    """
+    Create the missing tables and add the missing secondary indexes to the existing ones.
+    DynamoDB builds an index added to a table with data in the background, a single index is added at a time
+    :return: None
+    """
+    existing_tables = db.client.list_tables()['TableNames']
+    for table_name, definition in TABLES.items():
+        if table_name not in existing_tables:
+            params = {
+                'TableName': table_name,
+                'KeySchema': [{'AttributeName': settings.PK, 'KeyType': 'HASH'}],
+                'AttributeDefinitions': definition['AttributeDefinitions'],
+                'BillingMode': 'PAY_PER_REQUEST',
+            }
+            if definition['GlobalSecondaryIndexes']:
+                params['GlobalSecondaryIndexes'] = definition['GlobalSecondaryIndexes']
+            db.create_table(params)
+            logger.info(f"Table '{table_name}' has been created")
+            continue
+
+        table = db.client.describe_table(TableName=table_name)['Table']
+        existing_indexes = {index['IndexName'] for index in table.get('GlobalSecondaryIndexes', ())}
+        missing = [index for index in definition['GlobalSecondaryIndexes']
+                   if index['IndexName'] not in existing_indexes]
+        if missing:
+            new_index = dict(missing[0])
+            if table.get('BillingModeSummary', {}).get('BillingMode') != 'PAY_PER_REQUEST':
+                throughput = table['ProvisionedThroughput']
+                new_index['ProvisionedThroughput'] = {'ReadCapacityUnits': throughput['ReadCapacityUnits'],
+                                                      'WriteCapacityUnits': throughput['WriteCapacityUnits']}
+            db.client.update_table(
+                TableName=table_name,
+                AttributeDefinitions=definition['AttributeDefinitions'],
+                GlobalSecondaryIndexUpdates=[{'Create': new_index}]
+            )
+            logger.info(f"Index '{new_index['IndexName']}' of '{table_name}' is being created, "
+                        f"{len(missing) - 1} more index(es) are left to be created once it's active")
+
+    for table_name, definition in TABLES.items():
+        if ttl_attribute := definition.get('TimeToLive'):
+            enable_time_to_live(table_name, ttl_attribute)
+
+
+def enable_time_to_live(table_name: str, attribute: str) -> None:
+    """
+    Let DynamoDB delete the expired items of the table, a new table is waited for until it's active
+    :param table_name: a target table
+    :param attribute: attribute of the items keeping their expiry time in seconds since the epoch
+    :return: None
+    """
+    db.client.get_waiter('table_exists').wait(TableName=table_name)
+    description = db.client.describe_time_to_live(TableName=table_name)['TimeToLiveDescription']
+    if description['TimeToLiveStatus'] == 'DISABLED':
+        db.client.update_time_to_live(
+            TableName=table_name,
+            TimeToLiveSpecification={'Enabled': True, 'AttributeName': attribute}
+        )
+        logger.info(f"Time to live of '{table_name}' has been enabled")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    create_tables()
@@ -0,0 +1,116 @@
+from .dynamodb_client import DynamoDBClient
+
+
+db = DynamoDBClient
+
+
+class WriteBatch:
+    """
+    Collect writes of several messages and reduce them to a single write per item, keeping the result
+    of applying them one by one. Puts and deletes are sent by BatchWriteItem, which can't update items,
+    so the rest of updates are sent one by one.
+    """
+    def __init__(self, pk: str):
+        self.pk = pk
+        # (table name, key type, key value) -> ('put', item) | ('delete', None) | ('update', (target_pk, fields))
+        self._writes: dict[tuple[str, str, str], tuple[str, dict | tuple | None]] = {}
+
+    def __len__(self) -> int:
+        return len(self._writes)
+
+    def put(self, table_name: str, item: dict) -> None:
+        """
+        Put the whole item, it replaces all the previous writes of the item
+        :param table_name: a target table
+        :param item: an item in DynamoDB format
+        :return: None.
+        """
+        (key_type, key_value), = item[self.pk].items()
+        self._writes[(table_name, key_type, key_value)] = ('put', dict(item))
+
+    def delete(self, table_name: str, target_pk: int | str | bytes) -> None:
+        """
+        Delete the item, it replaces all the previous writes of the item
+        :param table_name: a target table
+        :param target_pk: a primary key of the target item
+        :return: None.
+        """
+        self._writes[(table_name, *db.target_pk_type(target_pk))] = ('delete', None)
+
+    def update(self, table_name: str, target_pk: int | str | bytes, fields_to_update: dict) -> None:
+        """
+        Set the fields of the item, merge them into the previous write of the item if there is one
+        :param table_name: a target table
+        :param target_pk: a primary key of the target item
+        :param fields_to_update: fields in 'AttributeUpdates' format, only 'PUT' action is supported
+        :return: None.
+        """
+        if any(update.get('Action', 'PUT') != 'PUT' for update in fields_to_update.values()):
+            raise ValueError("Only 'PUT' action can be merged")
+
+        key = (table_name, *db.target_pk_type(target_pk))
+        operation, write = self._writes.get(key, (None, None))
+        values = {field: update['Value'] for field, update in fields_to_update.items()}
+        match operation:
+            case 'put':
+                write.update(values)
+            case 'update':
+                write[1].update(fields_to_update)
+            case 'delete':
+                # Updating a deleted item creates it with the key and the given fields only.
+                self._writes[key] = ('put', {self.pk: {key[1]: key[2]}, **values})
+            case _:
+                self._writes[key] = ('update', (target_pk, dict(fields_to_update)))
+
+    def keys(self, table_name: str) -> list[dict]:
+        """
+        Return primary keys of the items of the table written by the batch
+        :param table_name: a target table
+        :return: keys in the db format.
+        """
+        return [{self.pk: {key_type: key_value}} for (table, key_type, key_value) in self._writes if table == table_name]
+
+    def apply(self, table_name: str, key: dict, item: dict | None) -> dict | None:
+        """
+        Return the item as it's going to be after the batch is written
+        :param table_name: a target table
+        :param key: a primary key of the item in the db format
+        :param item: the item as it's in the db now, None if there is no item
+        :return: either the item or None if the batch deletes it.
+        """
+        (key_type, key_value), = key[self.pk].items()
+        operation, write = self._writes[(table_name, key_type, key_value)]
+        match operation:
+            case 'put':
+                return dict(write)
+            case 'delete':
+                return None
+            case _:
+                _, fields_to_update = write
+                values = {field: update['Value'] for field, update in fields_to_update.items()}
+                return {**(item or key), **values}
+
+    def flush(self) -> tuple[int, int]:
+        """
+        Send all the collected writes to the database and clear the batch
+        :return: numbers of items written by BatchWriteItem and updated one by one.
+        """
+        request_items, updates = {}, []
+        for (table_name, key_type, key_value), (operation, write) in self._writes.items():
+            match operation:
+                case 'put':
+                    request = {'PutRequest': {'Item': write}}
+                case 'delete':
+                    request = {'DeleteRequest': {'Key': {self.pk: {key_type: key_value}}}}
+                case _:
+                    updates.append((table_name, *write))
+                    continue
+            request_items.setdefault(table_name, []).append(request)
+
+        if request_items:
+            db.batch_write(request_items)
+        for table_name, target_pk, fields in updates:
+            db.update_item(table_name, self.pk, target_pk, fields)
+
+        self._writes.clear()
+        return sum(map(len, request_items.values())), len(updates)
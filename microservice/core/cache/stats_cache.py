@@ -0,0 +1,97 @@
+import json
+import logging
+from abc import ABC, abstractmethod
+from time import time
+
+from botocore.exceptions import ClientError
+
+from core.aws.dynamodb_client import DynamoDBClient
+from core.cache.ttl_cache import TTLCache
+from core.settings import settings
+
+
+logger = logging.getLogger(__name__)
+db = DynamoDBClient
+EXPIRY_FIELD = 'expires_at'  # Time to live attribute of the 'dynamodb' backend's table, seconds since the epoch
+
+
+class StatsCache(ABC):
+    """
+    Cache of stats responses by users. Every response is stored along with the version of the user's
+    aggregate it was built for, so it's served only while the consumer hasn't changed the user's items.
+    """
+    @abstractmethod
+    def get(self, user_id: int, version: int) -> dict | None:
+        """
+        Return the cached response if it was built for the given version
+        :param user_id: id of the user
+        :param version: current version of the user's aggregate
+        :return: either cached response or None.
+        """
+
+    @abstractmethod
+    def set(self, user_id: int, version: int, response: dict) -> None:
+        """
+        Cache the response built for the given version, it replaces the responses of other versions
+        :param user_id: id of the user
+        :param version: version of the user's aggregate the response was built for
+        :param response: stats of the user
+        :return: None.
+        """
+
+
+class LocalStatsCache(StatsCache):
+    """
+    Responses are kept in the memory of the process, so every worker process has its own ones.
+    """
+    def __init__(self, maxsize: int = settings.STATS_CACHE_SIZE, ttl: float = settings.STATS_CACHE_TTL):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, user_id: int, version: int) -> dict | None:
+        cached_version, response = self._cache.get(user_id, (None, None))
+        return response if cached_version == version else None
+
+    def set(self, user_id: int, version: int, response: dict) -> None:
+        self._cache.set(user_id, (version, response))
+
+
+class DynamoDBStatsCache(StatsCache):
+    """
+    Responses are shared by all the worker processes through the table. Responses larger than
+    the max item size aren't cached. DynamoDB deletes the expired responses within days,
+    so they're checked on reading as well.
+    """
+    def __init__(self, table_name: str = settings.STATS_CACHE_NAME_TABLE, ttl: float = settings.STATS_CACHE_TTL):
+        self.table_name = table_name
+        self.ttl = ttl
+
+    def get(self, user_id: int, version: int) -> dict | None:
+        item = db.get_item(self.table_name, settings.PK, user_id)
+        if item.get('version', {}).get('N') != str(version):
+            return None
+        if float(item.get(EXPIRY_FIELD, {}).get('N', 0)) <= time():
+            return None
+        return json.loads(item['response']['S'])
+
+    def set(self, user_id: int, version: int, response: dict) -> None:
+        try:
+            db.put_item(self.table_name, {
+                settings.PK: {'N': str(user_id)},
+                'version': {'N': str(version)},
+                'response': {'S': json.dumps(response)},
+                EXPIRY_FIELD: {'N': str(int(time() + self.ttl))},
+            })
+        except ClientError:
+            logger.warning(f"Stats of the user {user_id} can't be cached")
+
+
+BACKENDS = {'local': LocalStatsCache, 'dynamodb': DynamoDBStatsCache}
+
+
+def get_stats_cache(backend: str | None = settings.STATS_CACHE_BACKEND) -> StatsCache | None:
+    """
+    Create the cache of the backend set by 'STATS_CACHE_BACKEND'
+    :param backend: name of the backend, None disables caching
+    :return: either cache or None.
+    """
+    return BACKENDS[backend]() if backend else None
@@ -0,0 +1,59 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Any, Hashable
+
+
+class TTLCache:
+    """
+    Bounded thread-safe in-process LRU cache, which entries expire after the given time-to-live
+    """
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Return the cached value if it hasn't expired yet
+        :param key: key of the value
+        :param default: value to be returned if the key isn't cached
+        :return: either cached value or default.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+
+            expires_at, value = entry
+            if expires_at <= monotonic():
+                del self._entries[key]
+                return default
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """
+        Cache the value, evict the least recently used entry if the cache is full
+        :param key: key of the value
+        :param value: value to be cached
+        :return: None.
+        """
+        if not self.maxsize:
+            return
+
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (monotonic() + self.ttl, value)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
@@ -26,3 +26,4 @@ class UserMethods(Enum):
     """
     CREATE = 'create_users'
     UPDATE = 'update_users'
+    DELETE = 'delete_users'
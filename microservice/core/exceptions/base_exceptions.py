@@ -42,3 +42,9 @@ class InvalidObjectTypeError(Exception):
         super().__init__(self.detail)
 
 
+class UnprocessedItemsError(Exception):
+    default_detail = 'DynamoDB has not processed some items of the batch'
+
+    def __init__(self, detail: str = None):
+        self.detail = detail or self.default_detail
+        super().__init__(self.detail)
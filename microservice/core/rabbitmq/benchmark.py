@@ -0,0 +1,140 @@
+import sys
+
+sys.path.append('/app/microservice/')
+sys.path.append('/app/microservice/core/')
+
+import argparse
+import json
+import logging
+from random import Random
+from time import perf_counter
+from typing import Iterable, Iterator
+
+from core.aws.memory_client import InMemoryDynamoDB, use_in_memory_dynamodb
+from core.aws.tables import create_tables
+from core.enum_objects import PageMethods, PostMethods
+from core.rabbitmq.consumer import PikaClient, known_users
+
+
+def synthetic_events(users: int, pages: int, posts: int, updates: int, seed: int | None = None
+                     ) -> Iterator[tuple[dict, str]]:
+    """
+    Generate the events innotter publishes: every user creates the pages and their posts, then the posts
+    are liked, updated and deleted and the pages are updated in random order, deleted posts aren't changed
+    :param users: number of users
+    :param pages: number of pages of every user
+    :param posts: number of posts of every page
+    :param updates: number of likes, updates and deletes of every post and page
+    :param seed: seed of the random order
+    :return: iterator over pairs of data and method type.
+    """
+    random = Random(seed)
+    page_ids = [(user_id, user_id * pages + page) for user_id in range(1, users + 1) for page in range(pages)]
+    post_ids = [(user_id, page_id, page_id * posts + post) for user_id, page_id in page_ids for post in range(posts)]
+    for user_id, page_id in page_ids:
+        yield {
+            'id': page_id, 'owner_id': user_id, 'owner_username': f'user{user_id}', 'owner_is_blocked': False,
+            'name': f'page{page_id}', 'uuid': f'page-{page_id}', 'followers': 0, 'posts': posts, 'unblock_date': None,
+        }, PageMethods.CREATE.value
+    for user_id, page_id, post_id in post_ids:
+        yield {
+            'id': post_id, 'page': page_id, 'title': f'post{post_id}', 'content': 'content', 'reply_to': None,
+            'liked_by': 0, 'owner_id': user_id,
+        }, PostMethods.CREATE.value
+
+    for _ in range(updates * (len(page_ids) + len(post_ids))):
+        roll = random.random()
+        if 0.8 <= roll < 0.95 or not post_ids:
+            user_id, page_id = random.choice(page_ids)
+            yield {'id': page_id, 'owner_id': user_id, 'followers': random.randint(0, 1000)}, PageMethods.UPDATE.value
+            continue
+
+        user_id, page_id, post_id = post = random.choice(post_ids)
+        if roll < 0.6:
+            yield {'id': post_id, 'liked_by': random.randint(0, 1000), 'owner_id': user_id}, PostMethods.LIKE.value
+        elif roll < 0.8:
+            yield {
+                'id': post_id, 'page': page_id, 'title': 'updated', 'content': 'updated', 'owner_id': user_id,
+            }, PostMethods.UPDATE.value
+        else:
+            post_ids.remove(post)  # Innotter doesn't publish changes of deleted posts
+            yield {'id': post_id, 'owner_id': user_id}, PostMethods.DELETE.value
+
+
+def recorded_events(path: str) -> Iterator[tuple[dict, str]]:
+    """
+    Read the events recorded one per line as JSON objects with 'method' and 'data' fields
+    :param path: path to the file
+    :return: iterator over pairs of data and method type.
+    """
+    with open(path) as events:
+        for line in events:
+            if line.strip():
+                event = json.loads(line)
+                yield event['data'], event['method']
+
+
+def percentile(latencies: list[float], percent: float) -> float:
+    """
+    Return the nearest-rank percentile of the sorted latencies
+    """
+    if not latencies:
+        return 0
+    return latencies[min(len(latencies) - 1, max(0, round(percent / 100 * len(latencies)) - 1))]
+
+
+def run_benchmark(events: Iterable[tuple[dict, str]], client: InMemoryDynamoDB | None = None) -> dict:
+    """
+    Replay the events through 'PikaClient.save_data' one by one against the in-memory DynamoDB
+    and measure the time every message takes
+    :param events: pairs of data and method type
+    :param client: stand-in with the latency and throttling to be injected, an empty one by default
+    :return: report with the throughput, latency percentiles in milliseconds and number of failed messages.
+    """
+    known_users.clear()
+    with use_in_memory_dynamodb(client) as db:
+        create_tables()
+        latencies, failed = [], 0
+        start = perf_counter()
+        for data, method in events:
+            started = perf_counter()
+            failed += PikaClient.save_data(data, method) is None
+            latencies.append(perf_counter() - started)
+        elapsed = perf_counter() - start
+    known_users.clear()
+
+    latencies.sort()
+    return {
+        'messages': len(latencies),
+        'failed': failed,
+        'seconds': elapsed,
+        'msg_per_s': len(latencies) / elapsed if elapsed else 0,
+        'requests': db.requests,
+        **{f'p{percent}_ms': percentile(latencies, percent) * 1000 for percent in (50, 90, 99)},
+        'max_ms': latencies[-1] * 1000 if latencies else 0,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure throughput and latency of the consumer '
+                                                 'replaying events against the in-memory DynamoDB')
+    parser.add_argument('--events', help='File with recorded events, synthetic ones are generated by default')
+    parser.add_argument('--users', type=int, default=100, help='Number of synthetic users')
+    parser.add_argument('--pages', type=int, default=3, help='Number of pages of every synthetic user')
+    parser.add_argument('--posts', type=int, default=10, help='Number of posts of every synthetic page')
+    parser.add_argument('--updates', type=int, default=3, help='Number of updates of every synthetic item')
+    parser.add_argument('--latency', type=float, default=0, help='Seconds every DynamoDB request takes')
+    parser.add_argument('--throttle-rate', type=float, default=0, help='Share of throttled DynamoDB requests')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic events and throttling')
+    args = parser.parse_args()
+    logging.disable(logging.ERROR)  # Failed messages are counted in the report instead of being logged one by one
+
+    if args.events:
+        replayed = recorded_events(args.events)
+    else:
+        replayed = synthetic_events(args.users, args.pages, args.posts, args.updates, args.seed)
+    report = run_benchmark(replayed, InMemoryDynamoDB(args.latency, args.throttle_rate, seed=args.seed))
+    print(f"{report['messages']} message(s) in {report['seconds']:.2f}s ({report['msg_per_s']:.0f} msg/s), "
+          f"{report['requests']} DynamoDB request(s), {report['failed']} message(s) failed")
+    print(f"latency: p50 {report['p50_ms']:.2f} ms, p90 {report['p90_ms']:.2f} ms, "
+          f"p99 {report['p99_ms']:.2f} ms, max {report['max_ms']:.2f} ms")
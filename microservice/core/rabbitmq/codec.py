@@ -0,0 +1,175 @@
+"""
+Compact binary encoding of the stats events. It's a copy of innotter's 'posts/pika/codec.py',
+so both of them are changed together. Schemas of a released version are never changed, a new version is added.
+
+Layout: version byte, varint bitmap of null fields, then non-null fields in the schema's order.
+Integers are zigzag varints, strings are utf-8 prefixed by varint length and dates are days since 1970-01-01,
+decoded back to ISO strings just like they come out of JSON.
+"""
+from datetime import date
+
+BINARY_FORMAT = 'binary'
+JSON_FORMAT = 'json'
+FORMAT_HEADER = 'format'
+SHARD_HEADER = 'shard-key'  # Events of the same owner have the same key and stay ordered
+VERSION = 2
+
+EPOCH = date(1970, 1, 1).toordinal()
+
+PAGE_SCHEMA = (('id', 'int'), ('owner_id', 'int'), ('owner_username', 'str'), ('owner_is_blocked', 'bool'),
+               ('name', 'str'), ('uuid', 'str'), ('followers', 'int'), ('posts', 'int'), ('unblock_date', 'date'))
+POST_SCHEMA = (('id', 'int'), ('page', 'int'), ('title', 'str'), ('content', 'str'), ('reply_to', 'int'),
+               ('liked_by', 'int'))
+LIKE_SCHEMA = (('id', 'int'), ('liked_by', 'int'))
+DELETE_SCHEMA = (('id', 'int'),)
+# Version 2 adds the owner of the page to every page and post event, the events are sharded by it
+OWNED_POST_SCHEMA = POST_SCHEMA + (('owner_id', 'int'),)
+OWNED_LIKE_SCHEMA = LIKE_SCHEMA + (('owner_id', 'int'),)
+OWNED_DELETE_SCHEMA = DELETE_SCHEMA + (('owner_id', 'int'),)
+
+SCHEMAS = {
+    1: {
+        'create_pages': PAGE_SCHEMA,
+        'update_pages': PAGE_SCHEMA,
+        'delete_pages': DELETE_SCHEMA,
+        'create_posts': POST_SCHEMA,
+        'update_posts': POST_SCHEMA,
+        'like_posts': LIKE_SCHEMA,
+        'delete_posts': DELETE_SCHEMA,
+    },
+    2: {
+        'create_pages': PAGE_SCHEMA,
+        'update_pages': PAGE_SCHEMA,
+        'delete_pages': OWNED_DELETE_SCHEMA,
+        'create_posts': OWNED_POST_SCHEMA,
+        'update_posts': OWNED_POST_SCHEMA,
+        'like_posts': OWNED_LIKE_SCHEMA,
+        'delete_posts': OWNED_DELETE_SCHEMA,
+    },
+}
+
+
+class EncodingError(ValueError):
+    """
+    The payload doesn't match the schema of the method.
+    """
+
+
+def encode(method: str, data: dict, version: int = VERSION) -> bytes:
+    """
+    Pack the payload according to the schema of the method
+    :param method: method type value (e.g. 'update_pages')
+    :param data: payload of the message
+    :param version: version of the schemas
+    :return: encoded payload.
+    """
+    schema = SCHEMAS[version].get(method)
+    if schema is None or data.keys() != {name for name, _ in schema}:
+        raise EncodingError(f"The payload doesn't match the schema of '{method}'")
+
+    nulls, values = 0, bytearray()
+    for position, (name, field_type) in enumerate(schema):
+        value = data[name]
+        if value is None:
+            nulls |= 1 << position
+            continue
+        try:
+            ENCODERS[field_type](values, value)
+        except (TypeError, ValueError) as error:
+            raise EncodingError(f"Field '{name}' of '{method}' can't be encoded: {error}") from error
+
+    message = bytearray((version,))
+    write_varint(message, nulls)
+    return bytes(message + values)
+
+
+def decode(method: str, body: bytes) -> dict:
+    """
+    Unpack the payload encoded by 'encode'
+    :param method: method type value (e.g. 'update_pages')
+    :param body: encoded payload
+    :return: payload of the message.
+    """
+    version = body[0]
+    try:
+        schema = SCHEMAS[version][method]
+    except KeyError:
+        raise EncodingError(f"There is no schema of '{method}' of version {version}")
+
+    nulls, offset = read_varint(body, 1)
+    data = {}
+    for position, (name, field_type) in enumerate(schema):
+        if nulls & 1 << position:
+            data[name] = None
+        else:
+            data[name], offset = DECODERS[field_type](body, offset)
+    return data
+
+
+def write_varint(buffer: bytearray, value: int) -> None:
+    while value > 0x7f:
+        buffer.append(value & 0x7f | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def read_varint(body: bytes, offset: int) -> tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = body[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def write_int(buffer: bytearray, value: int) -> None:
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise TypeError(f'{value!r} is not an integer')
+    write_varint(buffer, value << 1 if value >= 0 else (-value << 1) - 1)
+
+
+def read_int(body: bytes, offset: int) -> tuple[int, int]:
+    value, offset = read_varint(body, offset)
+    return (value >> 1) ^ -(value & 1), offset
+
+
+def write_str(buffer: bytearray, value: str) -> None:
+    if not isinstance(value, str):
+        raise TypeError(f'{value!r} is not a string')
+    encoded = value.encode()
+    write_varint(buffer, len(encoded))
+    buffer += encoded
+
+
+def read_str(body: bytes, offset: int) -> tuple[str, int]:
+    length, offset = read_varint(body, offset)
+    return body[offset:offset + length].decode(), offset + length
+
+
+def write_bool(buffer: bytearray, value: bool) -> None:
+    if not isinstance(value, bool):
+        raise TypeError(f'{value!r} is not a boolean')
+    buffer.append(value)
+
+
+def read_bool(body: bytes, offset: int) -> tuple[bool, int]:
+    return bool(body[offset]), offset + 1
+
+
+def write_date(buffer: bytearray, value: date | str) -> None:
+    if isinstance(value, str):
+        value = date.fromisoformat(value)
+    elif not isinstance(value, date):
+        raise TypeError(f'{value!r} is not a date')
+    write_int(buffer, value.toordinal() - EPOCH)
+
+
+def read_date(body: bytes, offset: int) -> tuple[str, int]:
+    days, offset = read_int(body, offset)
+    return date.fromordinal(days + EPOCH).isoformat(), offset
+
+
+ENCODERS = {'int': write_int, 'str': write_str, 'bool': write_bool, 'date': write_date}
+DECODERS = {'int': read_int, 'str': read_str, 'bool': read_bool, 'date': read_date}
@@ -4,6 +4,7 @@ sys.path.append('/app/microservice/core/')
 
 import json
 import logging
+from time import monotonic
 
 from botocore.exceptions import ClientError
 import pika
@@ -13,12 +14,31 @@ from pika.exceptions import AMQPConnectionError, StreamLostError, ChannelWrongSt
 from pika.spec import BasicProperties, Basic
 
 from aws.dynamodb_client import DynamoDBClient
+from aws.write_batch import WriteBatch
+from core.cache.ttl_cache import TTLCache
 from core.enum_objects import PageMethods, PostMethods, UserMethods
+from core.exceptions.base_exceptions import InvalidObjectTypeError, UnprocessedItemsError
+from core.rabbitmq.codec import BINARY_FORMAT, FORMAT_HEADER, decode
+from core.services.aggregates import TOTALS, StatsAggregator
 from core.settings import settings
 
 
 logger = logging.getLogger(__name__)
 db = DynamoDBClient
+# Errors of decoding messages and reading their data, such messages are never processed whatever times they're sent.
+MALFORMED_ERRORS = (ValueError, KeyError, IndexError, TypeError, AttributeError, InvalidObjectTypeError)
+known_users = TTLCache(maxsize=settings.KNOWN_USERS_CACHE_SIZE, ttl=settings.KNOWN_USERS_CACHE_TTL)
+
+
+def connection_parameters() -> pika.ConnectionParameters:
+    creds = pika.PlainCredentials(username=settings.RABBITMQ_USERNAME, password=settings.RABBITMQ_PASSWORD)
+    return pika.ConnectionParameters(
+        host=settings.RABBITMQ_HOST,
+        port=settings.RABBITMQ_PORT,
+        credentials=creds,
+        heartbeat=settings.RABBITMQ_HEARTBEAT,
+        blocked_connection_timeout=settings.RABBITMQ_TIMEOUT
+    )
 
 
 class ClientMeta(type):
@@ -32,14 +52,7 @@ class ClientMeta(type):
         """
         if not getattr(cls, '_channel', None):
             try:
-                creds = pika.PlainCredentials(username=settings.RABBITMQ_USERNAME, password=settings.RABBITMQ_PASSWORD)
-                connection = pika.BlockingConnection(pika.ConnectionParameters(
-                    host=settings.RABBITMQ_HOST,
-                    port=settings.RABBITMQ_PORT,
-                    credentials=creds,
-                    heartbeat=settings.RABBITMQ_HEARTBEAT,
-                    blocked_connection_timeout=settings.RABBITMQ_TIMEOUT)
-                )
+                connection = pika.BlockingConnection(connection_parameters())
                 new_channel = connection.channel()
                 setattr(cls, '_channel', new_channel)
             except AMQPConnectionError:
@@ -49,8 +62,12 @@ class ClientMeta(type):
 
 
 class PikaClient(metaclass=ClientMeta):
+    """
+    '_processed' is a shared counter of processed messages, set by the supervisor of the worker processes
+    """
     _channel = None
     _queue = None
+    _processed = None
 
     @classmethod
     def callback(
@@ -60,25 +77,271 @@ class PikaClient(metaclass=ClientMeta):
             properties: BasicProperties,
             body: bytes
     ):
-        payload = json.loads(body)
-        cls.save_data(payload, properties.content_type)
+        try:
+            payload = cls.decode_body(properties, body)
+        except MALFORMED_ERRORS:
+            logger.error("The message can't be decoded, skipping it")
+        else:
+            cls.save_data(payload, properties.content_type)
+        cls.count_processed(1)
+
+    @staticmethod
+    def decode_body(properties: BasicProperties, body: bytes) -> dict:
+        """
+        Decode the message's payload according to the format set in its headers.
+        Messages without the format header are JSON
+        :param properties: properties of the message
+        :param body: payload of the message
+        :return: decoded payload.
+        """
+        headers = properties.headers or {}
+        if headers.get(FORMAT_HEADER) == BINARY_FORMAT:
+            return decode(properties.content_type, body)
+        return json.loads(body)
 
     @classmethod
     def start_consumer(cls, queue: str) -> None:
         """
         Take queue name and start consuming message from it, at the same time
-        catching such exceptions as emtpy deque, invalid queue name and internal connection errors
+        catching such exceptions as emtpy deque, invalid queue name and internal connection errors.
+        If 'CONSUMER_BATCH_SIZE' is greater than 1, messages are written to the db in batches
         :param queue: queue name to connect
         :return: None
         """
         cls._queue = queue
         try:
-            cls.channel.basic_consume(cls._queue, on_message_callback=cls.callback, auto_ack=True)
-            cls.channel.start_consuming()
+            if settings.CONSUMER_BATCH_SIZE > 1:
+                cls.consume_batches(settings.CONSUMER_BATCH_SIZE, settings.CONSUMER_BATCH_TIMEOUT)
+            else:
+                cls.channel.basic_consume(cls._queue, on_message_callback=cls.callback, auto_ack=True)
+                cls.channel.start_consuming()
         except (StreamLostError, ChannelWrongStateError, AttributeError):
             pass
             logging.warning('No items in the deque or the queue name may be invalid')
 
+    @classmethod
+    def consume_batches(cls, batch_size: int, batch_timeout: float) -> None:
+        """
+        Pull up to 'batch_size' messages or wait for 'batch_timeout' seconds since the first message of the batch,
+        write them to the db and ack them only after the write has succeeded
+        :param batch_size: max number of messages in the batch, also used as prefetch count
+        :param batch_timeout: max number of seconds to wait for the batch to be filled
+        :return: None
+        """
+        cls.channel.basic_qos(prefetch_count=batch_size)
+        messages, deadline = [], None
+        for method, properties, body in cls.channel.consume(cls._queue, inactivity_timeout=batch_timeout):
+            if method is not None:
+                messages.append((method, properties, body))
+                deadline = deadline or monotonic() + batch_timeout
+            if messages and (len(messages) >= batch_size or method is None or monotonic() >= deadline):
+                cls.process_batch(messages)
+                messages, deadline = [], None
+
+    @classmethod
+    def process_batch(cls, messages: list[tuple[Basic.Deliver, BasicProperties, bytes]]) -> None:
+        """
+        Write the batch of messages and ack all of them at once after the write. Messages which can't be decoded
+        or written are rejected one by one, so they're dead-lettered instead of being redelivered forever.
+        If DynamoDB keeps throttling the requests, return the messages to the queue, they will be written again
+        :param messages: delivered messages
+        :return: None
+        """
+        events, delivery_tags = [], []
+        for method, properties, body in messages:
+            try:
+                events.append((cls.decode_body(properties, body), properties.content_type))
+                delivery_tags.append(method.delivery_tag)
+            except MALFORMED_ERRORS:
+                logger.error("The message can't be decoded, rejecting it")
+                cls.channel.basic_reject(delivery_tag=method.delivery_tag, requeue=False)
+        if not events:
+            cls.count_processed(len(messages))
+            return
+
+        try:
+            invalid = cls.save_batch(events)
+        except (ClientError, UnprocessedItemsError):
+            logger.error("The batch can't be written at the moment, returning it to the queue")
+            cls.channel.basic_nack(delivery_tag=delivery_tags[-1], multiple=True, requeue=True)
+            return
+
+        for index in invalid:
+            cls.channel.basic_reject(delivery_tag=delivery_tags[index], requeue=False)
+        written = [delivery_tag for index, delivery_tag in enumerate(delivery_tags) if index not in invalid]
+        if written:
+            cls.channel.basic_ack(delivery_tag=written[-1], multiple=True)
+        cls.count_processed(len(messages))
+
+    @classmethod
+    def count_processed(cls, number: int) -> None:
+        if cls._processed is not None:
+            with cls._processed.get_lock():
+                cls._processed.value += number
+
+    @classmethod
+    def save_batch(cls, events: list[tuple[dict, str]]) -> list[int]:
+        """
+        Reduce the events to a single write per item and write them by BatchWriteItem, then add the changes
+        to the owners' totals. The totals are counted from the items read before the write, so nothing is
+        written until they're read and, once the write has started, throttled requests are retried in place
+        rather than the batch being redelivered. Events which are malformed or rejected by the db are skipped
+        :param events: pairs of data and method type (e.g. 'update_posts')
+        :return: indexes of the skipped events.
+        """
+        batch, invalid, old_items = db.retry_throttled(cls.prepare_batch, events)
+        aggregator = StatsAggregator()
+        cls.collect_changes(batch, aggregator, old_items)
+        try:
+            db.retry_throttled(batch.flush)
+        except ClientError as error:
+            if not db.is_invalid(error):
+                raise
+            logger.warning('The batch was rejected, writing the messages one by one to find the invalid ones')
+            batch, invalid = cls.write_one_by_one(events, invalid)
+            aggregator = StatsAggregator()
+            cls.collect_changes(batch, aggregator, old_items)
+        db.retry_throttled(aggregator.flush)
+
+        for index, (data, method) in enumerate(events):
+            if index not in invalid:
+                cls.remember_users(data, method)
+        return invalid
+
+    @classmethod
+    def prepare_batch(cls, events: list[tuple[dict, str]]) -> tuple[WriteBatch, list[int], dict]:
+        """
+        Add the events to a new batch and read the items the batch is going to change, nothing is written
+        :param events: pairs of data and method type
+        :return: the batch, indexes of the malformed events and the items before the write by their keys.
+        """
+        batch, invalid = WriteBatch(settings.PK), []
+        for index, (data, method) in enumerate(events):
+            try:
+                cls.add_to_batch(batch, data, method)
+            except MALFORMED_ERRORS:
+                logger.error(f"The data of '{method}' message is malformed, skipping it")
+                invalid.append(index)
+        return batch, invalid, cls.read_old_items(batch)
+
+    @classmethod
+    def write_one_by_one(cls, events: list[tuple[dict, str]], invalid: list[int]) -> tuple[WriteBatch, list[int]]:
+        """
+        Write the events one by one after the batch was rejected, the writes are idempotent, so the items written
+        by the batch before it was rejected are written again with the same result
+        :param events: pairs of data and method type
+        :param invalid: indexes of the events already known to be invalid
+        :return: unwritten batch of all the valid events, which shows the items after the writes,
+                 and indexes of all the invalid events.
+        """
+        batch, invalid = WriteBatch(settings.PK), list(invalid)
+        for index, (data, method) in enumerate(events):
+            if index in invalid:
+                continue
+            single = WriteBatch(settings.PK)
+            db.retry_throttled(cls.add_to_batch, single, data, method)
+            try:
+                db.retry_throttled(single.flush)
+            except ClientError as error:
+                if not db.is_invalid(error):
+                    raise
+                logger.error(f"The data of '{method}' message isn't valid, skipping it")
+                invalid.append(index)
+            else:
+                db.retry_throttled(cls.add_to_batch, batch, data, method)
+        return batch, sorted(invalid)
+
+    @staticmethod
+    def read_old_items(batch: WriteBatch) -> dict[tuple[str, tuple], dict]:
+        """
+        Read the pages and posts the batch is going to write, a single BatchGetItem is made per 100 items
+        :param batch: batch of writes
+        :return: existing items by their tables and keys.
+        """
+        old_items = {}
+        for table_name in TOTALS:
+            keys = batch.keys(table_name)
+            for item in db.batch_get(table_name, keys) if keys else ():
+                old_items[(table_name, tuple(*item[settings.PK].items()))] = item
+        return old_items
+
+    @staticmethod
+    def collect_changes(batch: WriteBatch, aggregator: StatsAggregator, old_items: dict[tuple[str, tuple], dict]
+                        ) -> None:
+        """
+        Pass the states of the pages and posts before and after the batch to the aggregator
+        :param batch: batch of writes, the changes must be collected before it's flushed
+        :param aggregator: aggregator of the owners' totals
+        :param old_items: items before the write by their tables and keys
+        :return: None
+        """
+        for table_name in TOTALS:
+            for key in batch.keys(table_name):
+                old_item = old_items.get((table_name, tuple(*key[settings.PK].items())))
+                aggregator.change(table_name, old_item, batch.apply(table_name, key, old_item))
+
+    @classmethod
+    def add_to_batch(cls, batch: WriteBatch, data: dict, method: str) -> None:
+        """
+        Add writes of the message to the batch in the same way 'save_data' writes them
+        :param batch: batch of writes
+        :param data: data to be saved
+        :param method: method type (e.g. 'update_posts')
+        :return: None
+        """
+        target_pk = int(data.get('id'))
+        routing_key = method.split('_')[-1]  # ['update', 'posts'] -> 'posts'
+        match method:
+            case PostMethods.CREATE.value | PageMethods.CREATE.value | UserMethods.CREATE.value:
+                processed_data = cls.preprocessing_data(data)
+                users_table = settings.USERS_NAME_TABLE
+                owner_id = data.get('owner_id') if method == PageMethods.CREATE.value else None
+                if owner_id is not None and not cls.is_known_user(owner_id):
+                    batch.put(users_table, cls.get_owner_item(processed_data))
+                batch.put(routing_key, processed_data)
+            case (
+                PostMethods.UPDATE.value |
+                PostMethods.LIKE.value |
+                PageMethods.UPDATE.value |
+                UserMethods.UPDATE.value
+            ):
+                batch.update(routing_key, target_pk, cls.preprocessing_data(data, update=True))
+            case PostMethods.DELETE.value | PageMethods.DELETE.value | UserMethods.DELETE.value:
+                batch.delete(routing_key, target_pk)
+                if method == UserMethods.DELETE.value:
+                    # Forget the user right away, so creates later in the batch write the user again.
+                    known_users.delete(target_pk)
+
+    @staticmethod
+    def is_known_user(user_id: int) -> bool:
+        """
+        Check whether the user exists, the users the consumer has written or found before aren't looked up in the db
+        :param user_id: id of the user
+        :return: True if the user is in the db.
+        """
+        if known_users.get(user_id):
+            return True
+        if db.get_item(settings.USERS_NAME_TABLE, settings.PK, user_id):
+            known_users.set(user_id, True)
+            return True
+        return False
+
+    @staticmethod
+    def remember_users(data: dict, method: str) -> None:
+        """
+        Update the known users after the message was written to the db
+        :param data: written data
+        :param method: method type (e.g. 'create_pages')
+        :return: None
+        """
+        match method:
+            case PageMethods.CREATE.value if data.get('owner_id') is not None:
+                known_users.set(data['owner_id'], True)
+            case UserMethods.CREATE.value:
+                known_users.set(int(data['id']), True)
+            case UserMethods.DELETE.value:
+                known_users.delete(int(data['id']))
+
     @classmethod
     def stop_consumer(cls):
         """
@@ -104,6 +367,20 @@ class PikaClient(metaclass=ClientMeta):
             return {field: {'Value': value} for (field, value) in processed_data.items()}
         return processed_data
 
+    @staticmethod
+    def get_owner_item(processed_data: dict) -> dict:
+        """
+        Take the owner's fields of the page and represent them as the user's item
+        :param processed_data: page's data in the db format
+        :return: user's item (e.g. 'owner_id' -> 'id').
+        """
+        user_data = {}
+        for field, value in processed_data.items():
+            if 'owner' in field:
+                valid_field = ''.join(field.split('owner_'))
+                user_data.update({valid_field: value})
+        return user_data
+
     @staticmethod
     def save_data(data: dict, method: str) -> int:
         """
@@ -118,7 +395,12 @@ class PikaClient(metaclass=ClientMeta):
         response = None
         target_pk = int(data.get('id'))  # Convert to state the primary key's type
         routing_key = method.split('_')[-1]  # ['update', 'posts'] -> 'posts'
+        aggregated = routing_key in TOTALS  # Pages and posts are counted in their owners' totals
         try:
+            # Created items are new, only the updated and deleted ones are read to figure out the difference
+            changed = aggregated and not method.startswith('create')
+            old_item = db.get_item(table_name=routing_key, pk=pk, target_pk=target_pk) if changed else None
+            new_item = None
             match method:
                 case (
                     PostMethods.CREATE.value |
@@ -127,17 +409,12 @@ class PikaClient(metaclass=ClientMeta):
                 ):
                     processed_data = process_function(data)
                     users_table = settings.USERS_NAME_TABLE
-                    user = db.get_item(table_name=users_table, pk=pk, target_pk=data.get('owner_id'))
-                    if user:
-                        pass
-                    else:
-                        user_data = {}
-                        for field, value in processed_data.items():
-                            if 'owner' in field:
-                                valid_field = ''.join(field.split('owner_'))
-                                user_data.update({valid_field: value})
+                    owner_id = data.get('owner_id') if method == PageMethods.CREATE.value else None
+                    if owner_id is not None and not PikaClient.is_known_user(owner_id):
+                        user_data = PikaClient.get_owner_item(processed_data)
                         db.put_item(table_name=users_table, item=user_data)
                     response = db.put_item(table_name=routing_key, item=processed_data)
+                    new_item = processed_data
                 case (
                     PostMethods.UPDATE.value |
                     PostMethods.LIKE.value |
@@ -151,12 +428,19 @@ class PikaClient(metaclass=ClientMeta):
                         target_pk=target_pk,
                         fields_to_update=processed_data
                     )
-                case PostMethods.DELETE.value | PageMethods.DELETE.value:
+                    values = {field: update['Value'] for field, update in processed_data.items()}
+                    new_item = {**(old_item or {pk: {'N': str(target_pk)}}), **values}
+                case PostMethods.DELETE.value | PageMethods.DELETE.value | UserMethods.DELETE.value:
                     response = db.delete_item(
                         table_name=routing_key,
                         pk=pk,
                         target_pk=target_pk
                     )
+            PikaClient.remember_users(data, method)
+            if aggregated:
+                aggregator = StatsAggregator()
+                aggregator.change(routing_key, old_item, new_item)
+                aggregator.flush()
             return response
         except ClientError:
             logger.error("Operation has failed, the given data wasn't valid")
@@ -1,16 +1,18 @@
 import sys
 sys.path.append('/app/microservice/core/')
 
-from rabbitmq.consumer import PikaClient
-from core.settings import settings
-
+import logging
+import signal
 
-pika_worker = PikaClient
+from core.rabbitmq.supervisor import start_pool
+from core.settings import settings
 
 
 def start_workers():
-    while True:
-        pika_worker.start_consumer(settings.ROUTING_KEY)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(processName)s %(levelname)s %(message)s')
+    # Leave the supervisor's loop on 'docker stop', so the workers are terminated along with it.
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    start_pool(settings.CONSUMER_WORKERS)
 
 
 start_workers()
@@ -0,0 +1,206 @@
+import logging
+import multiprocessing
+from dataclasses import dataclass, field
+from multiprocessing.sharedctypes import Synchronized
+from time import monotonic, sleep
+from typing import Callable
+
+import pika
+from pika.exceptions import AMQPError
+
+from core.rabbitmq.codec import SHARD_HEADER
+from core.rabbitmq.consumer import PikaClient, connection_parameters
+from core.settings import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+def shard_queue(index: int) -> str:
+    return f'{settings.ROUTING_KEY}.shard.{index}'
+
+
+def declare_shards(workers: int) -> None:
+    """
+    Declare the consistent-hash exchange bound to the stats exchange and a queue for every worker.
+    The exchange hashes the shard header of the message, so all the events of an object go to the same queue
+    and are consumed by a single worker in the order they were published. Messages the workers reject
+    as invalid are dead-lettered to a queue of their own
+    :param workers: number of workers, every one of them gets an equal share of the objects
+    :return: None
+    """
+    connection = pika.BlockingConnection(connection_parameters())
+    try:
+        channel = connection.channel()
+        channel.exchange_declare(exchange=settings.CONSUMER_DEAD_LETTER_EXCHANGE, exchange_type='fanout',
+                                 durable=True)
+        channel.queue_declare(settings.CONSUMER_DEAD_LETTER_EXCHANGE, durable=True)
+        channel.queue_bind(settings.CONSUMER_DEAD_LETTER_EXCHANGE, settings.CONSUMER_DEAD_LETTER_EXCHANGE)
+        channel.exchange_declare(
+            exchange=settings.CONSUMER_SHARDS_EXCHANGE,
+            exchange_type='x-consistent-hash',
+            durable=True,
+            arguments={'hash-header': SHARD_HEADER}
+        )
+        channel.exchange_bind(
+            destination=settings.CONSUMER_SHARDS_EXCHANGE,
+            source=settings.RABBITMQ_EXCHANGE,
+            routing_key=settings.ROUTING_KEY
+        )
+        for index in range(workers):
+            channel.queue_declare(shard_queue(index), durable=True,
+                                  arguments={'x-dead-letter-exchange': settings.CONSUMER_DEAD_LETTER_EXCHANGE})
+            # The routing key of a consistent-hash binding is the weight of the queue.
+            channel.queue_bind(shard_queue(index), settings.CONSUMER_SHARDS_EXCHANGE, routing_key='1')
+    finally:
+        connection.close()
+
+
+def consume(queue: str, processed: Synchronized) -> None:
+    """
+    Consume the queue in the worker process until the connection is lost, then the process exits
+    and the supervisor starts a new one with a new connection
+    :param queue: queue name to connect
+    :param processed: shared counter of the processed messages
+    :return: None
+    """
+    PikaClient._processed = processed
+    PikaClient.start_consumer(queue)
+
+
+@dataclass
+class Worker:
+    """
+    Worker process and its state kept by the supervisor, the counter outlives restarts of the process.
+    """
+    index: int
+    queue: str
+    processed: Synchronized = field(default_factory=lambda: multiprocessing.Value('Q', 0))
+    process: multiprocessing.Process | None = None
+    started_at: float = 0.0
+    restarts: int = 0
+    failures: int = 0  # Crashes in a row, each of them happened soon after the start
+    restart_at: float | None = None
+    reported: int = 0
+
+
+class WorkerPool:
+    """
+    Supervisor of the consumer processes. Every worker consumes its own queue, the crashed ones are restarted
+    with exponential backoff, and throughput of every worker is logged every 'report_interval' seconds.
+    """
+    def __init__(self,
+                 workers: int,
+                 target: Callable[[str, Synchronized], None] = consume,
+                 queues: list[str] | None = None,
+                 report_interval: float = settings.CONSUMER_REPORT_INTERVAL,
+                 backoff: float = settings.CONSUMER_RESTART_BACKOFF,
+                 max_backoff: float = settings.CONSUMER_RESTART_MAX_BACKOFF):
+        queues = queues or [shard_queue(index) for index in range(workers)]
+        self.workers = [Worker(index, queue) for index, queue in enumerate(queues)]
+        self.target = target
+        self.report_interval = report_interval
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._reported_at = monotonic()
+
+    def run(self) -> None:
+        """
+        Start the workers and supervise them until the supervisor is stopped
+        """
+        self.start()
+        try:
+            while True:
+                sleep(min(self.backoff, self.report_interval, 1) or 0.1)
+                self.restart_crashed()
+                if monotonic() - self._reported_at >= self.report_interval:
+                    self.report()
+        finally:
+            self.stop()
+
+    def start(self) -> None:
+        for worker in self.workers:
+            self.start_worker(worker)
+
+    def start_worker(self, worker: Worker) -> None:
+        worker.process = multiprocessing.Process(
+            target=self.target,
+            args=(worker.queue, worker.processed),
+            name=f'consumer-{worker.index}',
+            daemon=True
+        )
+        worker.process.start()
+        worker.started_at, worker.restart_at = monotonic(), None
+
+    def restart_crashed(self) -> list[Worker]:
+        """
+        Start new processes instead of the exited ones once their backoff is over.
+        A worker which has run longer than the max backoff is restarted right away
+        :return: restarted workers.
+        """
+        restarted = []
+        for worker in self.workers:
+            if worker.process is None or worker.process.is_alive():
+                continue
+
+            now = monotonic()
+            if worker.restart_at is None:
+                uptime = now - worker.started_at
+                worker.failures = worker.failures + 1 if uptime < self.max_backoff else 0
+                delay = min(self.backoff * 2 ** (worker.failures - 1), self.max_backoff) if worker.failures else 0
+                worker.restart_at = now + delay
+                logger.warning(f'Worker {worker.index} (pid {worker.process.pid}) has exited '
+                               f'with code {worker.process.exitcode}, restarting in {delay:.1f}s')
+            if now >= worker.restart_at:
+                worker.process.join()
+                worker.restarts += 1
+                self.start_worker(worker)
+                restarted.append(worker)
+        return restarted
+
+    def report(self) -> dict[int, float]:
+        """
+        Log the number of messages every worker has processed per second since the previous report
+        :return: throughput of every worker by its index.
+        """
+        now = monotonic()
+        elapsed = max(now - self._reported_at, 1e-9)
+        throughput = {}
+        for worker in self.workers:
+            processed = worker.processed.value
+            throughput[worker.index] = (processed - worker.reported) / elapsed
+            worker.reported = processed
+            logger.info(f'Worker {worker.index} ({worker.queue}, pid {worker.process and worker.process.pid}): '
+                        f'{throughput[worker.index]:.1f} msg/s, {processed} processed, {worker.restarts} restart(s)')
+        logger.info(f'All workers: {sum(throughput.values()):.1f} msg/s')
+        self._reported_at = now
+        return throughput
+
+    def stop(self) -> None:
+        for worker in self.workers:
+            if worker.process is not None and worker.process.is_alive():
+                worker.process.terminate()
+        for worker in self.workers:
+            if worker.process is not None:
+                worker.process.join()
+
+
+def start_pool(workers: int) -> None:
+    """
+    Declare the shards and supervise the workers consuming them. With a single worker
+    the unsharded queue is consumed, so the consistent-hash exchange plugin isn't required
+    :param workers: number of worker processes
+    :return: None
+    """
+    if workers > 1:
+        while True:
+            try:
+                declare_shards(workers)
+                break
+            except AMQPError as error:
+                logger.warning(f"The shards can't be declared ({error!r}), retrying")
+                sleep(settings.CONSUMER_RESTART_BACKOFF)
+        pool = WorkerPool(workers)
+    else:
+        pool = WorkerPool(1, queues=[settings.ROUTING_KEY])
+    pool.run()
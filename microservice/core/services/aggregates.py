@@ -0,0 +1,193 @@
+import sys
+
+sys.path.append('/app/microservice/')
+
+import logging
+from collections import Counter
+from time import time
+
+from core.aws.dynamodb_client import DynamoDBClient
+from core.settings import settings
+
+
+logger = logging.getLogger(__name__)
+db = DynamoDBClient
+
+# Totals every item adds to its owner: a field of the item or 1 if the field is None.
+TOTALS = {
+    settings.PAGES_NAME_TABLE: (('total_pages', None), ('total_followers', 'followers')),
+    settings.POSTS_NAME_TABLE: (('total_posts', None), ('total_likes', 'liked_by')),
+}
+TOTAL_FIELDS = ('total_pages', 'total_posts', 'total_likes', 'total_followers')
+VERSION_FIELD = 'version'  # Bumped on every change of the user's pages and posts, so cached stats can be checked
+UPDATED_FIELD = 'updated_at'  # Time of the last change in milliseconds since the epoch
+
+
+def number(item: dict, field: str) -> int:
+    """
+    Return the numeric field of the item in the db format, missing and null fields are zero
+    """
+    return int((item.get(field) or {}).get('N', 0))
+
+
+def owner_of(page: dict) -> int | None:
+    return number(page, 'owner_id') if 'N' in (page.get('owner_id') or {}) else None
+
+
+def contribution(table_name: str, item: dict) -> Counter:
+    """
+    Figure out the totals the item adds to its owner
+    :param table_name: table of the item
+    :param item: page or post in the db format
+    :return: totals by their names.
+    """
+    return Counter({total: 1 if field is None else number(item, field) for total, field in TOTALS[table_name]})
+
+
+def now() -> int:
+    return int(time() * 1000)
+
+
+def get_totals(user_id: int) -> dict[str, int] | None:
+    """
+    Fetch the totals of the user maintained by the consumer along with their version and time of the last change
+    :param user_id: id of the user
+    :return: totals, version and time by their names or None if there is no aggregate of the user.
+    """
+    item = db.get_item(settings.STATS_NAME_TABLE, settings.PK, user_id)
+    return {field: number(item, field) for field in (*TOTAL_FIELDS, VERSION_FIELD, UPDATED_FIELD)} if item else None
+
+
+class StatsAggregator:
+    """
+    Collect changes of pages and posts and add the difference they make to their owners' totals
+    by a single atomic update per owner. The difference is between the item's contributions before
+    and after the write, so snapshots carrying absolute numbers (e.g. 'followers') are counted once.
+    Innotter deletes posts along with their page without any events, so deleting of a page subtracts
+    its posts as they are after the write. A post whose page isn't written yet is counted to the owner
+    the post event carries, the posts of unknown pages without the owner are skipped.
+    A flush which failed on the way may be called again, it adds only the differences which weren't added yet.
+    """
+    def __init__(self):
+        self._changes: list[tuple[str, dict | None, dict | None]] = []
+        self._differences: dict[int, Counter] = {}
+        self._pending: list[int] = []  # Owners which differences are yet to be added
+
+    def change(self, table_name: str, old_item: dict | None, new_item: dict | None) -> None:
+        """
+        Add the write of the item
+        :param table_name: table of the item
+        :param old_item: the item before the write, None if it didn't exist
+        :param new_item: the item after the write, None if it was deleted
+        :return: None.
+        """
+        if table_name in TOTALS and (old_item or new_item):
+            self._changes.append((table_name, old_item, new_item))
+
+    def flush(self) -> dict[int, Counter]:
+        """
+        Add the collected differences to the owners' totals, must be called after the items are written
+        :return: differences added to the totals by owners.
+        """
+        if not self._pending:
+            self._differences = self.differences()
+            self._pending = list(self._differences)
+            self._changes.clear()
+
+        while self._pending:
+            owner_id = self._pending[0]
+            increments = {total: value for total, value in self._differences[owner_id].items() if value}
+            # Any change of the owner's items invalidates the cached stats, even if the totals stay the same.
+            db.add_to_item(settings.STATS_NAME_TABLE, settings.PK, owner_id, {**increments, VERSION_FIELD: 1},
+                           {UPDATED_FIELD: now()})
+            self._pending.pop(0)
+        return self._differences
+
+    def differences(self) -> dict[int, Counter]:
+        """
+        Figure out the differences the collected changes make to their owners' totals
+        :return: differences by owners.
+        """
+        pages_owners, deleted_pages = {}, set()
+        for table_name, old_item, new_item in self._changes:
+            if table_name == settings.PAGES_NAME_TABLE:
+                page = new_item or old_item
+                pages_owners[number(page, settings.PK)] = owner_of(page)
+                if new_item is None:
+                    deleted_pages.add(number(old_item, settings.PK))
+                else:
+                    deleted_pages.discard(number(new_item, settings.PK))
+
+        posts_pages = {number(item, 'page') for table_name, old_item, new_item in self._changes
+                       if table_name == settings.POSTS_NAME_TABLE and (item := new_item or old_item).get('page')}
+        unknown_pages = [{settings.PK: {'N': str(page_id)}} for page_id in posts_pages - pages_owners.keys()]
+        for page in db.batch_get(settings.PAGES_NAME_TABLE, unknown_pages) if unknown_pages else ():
+            pages_owners[number(page, settings.PK)] = owner_of(page)
+
+        differences: dict[int, Counter] = {}
+        for table_name, old_item, new_item in self._changes:
+            item = new_item or old_item
+            if table_name == settings.PAGES_NAME_TABLE:
+                owner_id = pages_owners.get(number(item, settings.PK))
+            elif (owner_id := pages_owners.get(number(item, 'page'))) is None:
+                owner_id = owner_of(item)
+            if owner_id is None:
+                logger.warning(f"The owner of {table_name} {number(item, settings.PK)} is unknown, it isn't counted")
+                continue
+            difference = differences.setdefault(owner_id, Counter())
+            difference.update(contribution(table_name, new_item) if new_item else {})
+            difference.subtract(contribution(table_name, old_item) if old_item else {})
+
+        for page_id in deleted_pages:
+            if (owner_id := pages_owners.get(page_id)) is None:
+                continue
+            for post in db.query(settings.POSTS_NAME_TABLE, 'page', page_id, index_name=settings.POSTS_PAGE_INDEX):
+                differences.setdefault(owner_id, Counter()).subtract(contribution(settings.POSTS_NAME_TABLE, post))
+
+        return differences
+
+
+def rebuild_aggregates() -> int:
+    """
+    Compute the totals of every user from the pages and posts and overwrite the aggregates with them,
+    repairing any drift (e.g. after messages were delivered twice). Updates made by the consumer
+    while the tables are being read may be lost, so it's better run while the workers are stopped
+    :return: number of written aggregates.
+    """
+    totals: dict[int, Counter] = {}
+    pages_owners = {}
+    for page in db.scan(settings.PAGES_NAME_TABLE):
+        if (owner_id := owner_of(page)) is None:
+            continue
+        pages_owners[number(page, settings.PK)] = owner_id
+        totals.setdefault(owner_id, Counter()).update(contribution(settings.PAGES_NAME_TABLE, page))
+
+    for post in db.scan(settings.POSTS_NAME_TABLE):
+        owner_id = pages_owners.get(number(post, 'page'))
+        if owner_id is not None:
+            totals[owner_id].update(contribution(settings.POSTS_NAME_TABLE, post))
+
+    # Users who have no pages anymore get zero totals, the versions go on, so the cached stats become stale.
+    versions = {}
+    for aggregate in db.scan(settings.STATS_NAME_TABLE):
+        versions[number(aggregate, settings.PK)] = number(aggregate, VERSION_FIELD)
+        totals.setdefault(number(aggregate, settings.PK), Counter())
+
+    updated_at = now()
+    requests = [
+        {'PutRequest': {'Item': {
+            settings.PK: {'N': str(owner_id)},
+            **{total: {'N': str(owner_totals[total])} for total in TOTAL_FIELDS},
+            VERSION_FIELD: {'N': str(versions.get(owner_id, 0) + 1)},
+            UPDATED_FIELD: {'N': str(updated_at)},
+        }}}
+        for owner_id, owner_totals in totals.items()
+    ]
+    if requests:
+        db.batch_write({settings.STATS_NAME_TABLE: requests})
+    return len(requests)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    logger.info(f'{rebuild_aggregates()} aggregate(s) have been rebuilt')
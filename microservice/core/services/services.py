@@ -1,34 +1,110 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Iterator
+
 from core.aws.dynamodb_client import DynamoDBClient
+from core.settings import settings
 
 
 db = DynamoDBClient
 hashable = int | float | str | tuple | None
+# boto3 is blocking, so the async endpoints read the db in these threads, which bound the number of concurrent reads.
+executor = ThreadPoolExecutor(max_workers=settings.DYNAMODB_READ_WORKERS, thread_name_prefix='dynamodb')
+
+
+async def run_in_executor(function: Callable, *args, **kwargs) -> Any:
+    """
+    Call the blocking function in the db reading threads without blocking the event loop
+    :param function: function to be called
+    :return: result of the function.
+    """
+    return await asyncio.get_running_loop().run_in_executor(executor, partial(function, *args, **kwargs))
+
+
+def object_fields(item: dict) -> tuple[str, dict]:
+    """
+    Convert the item from the db format to the fields of the response
+    :param item: item in the db format
+    :return: id of the object and the rest of its fields.
+    """
+    fields = {k: str(*v.values()) for k, v in item.items()}
+    return fields.pop('id'), fields
+
+
+def iter_objects(table_name: str,
+                 pks: list[int],
+                 target_pk: str,
+                 index_name: str,
+                 projection: list[str] | None = None) -> Iterator[tuple[str, dict]]:
+    """
+    Query the secondary index of the given table for every primary key and yield the objects one by one
+    as the pages of the query are read
+    :param table_name: table to be queried
+    :param pks: list of primary keys which will be compared with
+    :param target_pk: partition key of the index
+    :param index_name: secondary index which partition key is 'target_pk'
+    :param projection: fields to be read, must include 'id', all of them are read by default
+    :return: iterator over ids of the objects and their fields.
+    """
+    for pk in pks:
+        for item in db.query(table_name, target_pk, pk, index_name=index_name, projection=projection):
+            yield object_fields(item)
 
 
-def get_objects(table_name: str, pks: list[int], target_pk: str) -> dict:
+def get_objects(table_name: str,
+                pks: list[int],
+                target_pk: str,
+                index_name: str,
+                projection: list[str] | None = None) -> dict:
     """
-    Scan the given table and extract all the object's fields from it
-    :param table_name: table to be scanned
+    Query the secondary index of the given table for every primary key and extract all the object's fields
+    :param table_name: table to be queried
     :param pks: list of primary keys which will be compared with
            (e.g. user has several pages which have several posts)
-    :param target_pk: primary key to be scanned with
+    :param target_pk: partition key of the index
+    :param index_name: secondary index which partition key is 'target_pk'
+    :param projection: fields to be read, must include 'id', all of them are read by default
+    :return: dict with the appropriate objects.
+    """
+    return dict(iter_objects(table_name, pks, target_pk, index_name, projection))
+
+
+async def get_objects_concurrently(table_name: str,
+                                   pks: list[int],
+                                   target_pk: str,
+                                   index_name: str,
+                                   projection: list[str] | None = None) -> dict:
+    """
+    Do the same as 'get_objects', but query the index for all the primary keys at the same time
+    :param table_name: table to be queried
+    :param pks: list of primary keys which will be compared with
+    :param target_pk: partition key of the index
+    :param index_name: secondary index which partition key is 'target_pk'
+    :param projection: fields to be read, must include 'id', all of them are read by default
     :return: dict with the appropriate objects.
     """
     data = {}
-    target_table = db.scan(table_name)
-    for page in target_table:
-        if int(*page[target_pk].values()) in pks:
-            object_fields = {}
-            for k, v in page.items():
-                object_fields.update(
-                    {k: str(*v.values())}
-                )
-            page_id = object_fields.pop('id')
-            data.update({page_id: object_fields})
-            
+    for objects in await asyncio.gather(*(run_in_executor(get_objects, table_name, [pk], target_pk, index_name,
+                                                          projection)
+                                          for pk in pks)):
+        data.update(objects)
     return data
 
 
+def project_objects(objects: dict[str, dict], fields: list[str] | None) -> dict[str, dict]:
+    """
+    Leave only the given fields of every object
+    :param objects: objects by their ids
+    :param fields: fields to be left, all of them are left if it's None
+    :return: dict with the projected objects.
+    """
+    if fields is None:
+        return objects
+    return {object_id: {field: value for field, value in object_fields.items() if field in fields}
+            for object_id, object_fields in objects.items()}
+
+
 def total_objects_count(objects_list: dict[hashable, [hashable, int]], pk: hashable) -> int:
     """
     Figure out sum of field in nested dict
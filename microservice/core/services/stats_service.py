@@ -1,29 +1,213 @@
-from typing import Type
+import json
+from typing import Iterator
 
-from api.schemas.stats_schema import Stats
-from core.services.services import get_objects, total_objects_count
+from api.schemas.stats_schema import PlatformStats, Stats, StatsSummary
+from core.aws.dynamodb_client import DynamoDBClient
+from core.cache.stats_cache import get_stats_cache
+from core.services.aggregates import TOTAL_FIELDS, UPDATED_FIELD, get_totals, now, number, owner_of
+from core.services.services import (
+    get_objects,
+    get_objects_concurrently,
+    iter_objects,
+    project_objects,
+    run_in_executor,
+    total_objects_count
+)
 from core.settings import settings
 
 
 class StatisticsService:
-    _page_sort_key = 'owner_id'  # Objects in the db is sorted by this value
-    _post_filter_key = 'page'  # Local posts' sort key to determine a post's ownership
+    _page_sort_key = 'owner_id'  # Pages are queried by this value through the index
+    _post_filter_key = 'page'  # Posts' index key to determine a post's ownership
+    _page_index = settings.PAGES_OWNER_INDEX
+    _post_index = settings.POSTS_PAGE_INDEX
     _likes_pk = 'liked_by'
     _followers_pk = 'followers'
+    _cache = get_stats_cache()
 
     @classmethod
-    def processing_stats(cls, user_id: int) -> Type[Stats]:
-        pages = get_objects(settings.PAGES_NAME_TABLE, [user_id], cls._page_sort_key)
+    async def processing_stats_async(cls, user_id: int, fields: list[str] | None = None) -> Stats:
+        """
+        Build the stats of the user or take them from the cache if the user's items haven't changed since.
+        The event loop isn't blocked, the posts of all the user's pages are queried at the same time
+        :param user_id: id of the user
+        :param fields: fields of pages and posts to be read, all of them are read by default
+        :return: the stats.
+        """
+        totals = await run_in_executor(get_totals, user_id)
+        version = cls.cache_version(totals)
+        if version and (cached := await run_in_executor(cls._cache.get, user_id, version)):
+            return Stats(**cls.project_stats(cached, fields))
+
+        page_projection, post_projection = cls.projections(fields, totals)
+        pages = await run_in_executor(
+            get_objects, settings.PAGES_NAME_TABLE, [user_id], cls._page_sort_key, cls._page_index, page_projection
+        )
         pages_id = [int(page) for page in pages]
-        posts = get_objects(settings.POSTS_NAME_TABLE, pages_id, cls._post_filter_key)
-        total_posts, total_pages = len(posts), len(pages)
-        total_likes = total_objects_count(posts, cls._likes_pk)
-        total_followers = total_objects_count(pages, cls._followers_pk)
-
-        Stats.pages = pages
-        Stats.posts = posts
-        Stats.total_pages = total_pages
-        Stats.total_posts = total_posts
-        Stats.total_likes = total_likes
-        Stats.total_followers = total_followers
-        return Stats
+        posts = await get_objects_concurrently(settings.POSTS_NAME_TABLE, pages_id, cls._post_filter_key,
+                                               cls._post_index, post_projection)
+        stats_fields = cls.collect_stats(totals, pages, posts)
+        # Only complete stats are cached, projected ones are cut out of them.
+        if version and fields is None and cls.settled(totals):
+            await run_in_executor(cls._cache.set, user_id, version, stats_fields)
+        return Stats(**cls.project_stats(stats_fields, fields))
+
+    @classmethod
+    def processing_summary(cls, user_id: int) -> StatsSummary:
+        """
+        Build only the totals of the user. They're taken from the aggregate, a user without an aggregate
+        has them counted from the pages and posts reading only the fields they're counted from
+        :param user_id: id of the user
+        :return: the totals.
+        """
+        totals = get_totals(user_id)
+        if not totals:
+            page_projection, post_projection = cls.projections([], totals)
+            pages = get_objects(settings.PAGES_NAME_TABLE, [user_id], cls._page_sort_key, cls._page_index,
+                                page_projection)
+            posts = get_objects(settings.POSTS_NAME_TABLE, [int(page) for page in pages], cls._post_filter_key,
+                                cls._post_index, post_projection)
+            totals = cls.collect_stats(totals, pages, posts)
+        return StatsSummary(**{field: totals[field] for field in TOTAL_FIELDS})
+
+    @classmethod
+    def stream_stats(cls, user_id: int, fields: list[str] | None = None) -> Iterator[str]:
+        """
+        Build the stats of the user as NDJSON lines: the totals, then a line per page and per post
+        as the queries read them, so neither the pages nor the posts are kept in memory.
+        The totals of a user without an aggregate are counted on the way and sent last
+        :param user_id: id of the user
+        :param fields: fields of pages and posts to be read, all of them are read by default
+        :return: iterator over the lines.
+        """
+        totals = get_totals(user_id)
+        if totals:
+            yield cls.ndjson_line('totals', {field: totals[field] for field in TOTAL_FIELDS})
+
+        page_projection, post_projection = cls.projections(fields, totals)
+        counted = dict.fromkeys(TOTAL_FIELDS, 0)
+        pages_id = []
+        for page_id, page in iter_objects(settings.PAGES_NAME_TABLE, [user_id], cls._page_sort_key,
+                                          cls._page_index, page_projection):
+            pages_id.append(int(page_id))
+            counted['total_pages'] += 1
+            counted['total_followers'] += int(page.get(cls._followers_pk) or 0)
+            page, = project_objects({page_id: page}, fields).values()
+            yield cls.ndjson_line('page', {'id': page_id, **page})
+
+        for post_id, post in iter_objects(settings.POSTS_NAME_TABLE, pages_id, cls._post_filter_key,
+                                          cls._post_index, post_projection):
+            counted['total_posts'] += 1
+            counted['total_likes'] += int(post.get(cls._likes_pk) or 0)
+            post, = project_objects({post_id: post}, fields).values()
+            yield cls.ndjson_line('post', {'id': post_id, **post})
+
+        if not totals:
+            yield cls.ndjson_line('totals', counted)
+
+    @staticmethod
+    def ndjson_line(kind: str, fields: dict) -> str:
+        return json.dumps({kind: fields}) + '\n'
+
+    @classmethod
+    def processing_platform_stats(cls) -> PlatformStats:
+        """
+        Build the stats of the whole platform by parallel scans of pages and posts. Only the attributes
+        the totals are computed from are read, and the items are counted page by page as the segments read them
+        :return: the stats.
+        """
+        pages_id, owners = set(), set()
+        total_followers = 0
+        for items in DynamoDBClient.parallel_scan(settings.PAGES_NAME_TABLE,
+                                                  projection=[settings.PK, cls._page_sort_key, cls._followers_pk]):
+            for page in items:
+                pages_id.add(number(page, settings.PK))
+                if (owner_id := owner_of(page)) is not None:
+                    owners.add(owner_id)
+                total_followers += number(page, cls._followers_pk)
+
+        # Posts of the pages deleted along with them are skipped, the same way the users' stats do.
+        total_posts = total_likes = 0
+        for items in DynamoDBClient.parallel_scan(settings.POSTS_NAME_TABLE,
+                                                  projection=[cls._post_filter_key, cls._likes_pk]):
+            for post in items:
+                if number(post, cls._post_filter_key) in pages_id:
+                    total_posts += 1
+                    total_likes += number(post, cls._likes_pk)
+
+        return PlatformStats(
+            total_users=len(owners),
+            total_pages=len(pages_id),
+            total_posts=total_posts,
+            total_likes=total_likes,
+            total_followers=total_followers,
+        )
+
+    @classmethod
+    def projections(cls, fields: list[str] | None, totals: dict | None) -> tuple[list | None, list | None]:
+        """
+        Figure out the attributes of pages and posts to be read: the requested fields along with 'id'
+        and, if the user has no aggregate, the fields the totals are counted from
+        :param fields: requested fields, None stands for all of them
+        :param totals: totals maintained by the consumer, None if the user has no aggregate yet
+        :return: projections of pages and posts, None stands for all the attributes.
+        """
+        if fields is None:
+            return None, None
+        counted = not totals
+        page_projection = ['id', *fields, *([cls._followers_pk] if counted else [])]
+        post_projection = ['id', *fields, *([cls._likes_pk] if counted else [])]
+        return list(dict.fromkeys(page_projection)), list(dict.fromkeys(post_projection))
+
+    @staticmethod
+    def project_stats(stats_fields: dict, fields: list[str] | None) -> dict:
+        """
+        Leave only the requested fields of the stats' pages and posts
+        """
+        return {
+            **stats_fields,
+            'pages': project_objects(stats_fields['pages'], fields),
+            'posts': project_objects(stats_fields['posts'], fields),
+        }
+
+    @classmethod
+    def cache_version(cls, totals: dict | None) -> int | None:
+        """
+        Return the version the user's stats are cached by, users without an aggregate aren't cached
+        """
+        return totals['version'] if cls._cache and totals else None
+
+    @staticmethod
+    def settled(totals: dict) -> bool:
+        """
+        Check whether the indexes the pages and posts are read through have caught up with the last change
+        of the user's items. Stats read right after the change may miss it, they'd be cached under its version
+        """
+        return now() - totals[UPDATED_FIELD] >= settings.STATS_CACHE_MIN_AGE * 1000
+
+    @classmethod
+    def collect_stats(cls, totals: dict | None, pages: dict, posts: dict) -> dict:
+        """
+        Put the stats' fields together
+        :param totals: totals maintained by the consumer, None if the user has no aggregate yet
+        :param pages: the user's pages
+        :param posts: posts of the user's pages
+        :return: values of the stats' fields.
+        """
+        # The totals are computed here only if the user has no aggregate yet.
+        if totals:
+            total_pages, total_posts = totals['total_pages'], totals['total_posts']
+            total_likes, total_followers = totals['total_likes'], totals['total_followers']
+        else:
+            total_posts, total_pages = len(posts), len(pages)
+            total_likes = total_objects_count(posts, cls._likes_pk)
+            total_followers = total_objects_count(pages, cls._followers_pk)
+
+        return {
+            'pages': pages,
+            'posts': posts,
+            'total_pages': total_pages,
+            'total_posts': total_posts,
+            'total_likes': total_likes,
+            'total_followers': total_followers,
+        }
@@ -5,6 +5,11 @@ config = dotenv.dotenv_values(".env")
 # JWT
 JWT_SECRET_KEY = config["JWT_SECRET_KEY"]
 JWT_SIGNING_METHOD = config["JWT_SIGNING_METHOD"]
+USERS_CACHE_SIZE, USERS_CACHE_TTL = 10000, 60  # Cache of existing users, ttl in seconds
+# Cached stats responses: 'local' keeps them in the process, 'dynamodb' shares them between processes, None disables
+STATS_CACHE_BACKEND = 'local'
+STATS_CACHE_SIZE, STATS_CACHE_TTL = 1000, 300  # Bounds of the local cache, ttl of both backends in seconds
+STATS_CACHE_MIN_AGE = 1  # Seconds the indexes take to catch up with a change, fresher stats aren't cached
 
 # RabbitMQ 
 RABBITMQ_USERNAME = config["RABBITMQ_DEFAULT_USER"]
@@ -13,6 +18,17 @@ RABBITMQ_HOST = config["RABBITMQ_HOST"]
 RABBITMQ_PORT = config["RABBITMQ_PORT"]
 RABBITMQ_HEARTBEAT, RABBITMQ_TIMEOUT = 600, 300
 RABBITMQ_EXCHANGE = config["RABBITMQ_EXCHANGE_NAME"]
+# Messages written to the db at once and seconds to wait for a batch to be filled, batch size 1 disables batching
+CONSUMER_BATCH_SIZE, CONSUMER_BATCH_TIMEOUT = 100, 0.2
+# Users the consumer has already written or found in the db, ttl in seconds bounds how long a user deleted
+# through another worker may be taken as existing
+KNOWN_USERS_CACHE_SIZE, KNOWN_USERS_CACHE_TTL = 100000, 300
+# Consumer processes, each of them consumes its own shard of the stats, 1 consumes the 'ROUTING_KEY' queue unsharded
+CONSUMER_WORKERS = 4
+CONSUMER_SHARDS_EXCHANGE = 'stats.shards'  # Consistent-hash exchange, needs 'rabbitmq_consistent_hash_exchange'
+CONSUMER_DEAD_LETTER_EXCHANGE = 'stats.dead-letter'  # Messages rejected as invalid go to its queue of the same name
+CONSUMER_REPORT_INTERVAL = 10  # Seconds between throughput reports of the workers
+CONSUMER_RESTART_BACKOFF, CONSUMER_RESTART_MAX_BACKOFF = 1, 30  # Seconds to wait before restarting a crashed worker
 
 # AWS
 AWS_REGION_NAME = config["AWS_REGION_NAME"]
@@ -21,3 +37,15 @@ AWS_SECRET_ACCESS_KEY = config["AWS_SECRET_ACCESS_KEY"]
 PK = 'id'  # Primary key of the db's tables
 ROUTING_KEY = 'stats'
 USERS_NAME_TABLE, PAGES_NAME_TABLE, POSTS_NAME_TABLE = 'users', 'pages', 'posts'
+STATS_NAME_TABLE = 'stats'  # Totals of every user, maintained by the consumer
+STATS_CACHE_NAME_TABLE = 'stats_cache'  # Stats responses shared by the 'dynamodb' cache backend
+PAGES_OWNER_INDEX, POSTS_PAGE_INDEX = 'owner_id-index', 'page-index'  # Global secondary indexes
+DYNAMODB_BATCH_WRITE_SIZE = 25  # Max number of items BatchWriteItem accepts
+DYNAMODB_BATCH_WRITE_RETRIES, DYNAMODB_BATCH_WRITE_BACKOFF = 5, 0.05  # Backoff in seconds
+DYNAMODB_BATCH_GET_SIZE = 100  # Max number of keys BatchGetItem accepts, retried as the writes are
+# Retries of the consumer's requests throttled by DynamoDB once the SDK has given up, the backoff is capped in seconds
+DYNAMODB_THROTTLING_RETRIES, DYNAMODB_THROTTLING_MAX_BACKOFF = 10, 2
+# Threads the async endpoints read the db in, they bound the number of concurrent reads of the process
+DYNAMODB_READ_WORKERS = 32
+AWS_MAX_POOL_CONNECTIONS = 32  # Connections of the client, should be not less than the read workers
+DYNAMODB_SCAN_SEGMENTS = 8  # Segments of parallel scans, each one is read by its own thread
@@ -1,11 +1,15 @@
 import sys
 sys.path.append('/app/microservice/')
 
+from datetime import datetime, timezone, timedelta
+
+import jwt
 from fastapi import status
 from fastapi.testclient import TestClient
 
 from core.auth.auth_service import AuthService
 from core.main import app
+from core.settings import settings
 
 
 client = TestClient(app)
@@ -31,3 +35,15 @@ class TestAuthService:
         headers = {'Authorization': f'Bearer {create_valid_token}'}
         response = client.get(self._url, headers=headers)
         assert response.status_code == status.HTTP_200_OK
+
+    def test_users_existence_cache(self, mocker):
+        get_item = mocker.patch("core.aws.dynamodb_client.DynamoDBClient.get_item", return_value={'id': {'N': '2'}})
+        AuthService._users_cache.clear()
+        payload = {"user_id": 2,
+                   "iss": "innotter",
+                   "exp": datetime.now(tz=timezone.utc) + timedelta(minutes=5)}
+        token = jwt.encode(payload, settings.JWT_SECRET_KEY, algorithm=settings.JWT_SIGNING_METHOD)
+
+        assert AuthService.get_token_claims(token)['user_id'] == 2
+        assert AuthService.verify_user_token(token)
+        get_item.assert_called_once()
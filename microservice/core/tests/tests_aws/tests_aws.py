@@ -1,13 +1,21 @@
 import sys
 sys.path.append('/app/microservice/')
 
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
 
 from fastapi.testclient import TestClient
 import moto
+from botocore.exceptions import ClientError
 
 from core.aws.dynamodb_client import DynamoDBClient
+from core.aws.memory_client import InMemoryDynamoDB, use_in_memory_dynamodb
+from core.aws.tables import create_tables
+from core.cache.stats_cache import DynamoDBStatsCache, LocalStatsCache
 from core.main import app
+from core.services.stats_service import StatisticsService
 from core.settings import settings
 
 
@@ -43,6 +51,161 @@ class TestDynamoDBClient:
         response = db.put_item(self._table_name, self._item)
         assert response == 200
 
+    @moto.mock_dynamodb
+    def test_query_index(self):
+        create_tables()
+        for page_id in range(1, 6):
+            db.put_item(settings.PAGES_NAME_TABLE, {'id': {'N': str(page_id)}, 'owner_id': {'N': str(page_id % 2)}})
+
+        pages = db.query(settings.PAGES_NAME_TABLE, 'owner_id', 1, index_name=settings.PAGES_OWNER_INDEX, page_size=1)
+        assert sorted(int(page['id']['N']) for page in pages) == [1, 3, 5]
+
+    @moto.mock_dynamodb
+    def test_parallel_scan(self, mocker):
+        create_tables()
+        scan = db.client.scan
+
+        def segmented_scan(Segment, TotalSegments, **params):
+            # Moto ignores segments and returns the whole table to each of them.
+            response = scan(**params)
+            response['Items'] = [item for item in response['Items']
+                                 if int(item.get('id', {'N': '0'})['N']) % TotalSegments == Segment]
+            return response
+
+        mocker.patch.object(db.client, 'scan', side_effect=segmented_scan)
+        for page_id in range(1, 21):
+            db.put_item(settings.PAGES_NAME_TABLE, {
+                'id': {'N': str(page_id)}, 'owner_id': {'N': str(page_id % 3)}, 'followers': {'N': '2'}
+            })
+        db.put_item(settings.PAGES_NAME_TABLE, {'id': {'N': '21'}})
+        for post_id in range(1, 11):
+            # The posts of the page 30 don't count since the page was deleted.
+            db.put_item(settings.POSTS_NAME_TABLE, {
+                'id': {'N': str(post_id)}, 'page': {'N': str(post_id if post_id < 10 else 30)}, 'liked_by': {'N': '3'}
+            })
+
+        pages = [page for items in db.parallel_scan(settings.PAGES_NAME_TABLE, segments=4, projection=['id'])
+                 for page in items]
+        assert sorted(int(page['id']['N']) for page in pages) == list(range(1, 22))
+        assert all(page.keys() == {'id'} for page in pages)
+
+        stats = StatisticsService.processing_platform_stats()
+        assert stats.dict() == {
+            'total_users': 3, 'total_pages': 21, 'total_posts': 9, 'total_likes': 27, 'total_followers': 40
+        }
+
+    @moto.mock_dynamodb
+    def test_projected_stats(self):
+        create_tables()
+        db.put_item(settings.PAGES_NAME_TABLE, {
+            'id': {'N': '1'}, 'owner_id': {'N': '1'}, 'name': {'S': 'Test page'}, 'followers': {'N': '4'}
+        })
+        db.put_item(settings.POSTS_NAME_TABLE, {
+            'id': {'N': '2'}, 'page': {'N': '1'}, 'name': {'S': 'Test post'}, 'liked_by': {'N': '3'}
+        })
+
+        stats = asyncio.run(StatisticsService.processing_stats_async(1, ['name']))
+        assert stats.pages == {'1': {'name': 'Test page'}} and stats.posts == {'2': {'name': 'Test post'}}
+        assert (stats.total_followers, stats.total_likes) == (4, 3)
+
+        summary = StatisticsService.processing_summary(1)
+        assert summary.dict() == {'total_posts': 1, 'total_pages': 1, 'total_likes': 3, 'total_followers': 4}
+
+        pages = db.query(settings.PAGES_NAME_TABLE, 'owner_id', 1, index_name=settings.PAGES_OWNER_INDEX,
+                         projection=['name'])
+        assert list(pages) == [{'name': {'S': 'Test page'}}]
+
+    @moto.mock_dynamodb
+    def test_concurrent_stats(self, mocker):
+        create_tables()
+        mocker.patch.object(StatisticsService, '_cache', LocalStatsCache())
+        users = range(1, 31)
+        for user_id in users:
+            pages = range(user_id * 10, user_id * 10 + user_id % 3 + 1)
+            for page_id in pages:
+                db.put_item(settings.PAGES_NAME_TABLE, {
+                    'id': {'N': str(page_id)}, 'owner_id': {'N': str(user_id)}, 'followers': {'N': str(user_id)}
+                })
+                db.put_item(settings.POSTS_NAME_TABLE, {
+                    'id': {'N': str(page_id * 100)}, 'page': {'N': str(page_id)}, 'liked_by': {'N': '1'}
+                })
+            if user_id % 2:
+                # Users with the aggregate have their stats cached, the rest are always counted.
+                db.put_item(settings.STATS_NAME_TABLE, {
+                    'id': {'N': str(user_id)}, 'version': {'N': '1'}, 'total_pages': {'N': str(len(pages))},
+                    'total_posts': {'N': str(len(pages))}, 'total_likes': {'N': str(len(pages))},
+                    'total_followers': {'N': str(len(pages) * user_id)},
+                })
+
+        def check(user_id, stats):
+            pages = {str(page_id) for page_id in range(user_id * 10, user_id * 10 + user_id % 3 + 1)}
+            assert set(stats.pages) == pages
+            assert {post['page'] for post in stats.posts.values()} == pages
+            assert all(page['owner_id'] == str(user_id) for page in stats.pages.values())
+            assert stats.total_followers == len(pages) * user_id and stats.total_posts == len(pages)
+
+        async def gather_stats():
+            return await asyncio.gather(*(StatisticsService.processing_stats_async(user_id)
+                                          for user_id in (*users, *users)))
+
+        def run_stats(user_id):
+            return asyncio.run(StatisticsService.processing_stats_async(user_id))
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            threaded = list(executor.map(run_stats, (*users, *users)))
+        for user_id, stats in zip((*users, *users), (*threaded, *asyncio.run(gather_stats()))):
+            check(user_id, stats)
+        with pytest.raises(TypeError):
+            threaded[0].total_pages = 0
+
+    @moto.mock_dynamodb
+    def test_dynamodb_stats_cache(self):
+        create_tables()
+        cache, response = DynamoDBStatsCache(), {'pages': {'1': {'name': 'Test page'}}, 'total_pages': 1}
+
+        cache.set(1, 2, response)
+        assert cache.get(1, 2) == response
+        assert cache.get(1, 3) is None and cache.get(2, 2) is None
+
+        expired = DynamoDBStatsCache(ttl=-1)
+        expired.set(1, 2, response)
+        assert expired.get(1, 2) is None
+        description = db.client.describe_time_to_live(TableName=settings.STATS_CACHE_NAME_TABLE)
+        assert description['TimeToLiveDescription']['AttributeName'] == 'expires_at'
+
+    def test_in_memory_dynamodb(self, mocker):
+        mocker.patch.object(settings, 'DYNAMODB_BATCH_WRITE_BACKOFF', 0)
+        with use_in_memory_dynamodb(InMemoryDynamoDB(page_size=2)) as client:
+            create_tables()
+            db.batch_write({settings.PAGES_NAME_TABLE: [
+                {'PutRequest': {'Item': {'id': {'N': str(page_id)}, 'owner_id': {'N': str(page_id % 2)}}}}
+                for page_id in range(1, 31)
+            ]})
+            db.update_item(settings.PAGES_NAME_TABLE, 'id', 1, {'name': {'Value': {'S': 'Test page'}}})
+            db.add_to_item(settings.PAGES_NAME_TABLE, 'id', 1, {'followers': 2})
+            db.add_to_item(settings.PAGES_NAME_TABLE, 'id', 1, {'followers': -1})
+            db.delete_item(settings.PAGES_NAME_TABLE, 'id', 2)
+            assert db.get_item(settings.PAGES_NAME_TABLE, 'id', 1) == {
+                'id': {'N': '1'}, 'owner_id': {'N': '1'}, 'name': {'S': 'Test page'}, 'followers': {'N': '1'}
+            }
+
+            assert len(db.scan(settings.PAGES_NAME_TABLE)) == 29
+            scanned = [page['id']['N'] for items in db.parallel_scan(settings.PAGES_NAME_TABLE, segments=3,
+                                                                     projection=['id'])
+                       for page in items]
+            assert sorted(scanned, key=int) == [str(page_id) for page_id in range(1, 31) if page_id != 2]
+            pages = db.query(settings.PAGES_NAME_TABLE, 'owner_id', 1, index_name=settings.PAGES_OWNER_INDEX,
+                             projection=['id'])
+            assert sorted(int(page['id']['N']) for page in pages) == list(range(1, 31, 2))
+
+            # Throttled batch items are retried, throttled single-item requests fail.
+            client.throttle_rate = 0.3
+            keys = [{'id': {'N': str(page_id)}} for page_id in range(1, 31)]
+            assert len(db.batch_get(settings.PAGES_NAME_TABLE, keys)) == 29
+            client.throttle_rate = 1
+            with pytest.raises(ClientError):
+                db.get_item(settings.PAGES_NAME_TABLE, 'id', 1)
+
     @pytest.mark.parametrize(
         'target_pk, expected',
         [
@@ -1,7 +1,33 @@
 import sys
 sys.path.append('/app/microservice/')
 
-from core.rabbitmq.consumer import PikaClient
+import json
+from unittest.mock import ANY
+
+import moto
+from botocore.exceptions import ClientError
+from pika.spec import BasicProperties
+
+from core.aws import tables
+from core.aws.memory_client import InMemoryDynamoDB, use_in_memory_dynamodb
+from core.exceptions.base_exceptions import UnprocessedItemsError
+from core.rabbitmq.benchmark import run_benchmark, synthetic_events
+from core.rabbitmq.codec import BINARY_FORMAT, FORMAT_HEADER, encode
+from core.rabbitmq.consumer import PikaClient, db, known_users
+from core.rabbitmq.supervisor import WorkerPool
+from core.services.aggregates import get_totals, rebuild_aggregates
+from core.settings import settings
+
+
+def create_tables() -> None:
+    known_users.clear()
+    tables.create_tables()
+
+
+def crashing_worker(queue: str, processed) -> None:
+    with processed.get_lock():
+        processed.value += 5
+    sys.exit(1)
 
 
 class TestConsumer:
@@ -20,3 +46,205 @@ class TestConsumer:
         }
         response = PikaClient.preprocessing_data(self._item, update=True)
         assert response == expected_item
+
+    def test_decode_body(self):
+        data = {'id': 1, 'liked_by': 10, 'owner_id': 7}
+        binary = BasicProperties(content_type='like_posts', headers={FORMAT_HEADER: BINARY_FORMAT})
+        assert PikaClient.decode_body(binary, encode('like_posts', data)) == data
+        released = {'id': 1, 'liked_by': 10}
+        assert PikaClient.decode_body(binary, encode('like_posts', released, version=1)) == released
+
+        legacy = BasicProperties(content_type='like_posts')
+        assert PikaClient.decode_body(legacy, json.dumps(data).encode()) == data
+
+    @moto.mock_dynamodb
+    def test_save_batch(self):
+        create_tables()
+        page = {'id': 1, 'owner_id': 7, 'owner_username': 'admin', 'name': 'Test page', 'followers': 0}
+        events = [
+            (page, 'create_pages'),
+            ({'id': 1, 'followers': 1}, 'update_pages'),
+            ({'id': 1, 'followers': 2}, 'update_pages'),
+            *(({'id': post_id, 'page': 1, 'title': 'Test post', 'liked_by': 0}, 'create_posts')
+              for post_id in range(1, 31)),
+            ({'id': 1, 'liked_by': 5}, 'like_posts'),
+            ({'id': 2}, 'delete_posts'),
+        ]
+
+        assert PikaClient.save_batch(events) == []
+        assert db.get_item(settings.PAGES_NAME_TABLE, 'id', 1)['followers'] == {'N': '2'}
+        assert db.get_item(settings.USERS_NAME_TABLE, 'id', 7)['username'] == {'S': 'admin'}
+        assert db.get_item(settings.POSTS_NAME_TABLE, 'id', 1)['liked_by'] == {'N': '5'}
+        assert not db.get_item(settings.POSTS_NAME_TABLE, 'id', 2)
+        assert len(db.scan(settings.POSTS_NAME_TABLE)) == 29
+
+    @moto.mock_dynamodb
+    def test_known_users(self, mocker):
+        create_tables()
+        get_item = mocker.spy(db, 'get_item')
+        page = {'id': 1, 'owner_id': 7, 'owner_username': 'admin', 'name': 'Test page', 'followers': 0}
+
+        def users_reads() -> int:
+            return sum(settings.USERS_NAME_TABLE in (*call.args[:1], call.kwargs.get('table_name'))
+                       for call in get_item.call_args_list)
+
+        PikaClient.save_data(page, 'create_pages')
+        PikaClient.save_data({**page, 'id': 2}, 'create_pages')
+        PikaClient.save_data({'id': 1, 'page': 1, 'title': 'Test post', 'liked_by': 0}, 'create_posts')
+        assert users_reads() == 1
+        assert db.get_item(settings.POSTS_NAME_TABLE, 'id', 1)
+
+        PikaClient.save_data({'id': 7}, 'delete_users')
+        PikaClient.save_batch([({**page, 'id': 3}, 'create_pages')])
+        assert users_reads() == 2
+        assert db.get_item(settings.USERS_NAME_TABLE, 'id', 7)['username'] == {'S': 'admin'}
+
+    @moto.mock_dynamodb
+    def test_stats_aggregates(self):
+        create_tables()
+        page = {'id': 1, 'owner_id': 7, 'owner_username': 'admin', 'name': 'Test page', 'followers': 3}
+        PikaClient.save_batch([
+            (page, 'create_pages'),
+            ({'id': 1, 'page': 1, 'title': 'Test post', 'liked_by': 2}, 'create_posts'),
+            ({'id': 2, 'page': 1, 'title': 'Test post', 'liked_by': 0}, 'create_posts'),
+            ({**page, 'followers': 5}, 'update_pages'),
+            ({'id': 1, 'liked_by': 4}, 'like_posts'),
+        ])
+        for _ in range(2):  # Snapshots delivered twice are counted once
+            PikaClient.save_data({'id': 2, 'liked_by': 1}, 'like_posts')
+        PikaClient.save_data({'id': 1}, 'delete_posts')
+        totals = {'total_pages': 1, 'total_posts': 1, 'total_likes': 1, 'total_followers': 5}
+        assert get_totals(7) == {**totals, 'version': 4, 'updated_at': ANY}
+
+        db.add_to_item(settings.STATS_NAME_TABLE, 'id', 7, {'total_likes': 10})
+        assert rebuild_aggregates() == 1
+        assert get_totals(7) == {**totals, 'version': 5, 'updated_at': ANY}
+
+        PikaClient.save_batch([({'id': 3, 'page': 1, 'title': 'Test post', 'liked_by': 6}, 'create_posts'),
+                               ({'id': 1}, 'delete_pages')])
+        assert get_totals(7) == {**dict.fromkeys(totals, 0), 'version': 6, 'updated_at': ANY}
+
+    @moto.mock_dynamodb
+    def test_save_data_reads_only_changed_items(self, mocker):
+        create_tables()
+        get_item = mocker.spy(db, 'get_item')
+        PikaClient.save_data({'id': 1, 'page': 1, 'title': 'Test post', 'liked_by': 0}, 'create_posts')
+        assert get_item.call_count == 0
+
+        PikaClient.save_data({'id': 1, 'liked_by': 2}, 'like_posts')
+        PikaClient.save_data({'id': 1}, 'delete_posts')
+        assert get_item.call_count == 2
+
+    @moto.mock_dynamodb
+    def test_post_before_page(self):
+        create_tables()
+        PikaClient.save_data({'id': 1, 'page': 1, 'title': 'Test post', 'liked_by': 3, 'owner_id': 7}, 'create_posts')
+        PikaClient.save_batch([
+            ({'id': 1, 'owner_id': 7, 'owner_username': 'admin', 'name': 'Test page', 'followers': 0}, 'create_pages'),
+            ({'id': 2, 'page': 1, 'title': 'Test post', 'liked_by': 0}, 'create_posts'),
+        ])
+        totals = {'total_pages': 1, 'total_posts': 2, 'total_likes': 3, 'total_followers': 0}
+        assert get_totals(7) == {**totals, 'version': 2, 'updated_at': ANY}
+
+        rebuild_aggregates()
+        assert get_totals(7) == {**totals, 'version': 3, 'updated_at': ANY}
+
+    def test_batch_write_retries_unprocessed_items(self, mocker):
+        request = {'PutRequest': {'Item': {'id': {'N': '1'}}}}
+        batch_write_item = mocker.patch.object(db, 'batch_write_item', side_effect=[{'pages': [request]}, {}])
+        mocker.patch(f'{db.__module__}.sleep')
+
+        db.batch_write({'pages': [request]})
+        assert batch_write_item.call_count == 2
+
+    def test_process_batch_acks_after_write(self, mocker):
+        channel = mocker.patch.object(PikaClient, '_channel')
+        save_batch = mocker.patch.object(PikaClient, 'save_batch', return_value=[])
+        messages = [(mocker.Mock(delivery_tag=tag), BasicProperties(content_type='delete_posts'), b'{"id": 1}')
+                    for tag in (1, 2, 3)]
+
+        PikaClient.process_batch(messages)
+        channel.basic_ack.assert_called_once_with(delivery_tag=3, multiple=True)
+
+        save_batch.side_effect = UnprocessedItemsError()
+        PikaClient.process_batch(messages)
+        channel.basic_nack.assert_called_once_with(delivery_tag=3, multiple=True, requeue=True)
+
+    def test_process_batch_rejects_invalid_messages(self, mocker):
+        channel = mocker.patch.object(PikaClient, '_channel')
+        save_batch = mocker.patch.object(PikaClient, 'save_batch', return_value=[2])
+        bodies = (b'{"id": 1}', b'not json', b'{"id": 2}', b'{"id": 3}', b'{"id": 4}')
+        messages = [(mocker.Mock(delivery_tag=tag), BasicProperties(content_type='delete_posts'), body)
+                    for tag, body in enumerate(bodies, start=1)]
+
+        PikaClient.process_batch(messages)
+        assert len(save_batch.call_args.args[0]) == 4
+        assert channel.basic_reject.call_args_list == [mocker.call(delivery_tag=2, requeue=False),
+                                                       mocker.call(delivery_tag=4, requeue=False)]
+        channel.basic_ack.assert_called_once_with(delivery_tag=5, multiple=True)
+
+    @moto.mock_dynamodb
+    def test_save_batch_skips_invalid_events(self):
+        create_tables()
+        page = {'id': 1, 'owner_id': 7, 'owner_username': 'admin', 'name': 'Test page', 'followers': 3}
+        invalid = PikaClient.save_batch([
+            (page, 'create_pages'),
+            ({'page': 1, 'title': 'Test post'}, 'create_posts'),  # Malformed, it has no id
+            ({**page, 'id': 2, 'owner_id': 'admin'}, 'create_pages'),  # Rejected by the db, the index key isn't a number
+            ({'id': 3, 'page': 1, 'title': 'Test post', 'liked_by': 2}, 'create_posts'),
+        ])
+        assert invalid == [1, 2]
+        assert not db.get_item(settings.PAGES_NAME_TABLE, 'id', 2)
+        assert get_totals(7) == {'total_pages': 1, 'total_posts': 1, 'total_likes': 2, 'total_followers': 3,
+                                 'version': 1, 'updated_at': ANY}
+
+    def test_save_batch_under_throttling(self, mocker):
+        mocker.patch.object(settings, 'DYNAMODB_BATCH_WRITE_BACKOFF', 0)
+        known_users.clear()
+        events = list(synthetic_events(users=5, pages=2, posts=3, updates=3, seed=2))
+        with use_in_memory_dynamodb(InMemoryDynamoDB(throttle_rate=0.05, seed=2)) as client:
+            tables.create_tables()
+            for start in range(0, len(events), 20):
+                while True:  # The batch is redelivered until it's written, as the broker does after a nack
+                    try:
+                        assert PikaClient.save_batch(events[start:start + 20]) == []
+                        break
+                    except (ClientError, UnprocessedItemsError):
+                        pass
+
+            client.throttle_rate = 0
+            totals = [get_totals(user_id) for user_id in range(1, 6)]
+            rebuild_aggregates()
+            rebuilt = [get_totals(user_id) for user_id in range(1, 6)]
+        known_users.clear()
+        assert [{**user_totals, 'version': 0, 'updated_at': 0} for user_totals in totals] == \
+               [{**user_totals, 'version': 0, 'updated_at': 0} for user_totals in rebuilt]
+
+    def test_worker_pool_restarts_crashed_workers(self):
+        pool = WorkerPool(2, target=crashing_worker, backoff=0, max_backoff=0)
+        pool.start()
+        for _ in range(2):
+            for worker in pool.workers:
+                worker.process.join()
+            assert len(pool.restart_crashed()) == 2
+        for worker in pool.workers:
+            worker.process.join()
+
+        throughput = pool.report()
+        assert [worker.processed.value for worker in pool.workers] == [15, 15]
+        assert [worker.restarts for worker in pool.workers] == [2, 2]
+        assert all(rate > 0 for rate in throughput.values())
+
+    def test_consumer_benchmark(self):
+        client = InMemoryDynamoDB(seed=1)
+        report = run_benchmark(synthetic_events(users=5, pages=2, posts=3, updates=2, seed=1), client)
+        assert report['messages'] == 5 * 2 + 5 * 2 * 3 + 2 * (5 * 2 + 5 * 2 * 3) and report['failed'] == 0
+        assert report['p50_ms'] <= report['p90_ms'] <= report['p99_ms'] <= report['max_ms']
+
+        # The totals maintained message by message are the same as the ones computed from scratch.
+        with use_in_memory_dynamodb(client):
+            totals = [get_totals(user_id) for user_id in range(1, 6)]
+            rebuild_aggregates()
+            rebuilt = [get_totals(user_id) for user_id in range(1, 6)]
+        assert [{**user_totals, 'version': 0, 'updated_at': 0} for user_totals in totals] == \
+               [{**user_totals, 'version': 0, 'updated_at': 0} for user_totals in rebuilt]
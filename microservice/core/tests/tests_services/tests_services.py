@@ -2,8 +2,13 @@ import sys
 
 sys.path.append('/app/microservice/')
 
+import asyncio
+import json
+from threading import Barrier
+
+from core.cache.stats_cache import LocalStatsCache
 from core.settings import settings
-from core.services import services, stats_service
+from core.services import aggregates, services, stats_service
 
 
 class TestServices:
@@ -31,9 +36,11 @@ class TestServices:
              'owner_id': {'N': '1'}}
         ]
 
-        mocker.patch("core.aws.dynamodb_client.DynamoDBClient.scan", return_value=mocked_response)
+        query = mocker.patch("core.aws.dynamodb_client.DynamoDBClient.query", return_value=iter(mocked_response))
 
-        response = services.get_objects(settings.PAGES_NAME_TABLE, [user_id], 'owner_id')
+        response = services.get_objects(settings.PAGES_NAME_TABLE, [user_id], 'owner_id', settings.PAGES_OWNER_INDEX)
+        query.assert_called_once_with(settings.PAGES_NAME_TABLE, 'owner_id', user_id,
+                                      index_name=settings.PAGES_OWNER_INDEX, projection=None)
         item = [v for k, v in response.items()]
         assert item[0]['owner_id'] == str(user_id)
 
@@ -44,13 +51,79 @@ class TestServices:
     def test_stats_service(self, mocker):
         mocked_response_total_count = 10
 
-        mocker.patch("core.services.stats_service.get_objects", return_value=self._objs_list)
+        mocker.patch("core.services.stats_service.get_totals", return_value=None)
+        get_objects = mocker.patch("core.services.stats_service.get_objects", return_value=self._objs_list)
+        mocker.patch("core.services.services.get_objects", get_objects)
         mocker.patch("core.services.stats_service.total_objects_count", return_value=mocked_response_total_count)
 
-        response = stats_service.StatisticsService.processing_stats(1)
+        response = asyncio.run(stats_service.StatisticsService.processing_stats_async(1))
         assert response.pages == self._objs_list
         assert response.posts == self._objs_list
         assert response.total_likes == mocked_response_total_count
         assert response.total_followers == mocked_response_total_count
         assert response.total_pages == len(self._objs_list)
         assert response.total_posts == len(self._objs_list)
+
+    def test_stats_cache(self, mocker):
+        totals = {'total_pages': 1, 'total_posts': 1, 'total_likes': 0, 'total_followers': 5, 'version': 3,
+                  'updated_at': 0}
+        get_totals = mocker.patch("core.services.stats_service.get_totals", return_value=totals)
+        get_objects = mocker.patch("core.services.stats_service.get_objects", return_value=self._objs_list)
+        mocker.patch("core.services.services.get_objects", get_objects)
+        mocker.patch.object(stats_service.StatisticsService, '_cache', LocalStatsCache())
+        processing_stats = stats_service.StatisticsService.processing_stats_async
+
+        for _ in range(2):
+            response = asyncio.run(processing_stats(1))
+            assert response.pages == self._objs_list and response.total_followers == 5
+        assert get_objects.call_count == 2
+
+        get_totals.return_value = {**totals, 'total_followers': 6, 'version': 4}
+        response = asyncio.run(processing_stats(1))
+        assert response.total_followers == 6
+        assert get_objects.call_count == 4
+
+        # Stats read right after the change may be behind the indexes, so they aren't cached
+        get_totals.return_value = {**totals, 'version': 5, 'updated_at': aggregates.now()}
+        for _ in range(2):
+            asyncio.run(processing_stats(1))
+        assert get_objects.call_count == 8
+
+    def test_stats_service_async(self, mocker):
+        pages = {str(page_id): {'followers': '1', 'owner_id': '1'} for page_id in range(1, 4)}
+        barrier = Barrier(len(pages), timeout=5)
+
+        def get_objects(table_name, pks, target_pk, index_name, projection=None):
+            if table_name == settings.PAGES_NAME_TABLE:
+                return pages
+            barrier.wait()  # Breaks unless the posts of all the pages are queried at the same time
+            return {str(pks[0] * 10): {'page': str(pks[0]), 'liked_by': '2'}}
+
+        mocker.patch("core.services.stats_service.get_totals", return_value=None)
+        mocker.patch("core.services.services.get_objects", side_effect=get_objects)
+        mocker.patch("core.services.stats_service.get_objects", side_effect=get_objects)
+
+        response = asyncio.run(stats_service.StatisticsService.processing_stats_async(1))
+        assert sorted(response.posts) == ['10', '20', '30']
+        assert (response.total_pages, response.total_likes, response.total_followers) == (3, 6, 3)
+
+    def test_stream_stats(self, mocker):
+        def query(table_name, key, value, index_name=None, projection=None):
+            if table_name == settings.PAGES_NAME_TABLE:
+                yield from ({'id': {'N': str(page_id)}, 'owner_id': {'N': '1'}, 'followers': {'N': '2'}}
+                            for page_id in (1, 2))
+            else:
+                yield {'id': {'N': str(value * 10)}, 'page': {'N': str(value)}, 'liked_by': {'N': '3'}}
+
+        mocker.patch("core.aws.dynamodb_client.DynamoDBClient.query", side_effect=query)
+        get_totals = mocker.patch("core.services.stats_service.get_totals", return_value=None)
+
+        lines = [json.loads(line) for line in stats_service.StatisticsService.stream_stats(1)]
+        assert [next(iter(line)) for line in lines] == ['page', 'page', 'post', 'post', 'totals']
+        assert lines[2]['post'] == {'id': '10', 'page': '1', 'liked_by': '3'}
+        totals = {'total_pages': 2, 'total_posts': 2, 'total_likes': 6, 'total_followers': 4}
+        assert lines[-1]['totals'] == totals
+
+        get_totals.return_value = {**totals, 'version': 1}
+        lines = [json.loads(line) for line in stats_service.StatisticsService.stream_stats(1)]
+        assert lines[0] == {'totals': totals} and len(lines) == 5
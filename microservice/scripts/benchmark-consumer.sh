@@ -0,0 +1,4 @@
+#!/bin/bash
+
+echo "Replaying the events through the consumer against the in-memory DynamoDB..."
+python3 /app/microservice/core/rabbitmq/benchmark.py "$@"
@@ -0,0 +1,4 @@
+#!/bin/bash
+
+echo "Creating the tables and their indexes..."
+python3 /app/microservice/core/aws/tables.py
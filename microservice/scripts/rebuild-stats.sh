@@ -0,0 +1,4 @@
+#!/bin/bash
+
+echo "Rebuilding the users' totals..."
+python3 /app/microservice/core/services/aggregates.py